@@ -0,0 +1,346 @@
+"""
+Benchmarks of the hot paths of the Tetris game.
+
+Runs without a display through the SDL dummy video driver, saves the
+results as JSON, and compares them against the results of a previous run.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame  # noqa: E402
+
+from src.bot import ExpectimaxBot, InputPilot  # noqa: E402
+from src.config import config  # noqa: E402
+from src.engine import (DOWN, LEFT, RIGHT, ROTATE_CCW, ROTATE_CW,  # noqa: E402
+                        Engine)
+from src.game import GAME_OVER, Game  # noqa: E402
+from src.playfield import ARRAY, SPRITES, Playfield  # noqa: E402
+from src.tetromino import Block, Piece, Tetromino  # noqa: E402
+from src.versus import Match  # noqa: E402
+
+# Fractions of the playfield height filled by the generated boards
+FILLS = (0.0, 0.25, 0.5, 0.75, 0.9)
+
+# Inputs held on each frame of the scripted whole-game benchmark
+SCRIPT = (
+    [LEFT] * 3 + [0] * 2 + [ROTATE_CW] + [0] + [RIGHT] * 20 + [0] +
+    [ROTATE_CCW] + [DOWN] * 30 + [0] * 4 + [RIGHT] * 2 + [DOWN] * 20
+)
+
+
+def fill_board(playfield, fill, rng):
+    """Lock random blocks into the bottom fill fraction of the playfield
+
+    Every row is left with at least one hole, so no row is cleared.
+    """
+    board = playfield.board
+    color = config["tetromino"][0]["color"]
+    for row in range(board.height - 1,
+                     board.height - 1 - int(board.height * fill), -1):
+        cols = rng.sample(range(board.width), board.width - rng.randint(1, 3))
+        playfield.lock_piece(Piece(
+            playfield, *(Block(playfield, col, row, color) for col in cols)
+        ))
+
+
+def almost_full_rows(playfield, rows, hole):
+    """Fill the given rows of the playfield except for the hole column"""
+    color = config["tetromino"][0]["color"]
+    for row in rows:
+        playfield.lock_piece(Piece(playfield, *(
+            Block(playfield, col, row, color)
+            for col in range(playfield.board.width) if col != hole
+        )))
+
+
+def measure(func, number, repeat):
+    """Get the best time in seconds of a single call of func"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_with_setup(setup, func, number, repeat):
+    """Get the best time in seconds of a single call of func
+
+    Every call of func is given the result of a fresh call of setup, which
+    is not timed.
+    """
+    best = None
+    for _ in range(repeat):
+        elapsed = 0.0
+        for _ in range(number):
+            arg = setup()
+            start = time.perf_counter()
+            func(arg)
+            elapsed += time.perf_counter() - start
+        elapsed /= number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_piece_ops(display, results, number, repeat):
+    """Benchmark Piece.move, Tetromino.rotate and Playfield.valid_space"""
+    for fill in FILLS:
+        playfield = Playfield(display)
+        fill_board(playfield, fill, random.Random(int(fill * 100)))
+        tetromino = Tetromino(playfield, 2)
+        suffix = f"fill={fill:.2f}"
+
+        def move():
+            tetromino.move(1, 0)
+            tetromino.move(-1, 0)
+
+        def rotate():
+            tetromino.rotate()
+            tetromino.rotate(counterclockwise=True)
+
+        results[f"Piece.move[{suffix}]"] = measure(move, number, repeat) / 2
+        results[f"Tetromino.rotate[{suffix}]"] =\
+            measure(rotate, number, repeat) / 2
+        results[f"Playfield.valid_space[{suffix}]"] = measure(
+            lambda: playfield.valid_space(tetromino), number, repeat
+        )
+
+
+def bench_lock(display, results, number, repeat):
+    """Benchmark Playfield.lock_piece, LockedBlocked.line_clear and
+    Game.lock_tetromino"""
+    for fill in FILLS:
+        suffix = f"fill={fill:.2f}"
+
+        def setup_playfield(clear):
+            playfield = Playfield(display)
+            fill_board(playfield, fill, random.Random(int(fill * 100)))
+            rows = ()
+            if clear:
+                top = playfield.board.height - int(playfield.board.height *
+                                                   fill)
+                rows = range(top - 4, top)
+                almost_full_rows(playfield, rows, 0)
+            piece = Piece(playfield, *(
+                Block(playfield, 0, row, (255, 255, 255))
+                for row in (rows or [0])
+            ))
+            return playfield, piece
+
+        results[f"Playfield.lock_piece[{suffix}]"] = measure_with_setup(
+            lambda: setup_playfield(False),
+            lambda arg: arg[0].lock_piece(arg[1]), number // 10, repeat
+        )
+
+        def line_clear_setup():
+            playfield, piece = setup_playfield(True)
+            cleared_rows = playfield.board.lock(piece.cells())
+            playfield.locked_blocks.add(piece)
+            return playfield, cleared_rows
+
+        results[f"LockedBlocked.line_clear[{suffix}]"] = measure_with_setup(
+            line_clear_setup,
+            lambda arg: arg[0].locked_blocks.line_clear(arg[1]),
+            number // 10, repeat
+        )
+
+        def setup_game():
+            game = Game(display, seed=0)
+            fill_board(game.playfield, fill, random.Random(int(fill * 100)))
+            top = game.engine.board.height - int(game.engine.board.height *
+                                                 fill)
+            almost_full_rows(game.playfield, range(top - 4, top), 0)
+
+            # Put a vertical I into the hole, so it clears four rows
+            (col, row), *_ = game.engine.board.piece_cells(0, 1, 0, 0)
+            game.engine.tetromino = game.engine.tetromino._replace(
+                id=0, orientation=1, col=-col, row=top - 4 - row
+            )
+            game.tetromino = Tetromino(game.playfield, 0)
+            game.engine.lock_tetromino()
+            return game
+
+        results[f"Game.lock_tetromino[{suffix}]"] = measure_with_setup(
+            setup_game, lambda game: game.lock_tetromino(*game.engine.locked),
+            number // 100, repeat
+        )
+
+
+def bench_draw(display, results, number, repeat):
+    """Benchmark Playfield.draw with every renderer"""
+    for fill in FILLS:
+        for renderer in (SPRITES, ARRAY):
+            playfield = Playfield(display, renderer=renderer)
+            fill_board(playfield, fill, random.Random(int(fill * 100)))
+            suffix = f"renderer={renderer},fill={fill:.2f}"
+            results[f"Playfield.draw[{suffix}]"] = measure(
+                playfield.draw, number // 10, repeat
+            )
+
+
+def bench_frames(display, results, frames):
+    """Benchmark whole frames of the game and of the engine alone"""
+    game = Game(display, seed=0)
+    script = [SCRIPT[i % len(SCRIPT)] for i in range(frames)]
+
+    def post_inputs(prev, inputs):
+        for key, action in game.key_inputs.items():
+            if (prev ^ inputs) & action:
+                event_type = pygame.KEYDOWN if inputs & action else\
+                    pygame.KEYUP
+                pygame.event.post(pygame.event.Event(event_type, key=key))
+
+    prev = 0
+    start = time.perf_counter()
+    for inputs in script:
+        post_inputs(prev, inputs)
+        prev = inputs
+        game.handle_events()
+        game.update()
+        if game.engine.game_over:
+            game.reinit()
+        pygame.display.update(game.changed_areas.flush())
+    results["Game.frame"] = (time.perf_counter() - start) / frames
+
+    engine = Engine(0)
+    start = time.perf_counter()
+    for inputs in script:
+        if engine.step(inputs).game_over:
+            engine = Engine(0)
+    results["Engine.step"] = (time.perf_counter() - start) / frames
+
+
+def bench_match(results, frames):
+    """Benchmark whole frames of split-screen matches
+
+    Every player holds the scripted inputs, and the display is updated once
+    per frame like in Match.loop.
+    """
+    for players in (4, 8):
+        display = pygame.display.set_mode(Match.window_size(players))
+        match = Match(display, players, seed=0)
+
+        start = time.perf_counter()
+        for frame in range(frames):
+            for game in match.games:
+                game.engine.hold(SCRIPT[frame % len(SCRIPT)])
+            match.tick()
+            if match.state == GAME_OVER:
+                match.restart()
+            match.update_display()
+        results[f"Match.frame[players={players}]"] =\
+            (time.perf_counter() - start) / frames
+
+
+def bench_bot(results, frames):
+    """Benchmark the search of ExpectimaxBot at level 29 gravity
+
+    The search always takes up its time budget, so what is measured is the
+    time per node it searched.
+    """
+    bot = ExpectimaxBot()
+    pilot = InputPilot(bot)
+    engine = Engine(0)
+    engine.drop_delay["delay"] = config["game"]["drop_delay"][-1]
+    for _ in range(frames):
+        engine.hold(pilot.inputs(engine))
+        engine.tick()
+        if engine.game_over:
+            engine = Engine(0)
+            engine.drop_delay["delay"] = config["game"]["drop_delay"][-1]
+    results["ExpectimaxBot.node"] = bot.total_elapsed / (bot.total_nodes or 1)
+    print(bot.report())
+
+
+def run(number, repeat, frames):
+    """Run every benchmark and get the seconds per call of each"""
+    pygame.init()
+    display = pygame.display.set_mode(config["display"]["size"])
+
+    results = {}
+    bench_piece_ops(display, results, number, repeat)
+    bench_lock(display, results, number, repeat)
+    bench_draw(display, results, number, repeat)
+    bench_frames(display, results, frames)
+    bench_match(results, frames)
+    bench_bot(results, frames)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the change of every benchmark against a baseline
+
+    Returns the names of the benchmarks that are slower than the baseline by
+    more than the threshold.
+    """
+    regressions = []
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<45} {seconds * 1e6:12.2f} us        (new)")
+            continue
+
+        change = seconds / base - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<45} {seconds * 1e6:12.2f} us {change:+8.1%}{flag}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--output", metavar="FILE",
+                        help="save the results as JSON to FILE")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare against the JSON results in FILE")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown that counts as a regression "
+                        "(default: 0.1 for 10%%)")
+    parser.add_argument("--quick", action="store_true",
+                        help="run fewer iterations")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.quick:
+        results = run(number=200, repeat=3, frames=1000)
+    else:
+        results = run(number=2000, repeat=5, frames=10000)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "pygame": pygame.version.ver,
+                "machine": platform.machine(),
+                "seconds_per_call": results
+            }, file, indent=2)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["seconds_per_call"]
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than "
+              f"{args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,95 @@
 A simple Tetris game written in Python.
 """
 
+import argparse
+import time
+
 import pygame
 
+from src import replay
+from src.bot import ExpectimaxBot, InputPilot
 from src.config import config
 from src.game import Game
+from src.profiler import FrameProfiler
+from src.versus import Match
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--seed", type=int,
+                        help="seed of the sequence of tetrominoes")
+    parser.add_argument("--record", metavar="FILE",
+                        help="save the replay of the game to FILE")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="play the replay in FILE back without a display")
+    parser.add_argument("--seek", type=int, metavar="FRAME",
+                        help="with --replay, only play the replay up to FRAME "
+                        "from its nearest keyframe")
+    parser.add_argument("--profile", action="store_true",
+                        help="time the phases of every frame and show them")
+    parser.add_argument("--players", type=int, metavar="N",
+                        help="play a split-screen match of N players")
+    parser.add_argument("--bot", action="store_true",
+                        help="let a bot play the game and report its search")
+    return parser.parse_args()
+
+
+def play_replay(path, seek=None):
+    # Play the replay back as fast as possible
+    start = time.perf_counter()
+    if seek is None:
+        engine = replay.play(replay.load(path))
+    else:
+        with replay.ReplayFile(path) as replay_file:
+            engine = replay_file.seek(seek)
+    elapsed = time.perf_counter() - start
+
+    print(f"frames: {engine.frame} ({engine.frame / elapsed:.0f} per second)")
+    print(f"level: {engine.level}, score: {engine.score}, "
+          f"lines: {engine.line_cleared}, game over: {engine.game_over}")
 
 
 def main():
+    args = parse_args()
+    if args.replay:
+        play_replay(args.replay, args.seek)
+        return
+
     # Initialize pygame
     pygame.init()
 
     # Initialize display
-    display = pygame.display.set_mode(config["display"]["size"])
+    if args.players:
+        display = pygame.display.set_mode(Match.window_size(args.players))
+    else:
+        display = pygame.display.set_mode(config["display"]["size"])
     pygame.display.set_caption(config["display"]["caption"])
     display.fill(config["display"]["bgd_color"])
 
+    if args.players:
+        Match(display, args.players, seed=args.seed).loop()
+        return
+
+    profiler = None
+    if args.profile:
+        profiler = FrameProfiler(config["game"]["fps"] or
+                                 config["game"]["tick_rate"])
+
+    bot = pilot = None
+    if args.bot:
+        bot = ExpectimaxBot()
+        pilot = InputPilot(bot)
+
     # Start the game
-    game = Game(display)
+    game = Game(display, seed=args.seed, record=args.record,
+                profiler=profiler, pilot=pilot)
     game.loop()
 
+    if profiler:
+        print(profiler.report())
+    if bot:
+        print(bot.report())
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,43 @@
+"""
+Server that streams Tetris sessions to spectators and network players.
+"""
+
+import argparse
+import asyncio
+
+from src import replay
+from src.server import Server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", help="address to accept clients on")
+    parser.add_argument("--port", type=int, help="port to accept clients on")
+    parser.add_argument("--bots", type=int, default=0, metavar="N",
+                        help="keep N sessions played by bots")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="keep sessions that play the replay in FILE "
+                        "back")
+    parser.add_argument("--sessions", type=int, default=1, metavar="N",
+                        help="with --replay, keep N sessions of the replay")
+    parser.add_argument("--players", type=int, default=1, metavar="N",
+                        help="players of every bot or replay session")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = Server(
+        bots=args.bots,
+        replay=replay.load(args.replay) if args.replay else None,
+        replays=args.sessions if args.replay else 0,
+        players=args.players
+    )
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
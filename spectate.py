@@ -0,0 +1,150 @@
+"""
+Stand-in client that watches the sessions of a Tetris server.
+
+Every viewer is its own connection, which watches sessions and rebuilds the
+state of their players from the frames it gets. The traffic and the frames
+that did not follow each other are reported every second.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from src.config import config
+from src.stream import (DELTA, END, ERROR, KEYFRAME, LIST, MESSAGE,
+                        SESSION_ENTRY, SESSIONS, WATCH, apply_frame, message,
+                        read_message)
+
+
+class Stats:
+    """Counters of what the viewers got"""
+
+    def __init__(self):
+        """Initialize an instance of Stats"""
+        self.messages = 0
+        self.bytes = 0
+        self.keyframes = 0
+        self.deltas = 0
+        self.delta_bytes = 0
+        self.resyncs = 0
+        self.ended = 0
+        self.errors = 0
+
+    def report(self, elapsed):
+        """Get the counters as a line of text, per second of elapsed"""
+        delta_size = self.delta_bytes / self.deltas if self.deltas else 0
+        return (f"{self.messages / elapsed:.0f} msg/s, "
+                f"{self.bytes / elapsed / 1024:.1f} KiB/s, "
+                f"keyframes: {self.keyframes}, deltas: {self.deltas} "
+                f"({delta_size:.1f} B), resyncs: {self.resyncs}, "
+                f"ended: {self.ended}, errors: {self.errors}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", default=config["server"]["host"],
+                        help="address of the server")
+    parser.add_argument("--port", type=int, default=config["server"]["port"],
+                        help="port of the server")
+    parser.add_argument("--viewers", type=int, default=1, metavar="N",
+                        help="number of connections watching sessions")
+    parser.add_argument("--watch", type=int, default=1, metavar="N",
+                        help="number of sessions every viewer watches")
+    parser.add_argument("--delay", type=float, default=0, metavar="SECONDS",
+                        help="time every viewer waits after each message, "
+                        "to act as a slow reader")
+    parser.add_argument("--seconds", type=float, metavar="SECONDS",
+                        help="stop after SECONDS")
+    return parser.parse_args()
+
+
+async def view(viewer, args, stats):
+    """Watch sessions until the connection is closed"""
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    writer.write(message(LIST, 0))
+
+    # Mirrors of the players and last frame of every watched session
+    mirrors = {}
+    frames = {}
+
+    while True:
+        kind, session, payload = await read_message(reader)
+        stats.messages += 1
+        stats.bytes += MESSAGE.size + len(payload)
+
+        if kind == SESSIONS:
+            # Spread the viewers over the sessions
+            ids = [entry[0] for entry in SESSION_ENTRY.iter_unpack(payload)]
+            for i in range(min(args.watch - len(frames), len(ids))):
+                session_id = ids[(viewer * args.watch + i) % len(ids)]
+                if session_id not in frames:
+                    frames[session_id] = None
+                    writer.write(message(WATCH, session_id))
+
+        elif kind in (KEYFRAME, DELTA):
+            prev = frames.get(session)
+            if kind == KEYFRAME:
+                stats.keyframes += 1
+                if prev is not None:
+                    stats.resyncs += 1
+            else:
+                stats.deltas += 1
+                stats.delta_bytes += len(payload)
+                if prev is None:
+                    stats.errors += 1
+            frame = apply_frame(mirrors.setdefault(session, []), kind,
+                                payload)
+            if kind == DELTA and prev is not None and frame != prev + 1:
+                stats.errors += 1
+            frames[session] = frame
+
+        elif kind == END:
+            # Watch another session instead
+            stats.ended += 1
+            mirrors.pop(session, None)
+            frames.pop(session, None)
+            writer.write(message(LIST, 0))
+
+        elif kind == ERROR:
+            stats.errors += 1
+
+        if args.delay:
+            await asyncio.sleep(args.delay)
+
+
+async def spectate(args):
+    """Run the viewers and report what they got every second"""
+    stats = Stats()
+    viewers = asyncio.gather(*(
+        view(viewer, args, stats) for viewer in range(args.viewers)
+    ))
+
+    start = time.perf_counter()
+    try:
+        while not viewers.done():
+            await asyncio.wait((viewers,), timeout=1)
+            elapsed = time.perf_counter() - start
+            print(stats.report(elapsed))
+            if args.seconds and elapsed >= args.seconds:
+                break
+    finally:
+        viewers.cancel()
+        try:
+            await viewers
+        except asyncio.CancelledError:
+            pass
+
+
+def main():
+    args = parse_args()
+    try:
+        asyncio.run(spectate(args))
+    except (KeyboardInterrupt, ConnectionError, asyncio.IncompleteReadError):
+        pass
+    except ValueError as error:
+        sys.exit(f"invalid stream: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Many games of Tetris advanced in lockstep with NumPy array operations.
+
+The batch follows the rules of src.engine.Engine, except that the inputs of
+a frame are actions rather than held keys: LEFT and RIGHT shift the
+tetromino once on every frame they are given (there is no delayed auto
+shift), ROTATE_CW and ROTATE_CCW rotate it once, and DOWN soft drops it for
+that frame. As in the engine, LEFT, RIGHT and DOWN only move the tetromino
+when they are the only movement action of the frame.
+"""
+
+import numpy as np
+
+from src.board import Board
+from src.config import config as src_config
+from src.engine import (DOWN, LEFT, MOVE_INPUTS, RIGHT, ROTATE_CCW,
+                        ROTATE_CW)
+from src.features import clear_rows
+from src.tables import ROTATABLE, SHAPES
+
+ORIENTATIONS = np.array([len(shapes) for shapes in SHAPES], dtype=np.int64)
+ROTATES = np.array(ROTATABLE)
+
+LINE_SCORES = np.array([0, 30, 100, 300, 1200], dtype=np.int64)
+
+
+class BatchEngine:
+    """A batch of games that are advanced one frame at a time together"""
+
+    config = src_config["game"]
+
+    def __init__(self, count, seed=None, size=None):
+        """Initialize a batch of count games
+
+        The seed is used to generate the tetrominoes of every game. The
+        boards have the (width, height) size, or the size of the playfield
+        if it is not given.
+        """
+        self.count = count
+        self.rng = np.random.default_rng(seed)
+
+        board = Board(*size) if size else Board()
+        self.width = board.width
+        self.height = board.height
+        self.vanish_rows = board.vanish_rows
+
+        # Cells of every orientation of every tetromino with the shape
+        # (tetromino, orientation, block, (col, row)). Tetrominoes with fewer
+        # than four orientations repeat them, so any orientation index below
+        # ORIENTATIONS[id] is valid.
+        self.shapes = np.array([
+            [shapes[i % len(shapes)].cells for i in range(4)]
+            for shapes in board.tetrominoes
+        ], dtype=np.int64)
+
+        self.drop_delays = np.array(self.config["drop_delay"], dtype=np.int64)
+
+        self.boards = np.zeros(
+            (count, self.vanish_rows + self.height, self.width), dtype=bool
+        )
+        self.frame = 0
+        self.game_over = np.zeros(count, dtype=bool)
+        self.level = np.zeros(count, dtype=np.int64)
+        self.score = np.zeros(count, dtype=np.int64)
+        self.line_cleared = np.zeros(count, dtype=np.int64)
+
+        # The active tetromino, whose col and row are the offset from its
+        # spawn. A game has no active tetromino during the entry delay.
+        self.active = np.zeros(count, dtype=bool)
+        self.tetromino = np.zeros(count, dtype=np.int64)
+        self.orientation = np.zeros(count, dtype=np.int64)
+        self.col = np.zeros(count, dtype=np.int64)
+        self.row = np.zeros(count, dtype=np.int64)
+        self.next_tetromino = np.zeros(count, dtype=np.int64)
+
+        self.drop_counter = np.zeros(count, dtype=np.int64)
+        self.entry_counter = np.zeros(count, dtype=np.int64)
+
+        self.reset()
+
+    def reset(self, games=None):
+        """Restart the given games, or every game if none is given
+
+        The games can be given as indices or as a boolean mask.
+        """
+        if games is None:
+            games = np.arange(self.count)
+        games = np.asarray(games)
+        if games.dtype == bool:
+            games = np.flatnonzero(games)
+
+        self.boards[games] = False
+        self.game_over[games] = False
+        self.level[games] = 0
+        self.score[games] = 0
+        self.line_cleared[games] = 0
+        self.drop_counter[games] = 0
+        self.entry_counter[games] = 0
+
+        self.next_tetromino[games] = self.rng.integers(0, 7, len(games))
+        self.new_tetromino(games)
+
+    def random_tetromino(self, current):
+        """Generate the tetrominoes that follow the given tetrominoes
+
+        Rolls once among eight outcomes and rerolls among the seven
+        tetrominoes if the roll is the extra outcome or repeats the current
+        tetromino, like Engine.new_tetromino.
+        """
+        roll = self.rng.integers(0, 8, len(current))
+        reroll = self.rng.integers(0, 7, len(current))
+        return np.where((roll == 7) | (roll == current), reroll, roll)
+
+    def new_tetromino(self, games):
+        """Spawn the next tetromino of the given games"""
+        self.tetromino[games] = self.next_tetromino[games]
+        self.orientation[games] = 0
+        self.col[games] = 0
+        self.row[games] = 0
+        self.active[games] = True
+        self.next_tetromino[games] = self.random_tetromino(
+            self.tetromino[games]
+        )
+
+    def cells(self, games, orientation=None, col=0, row=0):
+        """Get the cells of the tetrominoes of the given games
+
+        The orientation defaults to the current orientation, and the col and
+        row offsets are added to the current position. Returns the columns
+        and rows as two arrays with the shape (len(games), 4).
+        """
+        if orientation is None:
+            orientation = self.orientation[games]
+        cells = self.shapes[self.tetromino[games], orientation]
+        return (cells[:, :, 0] + (self.col[games] + col)[:, None],
+                cells[:, :, 1] + (self.row[games] + row)[:, None])
+
+    def collides(self, games, cols, rows):
+        """Check which games have any of the given cells occupied
+
+        Every cell must be within the board.
+        """
+        return self.boards[games[:, None], rows + self.vanish_rows,
+                           cols].any(axis=1)
+
+    def fits(self, games, cols, rows):
+        """Check which games have all the given cells within the board and
+        unoccupied"""
+        inside = ((cols >= 0) & (cols < self.width) &
+                  (rows >= -self.vanish_rows) & (rows < self.height))
+        occupied = self.boards[
+            games[:, None],
+            np.clip(rows, -self.vanish_rows, self.height - 1) +
+            self.vanish_rows,
+            np.clip(cols, 0, self.width - 1)
+        ]
+        return (inside & ~occupied).all(axis=1)
+
+    def step(self, actions):
+        """Advance every game by one frame with the given actions
+
+        The actions are an array with one bitmask of src.engine inputs per
+        game. Games that are over are left untouched. Returns the amount of
+        line cleared by every game during the frame.
+        """
+        actions = np.broadcast_to(np.asarray(actions), (self.count,))
+
+        live = ~self.game_over
+        entering = live & ~self.active
+
+        self.rotate(actions, live & self.active)
+        self.shift(actions, live & self.active)
+        line_cleared = self.drop(actions, live & self.active)
+        self.entry(entering)
+
+        self.frame += 1
+        return line_cleared
+
+    def rotate(self, actions, playing):
+        """Rotate the tetromino of the games pressing a rotate action"""
+        for action, step in ((ROTATE_CW, 1), (ROTATE_CCW, -1)):
+            games = np.flatnonzero(
+                playing & (actions & action != 0) &
+                ROTATES[self.tetromino]
+            )
+            if not len(games):
+                continue
+
+            orientation = (self.orientation[games] + step) % \
+                ORIENTATIONS[self.tetromino[games]]
+            fits = self.fits(games, *self.cells(games, orientation))
+            self.orientation[games[fits]] = orientation[fits]
+
+    def shift(self, actions, playing):
+        """Shift the tetromino of the games whose only movement action is
+        LEFT or RIGHT"""
+        moves = actions & MOVE_INPUTS
+        offsets = np.where(moves == LEFT, -1, np.where(moves == RIGHT, 1, 0))
+        games = np.flatnonzero(playing & (offsets != 0))
+        if not len(games):
+            return
+
+        cols, rows = self.cells(games)
+        fits = self.fits(games, cols + offsets[games, None], rows)
+        self.col[games[fits]] += offsets[games[fits]]
+
+    def drop(self, actions, playing):
+        """Apply gravity and soft drop, and lock the tetrominoes that landed
+
+        Returns the amount of line cleared by every game.
+        """
+        delay = self.drop_delays[np.minimum(self.level, 29)]
+        soft_drop = (actions & MOVE_INPUTS == DOWN) & \
+            (delay > self.config["soft_drop_delay"])
+        delay = np.where(soft_drop, self.config["soft_drop_delay"], delay)
+
+        due = playing & (self.drop_counter >= delay)
+        self.drop_counter[playing & ~due] += 1
+        self.drop_counter[due] = 0
+
+        line_cleared = np.zeros(self.count, dtype=np.int64)
+        games = np.flatnonzero(due)
+        if not len(games):
+            return line_cleared
+
+        cols, rows = self.cells(games)
+        fits = self.fits(games, cols, rows + 1)
+        self.row[games[fits]] += 1
+
+        # Lock the tetrominoes that cannot drop, unless they are overlapping
+        # with locked blocks, which ends their game.
+        landed = ~fits
+        games, cols, rows = games[landed], cols[landed], rows[landed]
+        overlap = self.collides(games, cols, rows)
+        self.game_over[games[overlap]] = True
+
+        games, cols, rows = games[~overlap], cols[~overlap], rows[~overlap]
+        self.boards[games[:, None], rows + self.vanish_rows, cols] = True
+        self.active[games] = False
+
+        line_cleared[games] = self.line_clear(games)
+        self.update_score(games, line_cleared[games])
+        return line_cleared
+
+    def line_clear(self, games):
+        """Clear complete rows of the given games, and move the rows above
+        them downward
+
+        Returns the amount of rows cleared for every given game.
+        """
+        boards = self.boards[games]
+        counts = clear_rows(boards)
+
+        cleared = counts > 0
+        self.boards[games[cleared]] = boards[cleared]
+        return counts
+
+    def update_score(self, games, line_cleared):
+        """Update the score, line count and level of the given games"""
+        self.score[games] += LINE_SCORES[line_cleared] * \
+            (self.level[games] + 1)
+        self.line_cleared[games] += line_cleared
+        self.level[games] = self.line_cleared[games] // 10
+
+    def entry(self, entering):
+        """Spawn the next tetromino of the games whose entry delay passed"""
+        due = entering & (self.entry_counter >= self.config["entry_delay"])
+        self.entry_counter[entering & ~due] += 1
+        self.entry_counter[due] = 0
+        self.new_tetromino(np.flatnonzero(due))
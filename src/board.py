@@ -0,0 +1,317 @@
+"""
+Logical model of the playfield, where every row is stored as a bitmask.
+"""
+
+from copy import copy
+
+from src.config import config as src_config
+from src.tables import (ZOBRIST_CHUNK, ZOBRIST_MASK, compile_tables,
+                        compile_zobrist)
+
+
+class Board:
+    """Occupancy of the playfield with one integer bitmask per row
+
+    Bit n of a row is set if the cell in column n of that row is occupied.
+    Rows are numbered the same way as the rows of the playfield, so the rows
+    of the vanish zone have negative numbers.
+
+    The Zobrist hash of the occupied cells is kept in self.hash, and the
+    index of the highest occupied row of every column in self.column_tops.
+    Both are updated for what changes when cells are locked or rows are
+    cleared, and code that replaces the rows has to use set_rows.
+    """
+
+    config = src_config["playfield"]
+
+    def __init__(self, width=None, height=None, vanish_rows=None):
+        """Initialize an empty board
+
+        The width, height and vanish rows that are not given are taken from
+        the configuration of the playfield. Rows are integers of any size,
+        so boards of any width are checked with the same few operations.
+        """
+        self.width = width or self.config["size"][0]
+        self.height = height or self.config["size"][1]
+        self.vanish_rows = self.config["vanish_rows"] if vanish_rows is None\
+            else vanish_rows
+
+        self.full_row = (1 << self.width) - 1
+        self.rows = [0] * (self.vanish_rows + self.height)
+
+        # Orientation tables of the tetrominoes compiled for this board size
+        self.tetrominoes = compile_tables(self.width, self.height,
+                                          self.vanish_rows)
+
+        # Zobrist keys of the rows, which hash an empty board to 0
+        self.zobrist = compile_zobrist(self.width, len(self.rows))
+        self.hash = 0
+
+        # Index into rows of the highest occupied cell of every column, which
+        # is len(rows) for an empty column
+        self.column_tops = [len(self.rows)] * self.width
+
+    def copy(self):
+        """Get a copy of the board that can be changed independently"""
+        board = copy(self)
+        board.rows = list(self.rows)
+        board.column_tops = list(self.column_tops)
+        return board
+
+    def row_hash(self, index, mask):
+        """Get the Zobrist hash of a row bitmask at the given index of rows"""
+        value = 0
+        for table in self.zobrist[index]:
+            value ^= table[mask & ZOBRIST_MASK]
+            mask >>= ZOBRIST_CHUNK
+        return value
+
+    def rehash(self):
+        """Compute the hash of the board from scratch"""
+        self.hash = 0
+        for index, mask in enumerate(self.rows):
+            self.hash ^= self.row_hash(index, mask)
+
+    def index_columns(self):
+        """Compute the column tops of the board from scratch
+
+        The rows are scanned from the top down to the row where every column
+        has been found, so only the cells that are the top of their column
+        are looked at one by one.
+        """
+        self.column_tops = [len(self.rows)] * self.width
+        remaining = self.full_row
+        for index, mask in enumerate(self.rows):
+            found = mask & remaining
+            if not found:
+                continue
+            remaining ^= found
+            while found:
+                low = found & -found
+                self.column_tops[low.bit_length() - 1] = index
+                found ^= low
+            if not remaining:
+                break
+
+    def set_rows(self, rows, hash_=None, column_tops=None):
+        """Replace the rows of the board
+
+        The hash and the column tops of the rows are computed if they are
+        not given.
+        """
+        self.rows[:] = rows
+        if hash_ is None:
+            self.rehash()
+        else:
+            self.hash = hash_
+        if column_tops is None:
+            self.index_columns()
+        else:
+            self.column_tops = list(column_tops)
+
+    def add_garbage(self, count, hole):
+        """Push the rows up by count rows of garbage
+
+        Garbage rows are occupied in every column but the hole column.
+        Returns True if occupied cells were pushed out of the top of the
+        board.
+        """
+        count = min(count, len(self.rows))
+        overflow = any(self.rows[:count])
+        garbage = self.full_row & ~(1 << hole)
+        self.set_rows(self.rows[count:] + [garbage] * count)
+        return overflow
+
+    def contains(self, cells):
+        """Check if all the given cells are within the board
+
+        Returns True if every (col, row) cell is within the playfield or its
+        vanish zone, otherwise returns False.
+        """
+        for col, row in cells:
+            if not (0 <= col < self.width and
+                    -self.vanish_rows <= row < self.height):
+                return False
+        return True
+
+    def collides(self, cells):
+        """Check if any of the given cells is occupied
+
+        Every cell must be within the board.
+        """
+        rows = self.rows
+        for col, row in cells:
+            if rows[row + self.vanish_rows] >> col & 1:
+                return True
+        return False
+
+    def fits(self, cells):
+        """Check if all the given cells are within the board and unoccupied"""
+        rows = self.rows
+        for col, row in cells:
+            if not (0 <= col < self.width and
+                    -self.vanish_rows <= row < self.height):
+                return False
+            if rows[row + self.vanish_rows] >> col & 1:
+                return False
+        return True
+
+    def lock(self, cells):
+        """Occupy the given cells and clear the rows that became complete
+
+        Returns the playfield rows that have been cleared, sorted from top to
+        bottom.
+        """
+        rows = self.rows
+        for col, row in cells:
+            index = row + self.vanish_rows
+            mask = rows[index]
+            rows[index] |= 1 << col
+            self.hash ^= self.row_hash(index, mask ^ rows[index])
+            if index < self.column_tops[col]:
+                self.column_tops[col] = index
+
+        # Only the rows the cells were locked into can have become complete
+        return self.clear_lines({row for _, row in cells})
+
+    def clear_lines(self, rows):
+        """Clear the given rows that are complete
+
+        Returns the rows that have been cleared, sorted from top to bottom.
+        """
+        cleared = sorted(
+            row for row in rows
+            if self.rows[row + self.vanish_rows] == self.full_row
+        )
+        if not cleared:
+            return cleared
+
+        # Every row above the lowest cleared row moves, so the hash of those
+        # rows is removed before and added back after they moved
+        end = cleared[-1] + self.vanish_rows + 1
+        for index in range(end):
+            self.hash ^= self.row_hash(index, self.rows[index])
+
+        for row in cleared:
+            del self.rows[row + self.vanish_rows]
+            self.rows.insert(0, 0)
+
+        for index in range(end):
+            self.hash ^= self.row_hash(index, self.rows[index])
+
+        # A complete row is occupied in every column, so every column top is
+        # at or above the first cleared row. Tops above it move down, and the
+        # columns whose top was cleared are searched below the moved rows.
+        first = cleared[0] + self.vanish_rows
+        tops = self.column_tops
+        for col in range(self.width):
+            if tops[col] < first:
+                tops[col] += len(cleared)
+                continue
+
+            index = first + len(cleared)
+            while index < len(self.rows) and not self.rows[index] >> col & 1:
+                index += 1
+            tops[col] = index
+
+        return cleared
+
+    def piece_cells(self, id_, orientation, col, row):
+        """Get the cells of a tetromino
+
+        The tetromino is in the given orientation, and offset by col and row
+        from its spawn position.
+        """
+        return [
+            (cell_col + col, cell_row + row) for cell_col, cell_row
+            in self.tetrominoes[id_][orientation].cells
+        ]
+
+    def piece_fits(self, id_, orientation, col, row):
+        """Check if a tetromino is within the board and unoccupied
+
+        The tetromino is in the given orientation, and offset by col and row
+        from its spawn position.
+        """
+        shape = self.tetrominoes[id_][orientation]
+        if not (shape.cols[0] <= col <= shape.cols[1] and
+                shape.rows[0] <= row <= shape.rows[1]):
+            return False
+
+        rows = self.rows
+        row += self.vanish_rows
+        if col >= 0:
+            for mask_row, mask in shape.row_masks:
+                if rows[mask_row + row] & mask << col:
+                    return False
+        else:
+            for mask_row, mask in shape.row_masks:
+                if rows[mask_row + row] & mask >> -col:
+                    return False
+        return True
+
+    def drop_distance(self, id_, orientation, col, row):
+        """Get the number of rows a tetromino can drop straight down
+
+        The tetromino is in the given orientation, and offset by col and row
+        from its spawn position. When the tetromino is above the highest
+        occupied cell of each of its columns, it lands on the column tops.
+        Otherwise it may be under an overhang, and it is moved down one row
+        at a time instead.
+        """
+        shape = self.tetrominoes[id_][orientation]
+        tops = self.column_tops
+        row_index = row + self.vanish_rows
+        distance = len(self.rows)
+        for cell_col, cell_row in shape.bottoms:
+            cell_distance = tops[cell_col + col] - 1 - (cell_row + row_index)
+            if cell_distance < 0:
+                break
+            if cell_distance < distance:
+                distance = cell_distance
+        else:
+            return distance
+
+        distance = 0
+        while self.piece_fits(id_, orientation, col, row + distance + 1):
+            distance += 1
+        return distance
+
+    def piece_collides(self, id_, orientation, col, row):
+        """Check if a tetromino within the board is overlapping locked cells
+
+        The tetromino is in the given orientation, and offset by col and row
+        from its spawn position.
+        """
+        shape = self.tetrominoes[id_][orientation]
+        rows = self.rows
+        row += self.vanish_rows
+        for mask_row, mask in shape.row_masks:
+            mask = mask << col if col >= 0 else mask >> -col
+            if rows[mask_row + row] & mask:
+                return True
+        return False
+
+    def lock_piece(self, id_, orientation, col, row):
+        """Occupy the cells of a tetromino and clear the completed rows
+
+        The tetromino is in the given orientation, and offset by col and row
+        from its spawn position. Returns the playfield rows that have been
+        cleared, sorted from top to bottom.
+        """
+        shape = self.tetrominoes[id_][orientation]
+        rows = self.rows
+        for mask_row, mask in shape.row_masks:
+            mask = mask << col if col >= 0 else mask >> -col
+            index = mask_row + row + self.vanish_rows
+            self.hash ^= self.row_hash(index, mask & ~rows[index])
+            rows[index] |= mask
+
+        tops = self.column_tops
+        for cell_col, cell_row in shape.cells:
+            index = cell_row + row + self.vanish_rows
+            if index < tops[cell_col + col]:
+                tops[cell_col + col] = index
+
+        return self.clear_lines(mask_row + row
+                                for mask_row, _ in shape.row_masks)
@@ -0,0 +1,578 @@
+"""
+Bots that play the Tetris game one placement at a time.
+"""
+
+import time
+from operator import sub
+
+import numpy as np
+
+from src.cache import LRUCache
+from src.config import config as src_config
+from src.engine import (HARD_DROP, LEFT, RIGHT, ROTATE_CCW, ROTATE_CW,
+                        PieceState)
+from src.features import batch_features, lock_cells, unpack_rows
+from src.search import drop_placements, placements
+from src.tables import SHAPES
+
+
+def next_probabilities(id_):
+    """Get the probability of every tetromino to come after the given one
+
+    Engine.new_tetromino draws one more than the number of tetrominoes, and
+    draws again among the tetrominoes if it got that extra value or the
+    tetromino before, so the tetromino before comes again less often.
+    """
+    count = len(SHAPES)
+    reroll = 2 / (count + 1) / count
+    return tuple(
+        reroll + (0 if other == id_ else 1 / (count + 1))
+        for other in range(count)
+    )
+
+
+def pilot_fall(engine):
+    """Get the rows the tetromino of the engine falls between two inputs
+
+    InputPilot taps one input every other frame, and the tetromino drops
+    once every delay + 1 frames.
+    """
+    return 2 / (engine.drop_delay["delay"] + 1)
+
+
+def row_transitions(mask, width):
+    """Count the changes between occupied and empty cells along a row
+
+    The walls count as occupied cells, and an empty row has none, the same
+    as the row transitions of batch_features.
+    """
+    if not mask:
+        return 0
+    walled = mask << 1 | 1 | 1 << width + 1
+    return bin(walled ^ walled >> 1).count("1") - 1
+
+
+class HeuristicBot:
+    """Bot that picks the placement with the best weighted sum of features
+
+    Every placement the current tetromino can reach is tried on a copy of the
+    board, and the features of the resulting boards are computed together in
+    one batch and weighted. With
+    lookahead, every placement of the next tetromino is tried after each
+    placement of the current one, and the best pair is picked.
+
+    Results are cached by the Zobrist hash of the board, since the same
+    boards are reached again by placing tetrominoes in a different order, and
+    the boards searched for the next tetromino are searched again once it
+    has become the current one.
+    """
+
+    default_weights = {
+        "aggregate_height": -0.510066,
+        "holes": -0.35663,
+        "bumpiness": -0.184483,
+        "wells": 0.0,
+        "row_transitions": 0.0,
+        "line_cleared": 0.760666
+    }
+
+    def __init__(self, weights=None, lookahead=False, cache_size=65536):
+        """Initialize an instance of HeuristicBot
+
+        Missing weights are taken from the default weights. No more than
+        cache_size results are cached.
+        """
+        self.weights = dict(self.default_weights, **(weights or {}))
+        self.lookahead = lookahead
+        self.cache = LRUCache(cache_size)
+
+    def evaluate(self, board, placements):
+        """Get the scores of locking each of the given Placements
+
+        Returns a list of (score, cleared lines) tuples.
+        """
+        if not placements:
+            return []
+
+        cells = np.array([placement.cells for placement in placements])
+        cells[:, :, 1] += board.vanish_rows
+        boards, line_cleared = lock_cells(
+            unpack_rows([board.rows], board.width)[0], cells
+        )
+        features = batch_features(boards)
+        scores = (
+            self.weights["aggregate_height"] * features.aggregate_height +
+            self.weights["holes"] * features.holes +
+            self.weights["bumpiness"] * features.bumpiness +
+            self.weights["wells"] * features.wells +
+            self.weights["row_transitions"] * features.row_transitions +
+            self.weights["line_cleared"] * line_cleared
+        )
+        return list(zip(scores.tolist(), line_cleared.tolist()))
+
+    def evaluations(self, board, id_, fall=None):
+        """Get every placement of a spawned tetromino with its evaluation
+
+        The placements are those of drop_placements for the given fall, or
+        every placement if fall is None. Returns a list of (Placement,
+        score, cleared lines) tuples.
+        """
+        key = (board.hash, id_, fall)
+        result = self.cache.get(key)
+        if result is None:
+            if fall is None:
+                candidates = placements(board, id_)
+            else:
+                candidates = drop_placements(board, id_, fall)
+            result = [
+                (placement, score, line_cleared)
+                for placement, (score, line_cleared)
+                in zip(candidates, self.evaluate(board, candidates))
+            ]
+            self.cache.put(key, result)
+        return result
+
+    def best(self, board, id_, next_id=None, fall=None):
+        """Get the best placement of a spawned tetromino and its value
+
+        If next_id is given, the value of a placement is the best value of
+        the next tetromino after it. The placements are those of
+        evaluations for the given fall. Returns a (value, Placement) tuple,
+        which is (None, None) if the tetromino cannot reach any placement.
+        """
+        key = (board.hash, id_, next_id, fall)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        result = (None, None)
+        for placement, score, line_cleared in self.evaluations(board, id_,
+                                                               fall):
+            value = score
+            if next_id is not None:
+                after = board.copy()
+                after.lock_piece(*placement.piece)
+                value, _ = self.best(after, next_id, fall=fall)
+                if value is None:
+                    continue
+                value += self.weights["line_cleared"] * line_cleared
+
+            if result[0] is None or value > result[0]:
+                result = (value, placement)
+
+        # Fall back to the current tetromino alone if no placement leaves
+        # room for the next one
+        if result[1] is None and next_id is not None:
+            result = self.best(board, id_, fall=fall)
+
+        self.cache.put(key, result)
+        return result
+
+    def choose(self, engine, drops=False):
+        """Get the Placement for the tetromino of the engine
+
+        If drops is True, only the drop_placements of the tetromino for the
+        gravity of the engine are searched, whose path is the inputs that
+        InputPilot taps. Returns None if the tetromino cannot reach any
+        placement.
+        """
+        tetromino = engine.tetromino
+        fall = pilot_fall(engine) if drops else None
+        if tetromino != PieceState(tetromino.id, 0, 0, 0):
+            # Only the placements from the spawn position are cached
+            if drops:
+                candidates = drop_placements(engine.board, tetromino.id,
+                                             fall, tetromino)
+            else:
+                candidates = placements(engine.board, tetromino.id,
+                                        tetromino)
+            if not candidates:
+                return None
+            scores = self.evaluate(engine.board, candidates)
+            return max(zip(scores, candidates), key=lambda x: x[0][0])[1]
+
+        next_id = engine.next_tetromino if self.lookahead else None
+        _, placement = self.best(engine.board, tetromino.id, next_id, fall)
+        return placement
+
+    def play(self, engine):
+        """Lock the tetromino of the engine at the chosen placement"""
+        placement = self.choose(engine)
+        engine.place(placement.piece if placement else engine.tetromino)
+
+
+class SearchTimeout(Exception):
+    """Raised when the time budget of a search has run out"""
+
+
+class ExpectimaxBot(HeuristicBot):
+    """Bot that searches the tetrominoes to come within a time budget
+
+    The placements of the current tetromino are searched with the known
+    next tetromino after each of them, and every tetromino after those is a
+    chance node: its value is the expected value of the best placement of
+    each tetromino that can come, weighted by next_probabilities.
+
+    The search is anytime. It is deepened by one chance node at a time until
+    the time budget runs out, and the placement of the deepest search is
+    played. To search deep enough within the budget, only the beam best
+    placements of every tetromino by their own score are searched further,
+    the placements are those of drop_placements for the gravity of the
+    engine, and the features of every placement are updated from those of
+    the board instead of computed for a copy of it.
+
+    Values are cached by the Zobrist hash of the board, so every deepening
+    and the search of the next tetromino reuse what was searched before.
+    """
+
+    # Value of a board on which the coming tetromino cannot be placed
+    game_over_value = -1000.0
+
+    def __init__(self, weights=None, time_budget=None, beam=3, max_depth=8,
+                 cache_size=65536):
+        """Initialize an instance of ExpectimaxBot
+
+        The time budget of every tetromino is in seconds. By default, it is
+        the time the fixed timestep of the game catches up with at once, less
+        one tick, so a game played by the bot keeps the pace of the tick
+        rate. The search stops deepening after max_depth chance nodes.
+        """
+        super().__init__(weights, cache_size=cache_size)
+        game_config = src_config["game"]
+        self.time_budget = time_budget or\
+            (game_config["max_catch_up_ticks"] - 1) / game_config["tick_rate"]
+        self.beam = beam
+        self.max_depth = max_depth
+        self.fall = 0
+
+        # Time at which the running search stops, never outside of choose
+        self.deadline = float("inf")
+
+        # Nodes searched, tetrominoes deep and seconds spent by the last
+        # search, and their totals over every search
+        self.nodes = 0
+        self.depth = 0
+        self.elapsed = 0.0
+        self.searches = 0
+        self.total_nodes = 0
+        self.total_depth = 0
+        self.total_elapsed = 0.0
+
+    def features(self, board):
+        """Get the column heights, holes and row transitions of a board
+
+        They are computed the same way as by batch_features, from the
+        bitmasks and the column tops of the board, with the transitions of
+        every row in a list.
+        """
+        heights = [len(board.rows) - top for top in board.column_tops]
+        holes = covered = 0
+        transitions = []
+        for mask in board.rows:
+            covered |= mask
+            holes += bin(covered & ~mask).count("1")
+            transitions.append(row_transitions(mask, board.width))
+        return heights, holes, transitions
+
+    @staticmethod
+    def surface(padded, first, last):
+        """Get the bumpiness and the wells of the columns first to last
+
+        padded holds the height of every column between the heights the
+        walls count as, and only the height differences between the given
+        columns are summed.
+        """
+        heights = padded[first + 1:last + 2]
+        bumpiness = sum(map(abs, map(sub, heights, heights[1:])))
+        wells = 0
+        for left, height, right in zip(padded[first:], heights,
+                                       padded[first + 2:]):
+            depth = min(left, right) - height
+            if depth > 0:
+                wells += depth
+        return bumpiness, wells
+
+    def score(self, aggregate_height, holes, bumpiness, wells, transitions,
+              line_cleared):
+        """Get the weighted sum of the features of a board"""
+        weights = self.weights
+        return (weights["aggregate_height"] * aggregate_height +
+                weights["holes"] * holes +
+                weights["bumpiness"] * bumpiness +
+                weights["wells"] * wells +
+                weights["row_transitions"] * transitions +
+                weights["line_cleared"] * line_cleared)
+
+    def board_score(self, board, line_cleared):
+        """Get the score of a board from its features"""
+        heights, holes, transitions = self.features(board)
+        wall = len(board.rows)
+        return self.score(sum(heights), holes,
+                          *self.surface([wall] + heights + [wall], 0,
+                                        board.width - 1),
+                          sum(transitions), line_cleared)
+
+    def drop_evaluations(self, board, id_, start=None):
+        """Get every drop placement of a tetromino with its score
+
+        The placements are those of drop_placements from the start
+        PieceState, or from the spawn position if it is not given.
+
+        A placement that lands on the column tops without clearing a row
+        only changes the heights of its columns, the holes under it and the
+        transitions of its rows, so only those are updated from the features
+        of the board. Returns a tuple of (score, cleared lines, piece)
+        tuples, from the best score, where the piece is the (id,
+        orientation, col, row) of the placement. Raises SearchTimeout once
+        the time budget has run out.
+        """
+        key = ("drop", board.hash, id_, self.fall, start)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        heights, holes, rows_transitions = self.features(board)
+        rows = board.rows
+        tops = board.column_tops
+        wall = len(rows)
+        last = board.width - 1
+        aggregate_height = sum(heights)
+        transitions = sum(rows_transitions)
+        padded = [wall] + heights + [wall]
+        bumpiness, wells = self.surface(padded, 0, last)
+
+        # Surface of the columns around every placement before it is locked
+        surfaces = {}
+
+        result = []
+        for placement in drop_placements(board, id_, self.fall, start):
+            if time.perf_counter() > self.deadline:
+                raise SearchTimeout
+
+            # The piece is cached as a plain tuple, see below
+            piece = tuple(placement.piece)
+            _, orientation, col, row = piece
+            shape = board.tetrominoes[id_][orientation]
+            row += board.vanish_rows
+            masks = [
+                (mask_row + row, mask << col if col >= 0 else mask >> -col)
+                for mask_row, mask in shape.row_masks
+            ]
+
+            if any(cell_row + row >= tops[cell_col + col]
+                   for cell_col, cell_row in shape.bottoms) or\
+                    any(rows[index] | mask == board.full_row
+                        for index, mask in masks):
+                # Under an overhang or clearing rows, every feature may
+                # change
+                after = board.copy()
+                line_cleared = len(after.lock_piece(*piece))
+                result.append((self.board_score(after, line_cleared),
+                               line_cleared, piece))
+                continue
+
+            new_padded = list(padded)
+            new_aggregate_height = aggregate_height
+            new_holes = holes
+            for cell_col, cell_row in shape.tops:
+                height = wall - cell_row - row
+                new_aggregate_height += height - padded[cell_col + col + 1]
+                new_padded[cell_col + col + 1] = height
+            for cell_col, cell_row in shape.bottoms:
+                new_holes += tops[cell_col + col] - 1 - cell_row - row
+
+            # The surface only changes around the columns of the placement
+            first = max(shape.tops[0][0] + col - 1, 0)
+            end = min(shape.tops[-1][0] + col + 1, last)
+            if (first, end) not in surfaces:
+                surfaces[first, end] = self.surface(padded, first, end)
+            old_bumpiness, old_wells = surfaces[first, end]
+            new_bumpiness, new_wells = self.surface(new_padded, first, end)
+            result.append((self.score(
+                new_aggregate_height,
+                new_holes,
+                bumpiness + new_bumpiness - old_bumpiness,
+                wells + new_wells - old_wells,
+                transitions + sum(
+                    row_transitions(rows[index] | mask, board.width) -
+                    rows_transitions[index] for index, mask in masks
+                ),
+                0
+            ), 0, piece))
+
+        # Plain tuples of numbers are untracked by the garbage collector,
+        # which then does not have to go through every cached placement
+        result = tuple(sorted(result, key=lambda evaluation: evaluation[0],
+                              reverse=True))
+        self.cache.put(key, result)
+        return result
+
+    def maximize(self, board, id_, depth):
+        """Get the value of the best placement of a tetromino on a board
+
+        The value of a placement is its score if depth is 0, and otherwise
+        the expected value of the tetromino after it searched to depth - 1.
+        Raises SearchTimeout once the time budget has run out.
+        """
+        if time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        self.nodes += 1
+
+        evaluations = self.drop_evaluations(board, id_)
+        if not evaluations:
+            return self.game_over_value
+        if not depth:
+            return evaluations[0][0]
+
+        key = ("value", board.hash, id_, self.fall, depth)
+        value = self.cache.get(key)
+        if value is None:
+            value = max(
+                self.weights["line_cleared"] * line_cleared +
+                self.expect(self.after(board, piece), id_, depth)
+                for _, line_cleared, piece in evaluations[:self.beam]
+            )
+            self.cache.put(key, value)
+        return value
+
+    def expect(self, board, id_, depth):
+        """Get the expected value of the tetromino that comes after id_"""
+        return sum(
+            probability * self.maximize(board, next_id, depth - 1)
+            for next_id, probability in enumerate(next_probabilities(id_))
+        )
+
+    @staticmethod
+    def after(board, piece):
+        """Get a copy of the board with the piece locked onto it"""
+        board = board.copy()
+        board.lock_piece(*piece)
+        return board
+
+    def choose(self, engine, drops=True):
+        """Get the Placement for the tetromino of the engine
+
+        Only drop_placements are searched, whatever drops is, from where the
+        tetromino is. Every root placement is searched to the same depth on
+        each deepening, the best one first. If the time budget runs out
+        during a deepening, a placement that has been searched deeper than
+        the best one so far is only played if it is better at that depth,
+        and if it runs out before the root placements are scored, the
+        tetromino is dropped straight down. Returns None if the tetromino
+        cannot reach any placement.
+        """
+        start = time.perf_counter()
+        self.deadline = start + self.time_budget
+        self.nodes = 0
+        self.depth = 0
+        self.fall = pilot_fall(engine)
+
+        # Only the placements from the spawn position are shared with the
+        # rest of the search
+        board = engine.board
+        tetromino = engine.tetromino
+        origin = None if tetromino == PieceState(tetromino.id, 0, 0, 0)\
+            else tetromino
+        found = drop_placements(board, tetromino.id, self.fall, origin)
+        best = found[0].piece if found else None
+        try:
+            candidates = self.drop_evaluations(board, tetromino.id,
+                                               origin)[:self.beam]
+            best = candidates[0][2] if candidates else None
+            self.depth = 1
+            for depth in range(self.max_depth + 1):
+                values = []
+                for _, line_cleared, piece in candidates:
+                    values.append((
+                        self.weights["line_cleared"] * line_cleared +
+                        self.maximize(self.after(board, piece),
+                                      engine.next_tetromino, depth),
+                        line_cleared, piece
+                    ))
+                    # The best placement is searched first, so it can be
+                    # replaced by any placement searched as deep
+                    best = max(values, key=lambda value: value[0])[2]
+                candidates = sorted(values, key=lambda value: value[0],
+                                    reverse=True)
+                self.depth = depth + 2
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = float("inf")
+            self.elapsed = time.perf_counter() - start
+            self.searches += 1
+            self.total_nodes += self.nodes
+            self.total_depth += self.depth
+            self.total_elapsed += self.elapsed
+
+        return next((
+            placement for placement in found if placement.piece == best
+        ), None)
+
+    def report(self):
+        """Get the nodes searched per second and the depth of the searches
+
+        The depth is the number of tetrominoes searched, with the current
+        and the next one.
+        """
+        searches = self.searches or 1
+        nodes_per_second = self.total_nodes / (self.total_elapsed or 1)
+        return (f"{self.searches} searches, {nodes_per_second:.0f} nodes/s, "
+                f"mean depth {self.total_depth / searches:.2f}, "
+                f"{self.total_elapsed / searches * 1000:.2f} ms per search")
+
+
+class InputPilot:
+    """Plays the placements chosen by a bot through the inputs of an engine
+
+    Instead of locking the tetromino at once like HeuristicBot.play, the
+    inputs of the path of the chosen placement are tapped one every other
+    frame, so the engine runs exactly as if a player was pressing the
+    inputs. The bot only chooses among drop_placements for the gravity of
+    the engine, whose paths the tetromino can follow.
+
+    The placement is chosen again whenever the board or the tetromino
+    differs from where the last input should have moved it, as after an
+    input was blocked or the engine has been restored to a snapshot.
+    """
+
+    def __init__(self, bot):
+        """Initialize an instance of InputPilot
+
+        The bot must have the choose method of HeuristicBot.
+        """
+        self.bot = bot
+
+        # Inputs left to tap, last first
+        self.path = []
+
+        # Board hash, tetromino id, orientation and column the tetromino
+        # should have after the last input
+        self.expected = None
+
+    def inputs(self, engine):
+        """Get the inputs to hold during the next frame of the engine"""
+        tetromino = engine.tetromino
+        if not tetromino or engine.game_over:
+            self.path = []
+            return 0
+
+        # Inputs are released for a frame between taps
+        if engine.inputs:
+            return 0
+
+        board = engine.board
+        current = (board.hash, tetromino.id, tetromino.orientation,
+                   tetromino.col)
+        if not self.path or self.expected != current:
+            placement = self.bot.choose(engine, drops=True)
+            path = placement.path if placement else (HARD_DROP,)
+            self.path = list(reversed(path))
+
+        action = self.path.pop()
+        count = len(board.tetrominoes[tetromino.id])
+        orientation = (tetromino.orientation + (action == ROTATE_CW) -
+                       (action == ROTATE_CCW)) % count
+        col = tetromino.col + (action == RIGHT) - (action == LEFT)
+        self.expected = (board.hash, tetromino.id, orientation, col)
+        return action
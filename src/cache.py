@@ -0,0 +1,57 @@
+"""
+Bounded caches for the results of bots.
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Cache that forgets the least recently used entry when it is full
+
+    The hits and misses of get are counted, so the cache can be sized by
+    its hit rate.
+    """
+
+    def __init__(self, maxsize=65536):
+        """Initialize an instance of LRUCache
+
+        No more than maxsize entries are kept.
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """Get the number of cached entries"""
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """Get the value cached for the key, or default if it is not cached"""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Cache the value for the key"""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Forget every entry and reset the counters"""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        """Get the fraction of lookups that were hits"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
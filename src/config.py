@@ -12,12 +12,19 @@ config = {
 
     # Game configuration
     "game": {
+        "tick_rate": 60,
+        "max_catch_up_ticks": 5,
         "fps": 60,
+        "idle_fps": 10,
+        "idle_timeout": 500,
+        "undo_limit": 32,
+        "ghost_shade": 0.3,
         "drop_delay": [48, 43, 38, 33, 28, 23, 18, 13, 8, 6, 5, 5, 5, 4, 4, 4,
                        3, 3, 3, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 1],
         "soft_drop_delay": 2,
         "das_delay": 16,
         "entry_delay": 14,
+        "garbage_lines": [0, 0, 1, 2, 4],
         "hud": {
             "font": {
                 "face": "./assets/font.ttf",
@@ -27,16 +34,69 @@ config = {
             },
             "level_topleft": (10, 15),
             "score_midtop": (210, 15),
-            "line_cleared_topright": (410, 15)
+            "line_cleared_topright": (410, 15),
+            "profiler_topleft": (12, 820)
         }
     },
 
+    # Configuration of local split-screen matches
+    "versus": {
+        "columns": 4,
+        "panel_size": (210, 450),
+        "layout": {
+            "area": (5, 40, 200, 400),
+            "level_topleft": (5, 15),
+            "score_midtop": (105, 15),
+            "line_cleared_topright": (205, 15)
+        },
+        # Key names of every player mapped to the inputs of the engine
+        "bindings": [
+            {"a": "left", "d": "right", "s": "down", "w": "rotate_cw",
+             "q": "rotate_ccw", "left shift": "hard_drop"},
+            {"left": "left", "right": "right", "down": "down",
+             "up": "rotate_cw", "right ctrl": "rotate_ccw",
+             "right shift": "hard_drop"},
+            {"j": "left", "l": "right", "k": "down", "i": "rotate_cw",
+             "u": "rotate_ccw", "o": "hard_drop"},
+            {"[4]": "left", "[6]": "right", "[5]": "down", "[8]": "rotate_cw",
+             "[7]": "rotate_ccw", "[0]": "hard_drop"},
+            {"f": "left", "h": "right", "g": "down", "t": "rotate_cw",
+             "r": "rotate_ccw", "y": "hard_drop"},
+            {"z": "left", "c": "right", "x": "down", "v": "rotate_cw",
+             "b": "rotate_ccw", "n": "hard_drop"},
+            {"1": "left", "3": "right", "2": "down", "4": "rotate_cw",
+             "5": "rotate_ccw", "6": "hard_drop"},
+            {"7": "left", "9": "right", "8": "down", "0": "rotate_cw",
+             "-": "rotate_ccw", "=": "hard_drop"}
+        ]
+    },
+
+    # Configuration of the server that streams sessions to its clients
+    "server": {
+        "host": "127.0.0.1",
+        "port": 7777,
+        # Frames between the keyframes sent to every watcher
+        "keyframe_interval": 300,
+        # Bytes waiting to be sent past which a watcher skips frames
+        "high_water": 65536,
+        # Most players a client can ask a session to have
+        "max_players": 8,
+        # Longest payload of a message from a client, past which the client
+        # is disconnected
+        "max_payload": 1024,
+        # Seconds a bot searches for a placement, since the sessions wait
+        # for the searches of every bot
+        "bot_time_budget": 0.002
+    },
+
     # Playfield configuration
     "playfield": {
         "area": (10, 40, 400, 800),
-        "vanish_zone": (0, -80, 400, 80),
+        "size": (10, 20),
+        "vanish_rows": 2,
+        "renderer": "sprites",
         "bgd_color": (10, 10, 10),
-        "cell_size": (40, 40)
+        "garbage_color": (120, 120, 120)
     },
 
     # Configurations for 7 different tetrominoes
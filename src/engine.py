@@ -0,0 +1,495 @@
+"""
+Rules of the Tetris game, independent of any display.
+
+The engine is advanced one frame at a time with Engine.step (or with
+Engine.press, Engine.release and Engine.tick when the inputs arrive as
+individual events), and never imports pygame.
+"""
+
+from collections import namedtuple
+from random import getrandbits
+
+from src.board import Board
+from src.config import config as src_config
+from src.tables import ROTATABLE, SHAPES
+
+# Inputs of the engine, which can be combined into a bitmask of held inputs
+LEFT = 1
+RIGHT = 2
+DOWN = 4
+ROTATE_CW = 8
+ROTATE_CCW = 16
+HARD_DROP = 32
+
+INPUTS = (LEFT, RIGHT, DOWN, ROTATE_CW, ROTATE_CCW, HARD_DROP)
+MOVE_INPUTS = LEFT | RIGHT | DOWN
+
+# The active tetromino, whose col and row are the offset from its spawn
+PieceState = namedtuple("PieceState", ("id", "orientation", "col", "row"))
+
+# Everything the engine exposes after a frame
+State = namedtuple("State", (
+    "frame", "board", "tetromino", "next_tetromino", "level", "score",
+    "line_cleared", "game_over"
+))
+
+
+# Everything needed to bring an engine back to an earlier frame
+Snapshot = namedtuple("Snapshot", (
+    "frame", "rows", "board_hash", "column_tops", "tetromino",
+    "next_tetromino", "level", "score", "line_cleared", "game_over",
+    "random_state", "inputs", "shift_offset", "drop_delay", "shift_delay",
+    "entry_delay", "log_length", "garbage"
+), defaults=((),))
+
+
+class Randomizer:
+    """Seedable random number generator for the tetrominoes
+
+    Implements SplitMix64, so its whole state is a single integer that is
+    cheap to store and restore.
+    """
+
+    mask = (1 << 64) - 1
+
+    def __init__(self, seed=None):
+        """Initialize an instance of Randomizer
+
+        A random seed is picked if the seed is not given.
+        """
+        self.seed = getrandbits(64) if seed is None else seed & self.mask
+        self.state = self.seed
+
+    def next(self):
+        """Get the next random 64 bit integer"""
+        self.state = (self.state + 0x9E3779B97F4A7C15) & self.mask
+        z = self.state
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & self.mask
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & self.mask
+        return z ^ (z >> 31)
+
+    def randint(self, a, b):
+        """Get a random integer N such that a <= N <= b"""
+        return a + self.next() % (b - a + 1)
+
+
+class Engine:
+    """Rules of the Tetris game without a display"""
+
+    config = src_config["game"]
+
+    def __init__(self, seed=None, record=False, size=None):
+        """Initialize an instance of Engine
+
+        The seed determines the sequence of tetrominoes, a random seed is
+        picked if it is not given. If record is True, every pressed and
+        released input is logged to self.input_log as (frame, input,
+        pressed) tuples, which is enough to replay the game. The board has
+        the (width, height) size, or the size of the playfield if it is not
+        given.
+        """
+        self.random = Randomizer(seed)
+        self.seed = self.random.seed
+        self.input_log = [] if record else None
+
+        self.frame = 0
+        self.game_over = False
+
+        self.level = 0
+        self.score = 0
+        self.line_cleared = 0
+
+        self.board = Board(*size) if size else Board()
+        self.tetromino = None
+        self.next_tetromino = None
+        self.new_tetromino()
+
+        # Set to (tetromino, cleared rows) on the frame a tetromino is locked
+        self.locked = None
+
+        # Garbage received from opponents as (lines, hole) tuples, which is
+        # pending until a tetromino is locked without clearing any row. On
+        # the frame it is added to the board, it is moved to self.raised.
+        # self.sent is the number of garbage lines to send on the frame a
+        # tetromino is locked.
+        self.garbage = []
+        self.raised = ()
+        self.sent = 0
+
+        self.inputs = 0
+
+        # Set when hard drop is pressed, the tetromino is then hard dropped
+        # on the next tick, so the lock is reported by that tick
+        self.hard_drop_pending = False
+
+        self.drop_delay = {
+            "delay": self.config["drop_delay"][min(self.level, 29)],
+            "counter": 0,
+            "soft_drop": False
+        }
+
+        self.shift_offset = None
+        self.shift_delay = {
+            "delay": self.config["das_delay"],
+            "counter": 0,
+            "delayed_auto_shift": False
+        }
+
+        self.entry_delay = {
+            "delay": self.config["entry_delay"],
+            "counter": 0,
+        }
+
+    def state(self):
+        """Get the current State of the engine"""
+        return State(self.frame, tuple(self.board.rows), self.tetromino,
+                     self.next_tetromino, self.level, self.score,
+                     self.line_cleared, self.game_over)
+
+    def snapshot(self):
+        """Get a Snapshot of the engine
+
+        The snapshot is immutable, so it can be kept and restored any number
+        of times.
+        """
+        return Snapshot(
+            self.frame, tuple(self.board.rows), self.board.hash,
+            tuple(self.board.column_tops), self.tetromino,
+            self.next_tetromino, self.level, self.score, self.line_cleared,
+            self.game_over, self.random.state, self.inputs, self.shift_offset,
+            (self.drop_delay["delay"], self.drop_delay["counter"],
+             self.drop_delay["soft_drop"]),
+            (self.shift_delay["counter"],
+             self.shift_delay["delayed_auto_shift"]),
+            self.entry_delay["counter"],
+            None if self.input_log is None else len(self.input_log),
+            tuple(self.garbage)
+        )
+
+    def restore(self, snapshot):
+        """Bring the engine back to the given Snapshot
+
+        The inputs logged after the snapshot was taken are dropped, so the
+        recorded replay leads to the restored state.
+        """
+        self.frame = snapshot.frame
+        self.board.set_rows(snapshot.rows, snapshot.board_hash,
+                            snapshot.column_tops)
+        self.tetromino = snapshot.tetromino
+        self.next_tetromino = snapshot.next_tetromino
+        self.level = snapshot.level
+        self.score = snapshot.score
+        self.line_cleared = snapshot.line_cleared
+        self.game_over = snapshot.game_over
+        self.random.state = snapshot.random_state
+        self.inputs = snapshot.inputs
+        self.shift_offset = snapshot.shift_offset
+        self.locked = None
+        self.hard_drop_pending = False
+        self.garbage = list(snapshot.garbage)
+        self.raised = ()
+        self.sent = 0
+
+        (self.drop_delay["delay"], self.drop_delay["counter"],
+         self.drop_delay["soft_drop"]) = snapshot.drop_delay
+        (self.shift_delay["counter"],
+         self.shift_delay["delayed_auto_shift"]) = snapshot.shift_delay
+        self.entry_delay["counter"] = snapshot.entry_delay
+
+        if self.input_log is not None and snapshot.log_length is not None:
+            del self.input_log[snapshot.log_length:]
+
+    def step(self, inputs):
+        """Advance the engine by one frame with the given held inputs
+
+        The inputs are a bitmask of the inputs held during the frame. Returns
+        the State after the frame.
+        """
+        self.hold(inputs)
+        self.tick()
+        return self.state()
+
+    def hold(self, inputs):
+        """Hold exactly the inputs of the given bitmask
+
+        Inputs that are no longer held are released before newly held inputs
+        are pressed.
+        """
+        changed = self.inputs ^ inputs
+        for action in INPUTS:
+            if changed & action and not inputs & action:
+                self.release(action)
+        for action in INPUTS:
+            if changed & action and inputs & action:
+                self.press(action)
+
+    def tick(self):
+        """Advance the engine by one frame"""
+        self.locked = None
+        self.raised = ()
+        self.sent = 0
+
+        if not self.game_over:
+            if self.tetromino and self.hard_drop_pending:
+                self.hard_drop_tetromino()
+            elif self.tetromino:
+                self.handle_tetromino_shift()
+                self.handle_tetromino_drop()
+            else:
+                self.handle_tetromino_entry()
+
+        self.hard_drop_pending = False
+        self.frame += 1
+
+    def press(self, action):
+        """Press the given input"""
+        if self.input_log is not None:
+            self.input_log.append((self.frame, action, True))
+        self.inputs |= action
+
+        # Rotate the tetromino when the player presses a rotate input
+        if self.tetromino and not self.game_over:
+            if action == ROTATE_CW:
+                self.rotate_tetromino()
+            elif action == ROTATE_CCW:
+                self.rotate_tetromino(counterclockwise=True)
+            elif action == HARD_DROP:
+                self.hard_drop_pending = True
+
+        self.handle_move_inputs()
+
+    def release(self, action):
+        """Release the given input"""
+        if self.input_log is not None:
+            self.input_log.append((self.frame, action, False))
+        self.inputs &= ~action
+        self.handle_move_inputs()
+
+    def place(self, piece):
+        """Lock the tetromino at the given PieceState
+
+        The tetromino is locked as if it had been moved there, which lets
+        bots play one placement at a time instead of one input at a time.
+        The engine is then advanced until the next tetromino has entered or
+        the game is over.
+        """
+        self.tetromino = piece
+        self.handle_tetromino_lock()
+        while not self.tetromino and not self.game_over:
+            self.tick()
+
+    def receive_garbage(self, lines, hole):
+        """Queue lines of garbage sent by an opponent
+
+        The garbage lines have a hole in the given column, and are added to
+        the bottom of the board once a tetromino is locked without clearing
+        any row.
+        """
+        self.garbage.append((lines, hole))
+
+    def handle_move_inputs(self):
+        """Handle the held movement inputs"""
+        # Prepare to move the tetromino if only one of the movement input is
+        # held.
+        move_inputs = self.inputs & MOVE_INPUTS
+        if move_inputs in (LEFT, RIGHT, DOWN):
+            if self.tetromino and move_inputs == DOWN:
+                self.drop_delay["soft_drop"] = True
+            elif move_inputs == LEFT:
+                self.shift_offset = -1
+            elif move_inputs == RIGHT:
+                self.shift_offset = 1
+        else:
+            self.shift_offset = None
+            if self.tetromino:
+                self.shift_delay["delayed_auto_shift"] = False
+            self.drop_delay["soft_drop"] = False
+
+    def handle_tetromino_shift(self):
+        """Handle the shift movement of the tetromino"""
+        # Try to shift self.tetromino if self.shift_offset is set
+        if self.shift_offset:
+            # Implement delayed auto shift(https://tetris.wiki/DAS)
+            if not self.shift_delay["delayed_auto_shift"]:
+                if self.move_tetromino(self.shift_offset, 0):
+                    self.shift_delay["counter"] = 0
+                else:
+                    # Instantly set the delay counter to its max value if a tap
+                    # shift is blocked.
+                    self.shift_delay["counter"] = self.shift_delay["delay"]
+                self.shift_delay["delayed_auto_shift"] = True
+            else:
+                if self.shift_delay["counter"] >= self.shift_delay["delay"]:
+                    if self.move_tetromino(self.shift_offset, 0):
+                        self.shift_delay["counter"] -= 6
+                else:
+                    self.shift_delay["counter"] += 1
+
+    def handle_tetromino_drop(self):
+        """Handle the drop movement of the tetromino"""
+        delay = self.drop_delay["delay"]
+        if self.drop_delay["soft_drop"] and\
+                delay > self.config["soft_drop_delay"]:
+            delay = self.config["soft_drop_delay"]
+
+        if self.drop_delay["counter"] >= delay:
+            # Lock the tetromino if it cannot drop
+            if not self.move_tetromino(0, 1):
+                self.handle_tetromino_lock()
+                self.drop_delay["soft_drop"] = False
+
+            self.drop_delay["counter"] = 0
+        else:
+            self.drop_delay["counter"] += 1
+
+    def handle_tetromino_entry(self):
+        """Handle the entry of the next tetromino"""
+        if self.entry_delay["counter"] >= self.entry_delay["delay"]:
+            self.new_tetromino()
+            self.entry_delay["counter"] = 0
+        else:
+            self.entry_delay["counter"] += 1
+
+    def handle_tetromino_lock(self):
+        """Lock the tetromino onto the board
+
+        Ends the game instead if the tetromino is overlapping with locked
+        blocks.
+        """
+        if self.board.piece_collides(*self.tetromino):
+            self.game_over = True
+            return
+
+        self.lock_tetromino()
+
+    def hard_drop_tetromino(self):
+        """Drop the tetromino onto the stack and lock it at once"""
+        self.move_tetromino(0, self.board.drop_distance(*self.tetromino))
+        self.handle_tetromino_lock()
+        self.drop_delay["counter"] = 0
+        self.drop_delay["soft_drop"] = False
+
+    def new_tetromino(self):
+        """Generating new tetromino"""
+        if self.next_tetromino is not None:
+            id_ = self.next_tetromino
+        else:
+            id_ = self.random.randint(0, 6)
+        self.tetromino = PieceState(id_, 0, 0, 0)
+
+        id_ = self.random.randint(0, 7)
+        if id_ == 7 or id_ == self.tetromino.id:
+            id_ = self.random.randint(0, 6)
+        self.next_tetromino = id_
+
+    def rotate_tetromino(self, counterclockwise=False):
+        """Rotate the tetromino clockwise or counterclockwise
+
+        Returns True if the tetromino rotated successfully, otherwise returns
+        False.
+        """
+        if not ROTATABLE[self.tetromino.id]:
+            return False
+
+        step = -1 if counterclockwise else 1
+        count = len(SHAPES[self.tetromino.id])
+        rotated = self.tetromino._replace(
+            orientation=(self.tetromino.orientation + step) % count
+        )
+        if not self.board.piece_fits(*rotated):
+            return False
+
+        self.tetromino = rotated
+        return True
+
+    def move_tetromino(self, col, row):
+        """Move the tetromino by the given offset
+
+        Returns True if the tetromino moved successfully, otherwise returns
+        False.
+        """
+        moved = self.tetromino._replace(col=self.tetromino.col + col,
+                                        row=self.tetromino.row + row)
+        if not self.board.piece_fits(*moved):
+            return False
+
+        self.tetromino = moved
+        return True
+
+    def lock_tetromino(self):
+        """Lock the tetromino onto the board and update the score"""
+        cleared_rows = self.board.lock_piece(*self.tetromino)
+        self.locked = (self.tetromino, cleared_rows)
+        self.tetromino = None
+
+        line_cleared = len(cleared_rows)
+        if line_cleared:
+            self.line_cleared += line_cleared
+
+            if line_cleared == 1:
+                self.score += 30 * (self.level + 1)
+            elif line_cleared == 2:
+                self.score += 100 * (self.level + 1)
+            elif line_cleared == 3:
+                self.score += 300 * (self.level + 1)
+            elif line_cleared == 4:
+                self.score += 1200 * (self.level + 1)
+
+            if self.level != self.line_cleared // 10:
+                self.level = self.line_cleared // 10
+                self.drop_delay["delay"] =\
+                    self.config["drop_delay"][min(self.level, 29)]
+
+        self.handle_garbage(line_cleared)
+
+    def handle_garbage(self, line_cleared):
+        """Send and receive garbage after a tetromino has been locked
+
+        The garbage lines earned by the cleared rows first cancel the pending
+        garbage, and the rest is sent. The pending garbage is added to the
+        board if no row was cleared, which ends the game if it pushes locked
+        blocks out of the top.
+        """
+        table = self.config["garbage_lines"]
+        attack = table[min(line_cleared, len(table) - 1)]
+        while attack and self.garbage:
+            lines, hole = self.garbage[0]
+            cancelled = min(attack, lines)
+            attack -= cancelled
+            if cancelled == lines:
+                del self.garbage[0]
+            else:
+                self.garbage[0] = (lines - cancelled, hole)
+        self.sent = attack
+
+        if line_cleared or not self.garbage:
+            return
+
+        self.raised = tuple(self.garbage)
+        self.garbage = []
+        for lines, hole in self.raised:
+            if self.board.add_garbage(lines, hole):
+                self.game_over = True
+
+
+def send_garbage(engines, random, receives=None):
+    """Send the garbage the engines earned on their last frame
+
+    The garbage of every engine is sent to the next engine whose game is not
+    over, with a hole in a column picked by the given Randomizer. If given,
+    receives tells of every engine whether it can be sent garbage.
+    """
+    if receives is None:
+        receives = [True] * len(engines)
+
+    for i, engine in enumerate(engines):
+        if not engine.sent:
+            continue
+
+        for j in range(1, len(engines)):
+            k = (i + j) % len(engines)
+            target = engines[k]
+            if receives[k] and not target.game_over:
+                hole = random.randint(0, target.board.width - 1)
+                target.receive_garbage(engine.sent, hole)
+                break
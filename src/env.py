@@ -0,0 +1,137 @@
+"""
+Reinforcement learning environment around the Tetris game engine.
+
+The environment follows the reset/step interface of Gym without depending
+on it, and never imports pygame.
+"""
+
+import numpy as np
+
+from src.engine import Engine, Randomizer
+from src.features import unpack_rows
+from src.search import placements
+
+# Kinds of actions the environment can be stepped with
+FRAME = "frame"
+PLACEMENT = "placement"
+
+
+class TetrisEnv:
+    """Environment that steps the game engine one frame or placement at a time
+
+    In FRAME mode, an action is the bitmask of the engine inputs held during
+    the next frame, so there are 64 actions. In PLACEMENT mode, an action is
+    an index into self.placements, the placements the current tetromino can
+    reach, and the tetromino is locked there.
+
+    Observations are a dict of NumPy arrays that are allocated once and
+    overwritten by every reset and step, so they have to be copied to be
+    kept:
+
+    - board: occupancy of every cell with the shape (rows, cols), where row
+      0 is the top row of the vanish zone
+    - piece: id, orientation, col and row offset of the current tetromino,
+      which are all -1 while no tetromino is on the board
+    - next_tetromino, level and score: 0-d arrays
+
+    The reward of a step is the increase of the score.
+    """
+
+    action_count = 64
+
+    def __init__(self, mode=FRAME, seed=None, size=None):
+        """Initialize an instance of TetrisEnv
+
+        The seed determines the seeds of the games played after every reset
+        that is not given its own seed. The board has the (width, height)
+        size, or the size of the playfield if it is not given.
+        """
+        if mode not in (FRAME, PLACEMENT):
+            raise ValueError(f"unknown mode {mode!r}")
+        self.mode = mode
+        self.seeds = Randomizer(seed)
+        self.size = size
+
+        self.engine = Engine(0, size=size)
+        board = self.engine.board
+        row_count = len(board.rows)
+        self.obs = {
+            "board": np.zeros((row_count, board.width), dtype=np.uint8),
+            "piece": np.full(4, -1, dtype=np.int64),
+            "next_tetromino": np.zeros((), dtype=np.int64),
+            "level": np.zeros((), dtype=np.int64),
+            "score": np.zeros((), dtype=np.int64)
+        }
+
+        # Buffers the board occupancy is unpacked through
+        self.rows = np.zeros(row_count, dtype=np.int64)
+        self.bits = np.zeros((row_count, board.width), dtype=np.int64)
+        self.shifts = np.arange(board.width, dtype=np.int64)
+        self.board_hash = None
+
+        self.placements = []
+
+    def reset(self, seed=None):
+        """Start a new game and get its first observation"""
+        self.engine = Engine(self.seeds.next() if seed is None else seed,
+                             size=self.size)
+        self.board_hash = None
+        self.update_placements()
+        return self.observe()
+
+    def step(self, action):
+        """Advance the game with the given action
+
+        Returns the observation, the reward, whether the game is over and a
+        dict of extra information.
+        """
+        engine = self.engine
+        score = engine.score
+        if self.mode == FRAME:
+            engine.hold(action)
+            engine.tick()
+        else:
+            # A tetromino without any placement can only end the game
+            if self.placements:
+                engine.place(self.placements[action].piece)
+            else:
+                engine.place(engine.tetromino)
+            self.update_placements()
+
+        return self.observe(), engine.score - score, engine.game_over, {
+            "frame": engine.frame, "line_cleared": engine.line_cleared
+        }
+
+    def update_placements(self):
+        """Find the placements of the current tetromino in PLACEMENT mode"""
+        engine = self.engine
+        if self.mode != PLACEMENT or engine.game_over:
+            self.placements = []
+        else:
+            self.placements = placements(engine.board, engine.tetromino.id,
+                                         engine.tetromino)
+
+    def observe(self):
+        """Write the state of the game into the observation buffers"""
+        engine = self.engine
+        obs = self.obs
+
+        # The board only changes when a tetromino is locked
+        board = engine.board
+        if board.hash != self.board_hash and board.width > 62:
+            # Rows wider than an int64 cannot go through the buffers
+            self.board_hash = board.hash
+            obs["board"][:] = unpack_rows([board.rows], board.width)[0]
+        elif board.hash != self.board_hash:
+            self.board_hash = board.hash
+            self.rows[:] = board.rows
+            np.right_shift(self.rows[:, np.newaxis], self.shifts,
+                           out=self.bits)
+            np.bitwise_and(self.bits, 1, out=self.bits)
+            np.copyto(obs["board"], self.bits, casting="unsafe")
+
+        obs["piece"][:] = engine.tetromino or -1
+        obs["next_tetromino"][...] = engine.next_tetromino
+        obs["level"][...] = engine.level
+        obs["score"][...] = engine.score
+        return obs
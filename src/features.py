@@ -0,0 +1,121 @@
+"""
+Heuristic features of many boards computed at once with NumPy.
+
+Boards are stacked into a bool array with the shape (boards, rows, cols),
+the same layout as the boards of src.batch.BatchEngine, where row 0 is the
+top row of the vanish zone.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+# Features of every board of a stack. Heights has the shape (boards, cols),
+# every other feature has the shape (boards,).
+Features = namedtuple("Features", (
+    "heights", "aggregate_height", "holes", "bumpiness", "wells",
+    "row_transitions", "complete_lines"
+))
+
+
+def unpack_rows(rows, width):
+    """Convert row bitmasks to a stack of boards
+
+    rows has the shape (boards, rows), with bit n of an integer set if the
+    cell in column n of that row is occupied, like the rows of a
+    src.board.Board. Returns a bool array with the shape (boards, rows,
+    width).
+    """
+    if width <= 62:
+        rows = np.asarray(rows, dtype=np.int64)
+        return (rows[..., np.newaxis] >> np.arange(width) & 1).astype(bool)
+
+    # Rows of wider boards do not fit in an int64, so they are unpacked from
+    # their little endian bytes instead
+    rows = np.asarray(rows, dtype=object)
+    size = (width + 7) // 8
+    data = b"".join(int(row).to_bytes(size, "little") for row in rows.flat)
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8),
+                         bitorder="little")
+    return bits.reshape(rows.shape + (size * 8,))[..., :width].astype(bool)
+
+
+def lock_cells(board, cells):
+    """Lock each of the given sets of cells onto a copy of a board
+
+    board has the shape (rows, cols), and cells the shape (sets, cells, 2)
+    with the (col, row) of every cell as an index into the board. The
+    complete rows of every copy are cleared. Returns the stack of boards and
+    the number of rows cleared from each.
+    """
+    cells = np.asarray(cells, dtype=np.int64)
+    count = len(cells)
+    boards = np.repeat(board[np.newaxis], count, axis=0)
+    boards[np.arange(count)[:, np.newaxis], cells[:, :, 1],
+           cells[:, :, 0]] = True
+
+    return boards, clear_rows(boards)
+
+
+def clear_rows(boards):
+    """Clear the complete rows of a stack of boards in place
+
+    boards has the shape (boards, rows, cols). The rows above the cleared
+    rows of a board move downward. Returns the number of rows cleared from
+    each board.
+    """
+    full = boards.all(axis=2)
+    cleared = np.count_nonzero(full, axis=1)
+    clearing = np.flatnonzero(cleared)
+    if len(clearing):
+        # Move the complete rows to the top while keeping the order of the
+        # other rows, then empty them.
+        order = np.argsort(~full[clearing], axis=1, kind="stable")
+        moved = np.take_along_axis(boards[clearing],
+                                   order[:, :, np.newaxis], axis=1)
+        moved[np.arange(moved.shape[1]) <
+              cleared[clearing, np.newaxis]] = False
+        boards[clearing] = moved
+
+    return cleared
+
+
+def batch_features(boards):
+    """Get the Features of every board of a stack
+
+    The height of a column is counted from the bottom of the board to its
+    highest occupied cell. A hole is an empty cell under an occupied cell of
+    the same column. The bumpiness is the sum of the height differences of
+    adjacent columns, and the wells are the sum of the depths of the columns
+    that are lower than both of their neighbours, where the walls count as
+    neighbours of infinite height. The row transitions are the changes
+    between occupied and empty cells along the rows that are not empty,
+    where the walls count as occupied cells.
+    """
+    boards = np.asarray(boards, dtype=bool)
+    count, row_count, width = boards.shape
+
+    occupied = boards.any(axis=1)
+    heights = np.where(occupied, row_count - boards.argmax(axis=1), 0)
+
+    # Every cell at or under the highest occupied cell of its column
+    covered = np.logical_or.accumulate(boards, axis=1)
+    holes = np.count_nonzero(covered & ~boards, axis=(1, 2))
+
+    bumpiness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+
+    walls = np.full((count, 1), row_count, dtype=heights.dtype)
+    padded = np.concatenate((walls, heights, walls), axis=1)
+    depths = np.minimum(padded[:, :-2], padded[:, 2:]) - heights
+    wells = np.maximum(depths, 0).sum(axis=1)
+
+    walled = np.ones((count, row_count, width + 2), dtype=bool)
+    walled[:, :, 1:-1] = boards
+    transitions = np.count_nonzero(walled[:, :, 1:] != walled[:, :, :-1],
+                                   axis=2)
+    row_transitions = np.where(boards.any(axis=2), transitions, 0).sum(axis=1)
+
+    complete_lines = np.count_nonzero(boards.all(axis=2), axis=1)
+
+    return Features(heights, heights.sum(axis=1), holes, bumpiness, wells,
+                    row_transitions, complete_lines)
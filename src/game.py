@@ -1,64 +1,168 @@
 """
-Game engine for the Tetris game.
+Pygame frontend of the Tetris game.
+
+The rules of the game are implemented by src.engine.Engine, the frontend
+forwards the player's input to it and draws what changed.
 """
 
-from random import randint
+from collections import deque, namedtuple
+from time import perf_counter
 
 import pygame
 
 from src.config import config as src_config
+from src.engine import (DOWN, HARD_DROP, LEFT, RIGHT, ROTATE_CCW, ROTATE_CW,
+                        Engine)
 from src.playfield import Playfield
+from src.profiler import ProfilerOverlay
+from src.render import DirtyRects, GlyphCache
+from src.replay import from_engine, save
 from src.tetromino import Tetromino
 
 
+# States of the game
+PLAYING = "playing"
+PAUSED = "paused"
+GAME_OVER = "game over"
+
+# Snapshot of the engine and the colors of the locked blocks of the game
+GameSnapshot = namedtuple("GameSnapshot", ("engine", "colors"))
+
+
+class FixedTimestep:
+    """Clock of the logic ticks, which run at a fixed rate whatever the
+    framerate is"""
+
+    config = src_config["game"]
+
+    def __init__(self):
+        """Initialize an instance of FixedTimestep"""
+        self.lag = 0.0
+        self.last_tick_time = None
+        self.reset()
+
+    def reset(self):
+        """Start counting the lag again with one tick due
+
+        Time spent before the reset is not caught up with.
+        """
+        self.lag = 1 / self.config["tick_rate"]
+        self.last_tick_time = None
+
+    def due_ticks(self):
+        """Get the number of logic ticks to run before the next frame is drawn
+
+        The time since the previous frame is added to the lag, and a tick is
+        due for every tick_rate-th of a second of lag. A slow frame is caught
+        up with by running several ticks in the next frame, but no more than
+        max_catch_up_ticks, past which the remaining lag is dropped and the
+        game slows down instead.
+        """
+        now = perf_counter()
+        if self.last_tick_time is not None:
+            self.lag += now - self.last_tick_time
+        self.last_tick_time = now
+
+        tick_time = 1 / self.config["tick_rate"]
+        ticks = int(self.lag / tick_time)
+        if ticks > self.config["max_catch_up_ticks"]:
+            ticks = self.config["max_catch_up_ticks"]
+            self.lag %= tick_time
+        else:
+            self.lag -= ticks * tick_time
+        return ticks
+
+
 class Game:
-    """Game engine for the Tetris game"""
+    """Pygame frontend for the Tetris game engine
+
+    The game is either PLAYING, PAUSED or at GAME_OVER. Only a playing game
+    runs at the full framerate, the other states block on input events.
+
+    The engine is ticked at the fixed tick_rate whatever the framerate is, so
+    the speed of the game does not depend on how fast frames are drawn.
+
+    A snapshot is taken whenever a tetromino spawns, and the undo key
+    restores the last ones, even after the game is over.
+    """
 
     config = src_config["game"]
 
-    def __init__(self, display):
-        """Initialize the game engine"""
+    # Keys that are mapped to the inputs of the engine
+    key_inputs = {
+        pygame.K_LEFT: LEFT,
+        pygame.K_RIGHT: RIGHT,
+        pygame.K_DOWN: DOWN,
+        pygame.K_x: ROTATE_CW,
+        pygame.K_z: ROTATE_CCW,
+        pygame.K_SPACE: HARD_DROP
+    }
+
+    # Keys that pause and resume the game
+    pause_keys = (pygame.K_p, pygame.K_ESCAPE)
+
+    # Key that takes back the last tetromino
+    undo_key = pygame.K_BACKSPACE
+
+    def __init__(self, display, seed=None, record=None, profiler=None,
+                 key_inputs=None, layout=None, pilot=None):
+        """Initialize the game
+
+        The seed determines the sequence of tetrominoes. If record is given,
+        the replay of the game is saved to that path when the game is over or
+        quit. If a FrameProfiler is given, the phases of every frame are timed
+        and shown over the display.
+
+        The key_inputs replace the keys mapped to the inputs of the engine.
+        The layout can hold the playfield "area" and any position of the HUD
+        config, which replace those of the config. If an InputPilot is
+        given, it holds the inputs of every frame instead of the player.
+        """
         self.display = display
+        self.seed = seed
+        self.record = record
+        self.profiler = profiler
+        self.key_inputs = key_inputs or self.key_inputs
+        self.layout = layout or {}
+        self.pilot = pilot
         self.quit = False
+        self.state = None
+        self.timestep = FixedTimestep()
 
-        self.changed_areas = []
+        self.changed_areas = DirtyRects()
 
-        self.hud = GameHUD(self)
-        self.hud.level = 0
-        self.hud.score = 0
-        self.hud.line_cleared = 0
+        # Snapshots taken whenever a tetromino spawns, for undo
+        self.snapshots = deque(maxlen=self.config["undo_limit"])
 
-        self.playfield = Playfield(self.display)
+        self.engine = Engine(seed, record=record is not None)
+
+        self.hud = GameHUD(self)
+        self.hud.level = self.engine.level
+        self.hud.score = self.engine.score
+        self.hud.line_cleared = self.engine.line_cleared
+
+        self.overlay = None
+        if self.profiler:
+            self.overlay = ProfilerOverlay(
+                self.profiler, self.display, self.hud.font,
+                self.hud.position("profiler_topleft")
+            )
+
+        self.playfield = Playfield(self.display, self.engine.board,
+                                   area=self.layout.get("area"))
         self.tetromino = None
-        self.next_tetromino = None
+        self.ghost = None
         self.new_tetromino()
 
-        self.move_keydowns = set()
-
-        self.drop_delay = {
-            "delay": self.config["drop_delay"][min(self.hud.level, 29)],
-            "counter": 0,
-            "soft_drop": False
-        }
-
-        self.shift_offset = None
-        self.shift_delay = {
-            "delay": self.config["das_delay"],
-            "counter": 0,
-            "delayed_auto_shift": False
-        }
-
-        self.entry_delay = {
-            "delay": self.config["entry_delay"],
-            "counter": 0,
-        }
+        self.set_state(PLAYING)
 
     def reinit(self):
         """Reinitialize the game"""
-        self.__init__(self.display)
+        self.__init__(self.display, self.seed, self.record, self.profiler,
+                      self.key_inputs, self.layout, self.pilot)
 
     def loop(self):
-        """Main game loop of the game engine"""
+        """Main game loop of the game"""
         # Initialize clock, which is used to cap the framerate
         clock = pygame.time.Clock()
 
@@ -66,182 +170,293 @@ class Game:
         pygame.display.flip()
 
         while not self.quit:
-            self.handle_events()
-
-            if self.tetromino:
-                self.handle_tetromino_shift()
-                self.handle_tetromino_drop()
+            # Only the frames of a playing game are profiled
+            profiler = self.state == PLAYING and self.profiler
+            if profiler:
+                profiler.start()
+                self.changed_areas.extend(self.overlay.restore())
+
+            if self.state == PLAYING:
+                self.handle_events()
+                if profiler:
+                    profiler.mark("events")
+
+                # Run the logic ticks that are due, every one of them has to
+                # be drawn since the engine only reports what changed during
+                # its last tick
+                for _ in range(self.timestep.due_ticks()):
+                    if self.state != PLAYING:
+                        break
+                    self.control()
+                    self.engine.tick()
+                    if profiler:
+                        profiler.mark("logic")
+
+                    self.draw()
+                    if profiler:
+                        profiler.mark("render")
             else:
-                self.handle_tetromino_entry()
+                self.wait_events()
 
             # Update changed portion of the display
-            pygame.display.update(self.changed_areas)
-            self.changed_areas = []
+            if profiler:
+                self.changed_areas.extend(self.overlay.draw())
+            pygame.display.update(self.changed_areas.flush())
+            if profiler:
+                profiler.mark("display")
+
+            # Cap the framerate, which is much lower while the game is idle
+            # and not capped at all if the fps is 0
+            if self.state == PLAYING:
+                clock.tick(self.config["fps"])
+            else:
+                clock.tick(self.config["idle_fps"])
+            if profiler:
+                profiler.mark("sleep")
+                profiler.end()
+
+        if self.state != GAME_OVER:
+            self.save_replay()
+
+    def set_state(self, state):
+        """Switch the game to the given state"""
+        self.state = state
+
+        # Time spent outside of a playing game is not caught up with
+        if state == PLAYING:
+            self.timestep.reset()
 
-            # Cap the framerate
-            clock.tick(self.config["fps"])
+        caption = src_config["display"]["caption"]
+        if state != PLAYING:
+            caption = f"{caption} - {state.title()}"
+        pygame.display.set_caption(caption)
 
     def handle_events(self):
-        """Handle inpute events"""
+        """Handle all pending input events"""
         for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self.quit = True
+            self.handle_event(event)
 
+    def wait_events(self):
+        """Handle input events while the game is idle
+
+        Blocks until an event arrives or the idle timeout has passed, instead
+        of polling for events.
+        """
+        event = pygame.event.wait(self.config["idle_timeout"])
+        if event.type != pygame.NOEVENT:
+            self.handle_event(event)
+        self.handle_events()
+
+    def handle_event(self, event):
+        """Handle an input event according to the state of the game"""
+        if event.type == pygame.QUIT:
+            self.quit = True
+
+        elif self.state == PLAYING:
+            if event.type == pygame.WINDOWFOCUSLOST:
+                self.pause()
+            elif event.type == pygame.KEYDOWN and\
+                    event.key in self.pause_keys:
+                self.pause()
+            elif event.type == pygame.KEYDOWN and event.key == self.undo_key:
+                self.undo()
             elif event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                action = self.key_inputs.get(event.key)
+                if action is None:
+                    return
+
                 if event.type == pygame.KEYDOWN:
-                    if event.key in (pygame.K_LEFT, pygame.K_RIGHT,
-                                     pygame.K_DOWN):
-                        self.move_keydowns.add(event.key)
-
-                    # Rotate the tetromino when the player presses x or z key
-                    elif self.tetromino and event.key == pygame.K_x:
-                        self.rotate_tetromino()
-                    elif self.tetromino and event.key == pygame.K_z:
-                        self.rotate_tetromino(counterclockwise=True)
+                    self.engine.press(action)
                 else:
-                    if event.key in (pygame.K_LEFT, pygame.K_RIGHT,
-                                     pygame.K_DOWN):
-                        self.move_keydowns.discard(event.key)
-
-                # Prepare to move the tetromino if only one of the movement
-                # key is pressed.
-                if len(self.move_keydowns) == 1:
-                    if self.tetromino and pygame.K_DOWN in self.move_keydowns:
-                        self.drop_delay["soft_drop"] = True
-                    elif pygame.K_LEFT in self.move_keydowns:
-                        self.shift_offset = -1
-                    elif pygame.K_RIGHT in self.move_keydowns:
-                        self.shift_offset = 1
-                else:
-                    self.shift_offset = None
-                    if self.tetromino:
-                        self.shift_delay["delayed_auto_shift"] = False
-                    self.drop_delay["soft_drop"] = False
-
-    def handle_tetromino_shift(self):
-        """Handle the shift movement of the tetromino"""
-        # Try to shift self.tetromino if self.shift_offset is set
-        if self.shift_offset:
-            # Implement delayed auto shift(https://tetris.wiki/DAS)
-            if not self.shift_delay["delayed_auto_shift"]:
-                if self.move_tetromino(self.shift_offset, 0):
-                    self.shift_delay["counter"] = 0
-                else:
-                    # Instantly set the delay counter to its max value if a tap
-                    # shift is blocked.
-                    self.shift_delay["counter"] = self.shift_delay["delay"]
-                self.shift_delay["delayed_auto_shift"] = True
-            else:
-                if self.shift_delay["counter"] >= self.shift_delay["delay"]:
-                    if self.move_tetromino(self.shift_offset, 0):
-                        self.shift_delay["counter"] -= 6
-                else:
-                    self.shift_delay["counter"] += 1
-
-    def handle_tetromino_drop(self):
-        """Handle the drop movement of the tetromino"""
-        delay = self.drop_delay["delay"]
-        if self.drop_delay["soft_drop"] and\
-                delay > self.config["soft_drop_delay"]:
-            delay = self.config["soft_drop_delay"]
-
-        if self.drop_delay["counter"] >= delay:
-            # Lock the tetromino if it cannot drop
-            if not self.move_tetromino(0, 1):
-                self.handle_tetromino_lock()
-                self.drop_delay["soft_drop"] = False
-
-            self.drop_delay["counter"] = 0
-        else:
-            self.drop_delay["counter"] += 1
+                    self.engine.release(action)
+
+                # A rotation happens as soon as the key is pressed
+                self.draw_tetromino()
+
+        elif self.state == PAUSED:
+            if event.type == pygame.KEYDOWN and event.key in self.pause_keys:
+                self.set_state(PLAYING)
+
+        elif self.state == GAME_OVER:
+            # Restart the game when the player presses enter
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
+                self.restart()
+            elif event.type == pygame.KEYDOWN and event.key == self.undo_key:
+                self.undo()
+
+    def save_replay(self):
+        """Save the replay of the game if it is being recorded"""
+        if self.record is not None:
+            save(self.record, from_engine(self.engine))
 
-    def handle_tetromino_entry(self):
-        """Handle the entry of the next tetromino"""
-        if self.entry_delay["counter"] >= self.entry_delay["delay"]:
+    def pause(self):
+        """Pause the game
+
+        Every held input is released, since the keys may be released while
+        the game is paused.
+        """
+        self.release_inputs()
+        self.set_state(PAUSED)
+
+    def release_inputs(self):
+        """Release every input held in the engine"""
+        for action in self.key_inputs.values():
+            if self.engine.inputs & action:
+                self.engine.release(action)
+
+    def control(self):
+        """Let the pilot hold the inputs of the next frame, if any"""
+        if self.pilot:
+            self.engine.hold(self.pilot.inputs(self.engine))
+
+    def update(self):
+        """Advance the game by one frame and draw what changed"""
+        self.control()
+        self.engine.tick()
+        self.draw()
+
+    def draw(self):
+        """Draw what the engine changed during the last frame"""
+        if self.engine.game_over:
+            self.set_state(GAME_OVER)
+            self.save_replay()
+            return
+
+        if self.engine.locked:
+            self.lock_tetromino(*self.engine.locked)
+        elif self.engine.tetromino and not self.tetromino:
             self.new_tetromino()
-            self.entry_delay["counter"] = 0
         else:
-            self.entry_delay["counter"] += 1
+            self.draw_tetromino()
 
-    def handle_tetromino_lock(self):
-        """Lock the tetromino onto the playfield
+    def new_tetromino(self):
+        """Draw the tetromino that has just been spawned by the engine"""
+        self.snapshots.append(self.snapshot())
+        self.create_tetromino()
 
-        Also calls self.game_over if the tetromino is overlapping with locked
-        blocks.
+    def create_tetromino(self):
+        """Create the sprites of the tetromino of the engine and draw them
+
+        The ghost of the tetromino shows where it would land, in the color
+        of the tetromino shaded towards the background by ghost_shade. No
+        ghost is shown if ghost_shade is None.
+        """
+        piece = self.engine.tetromino
+        self.tetromino = Tetromino(self.playfield, piece.id)
+
+        self.ghost = None
+        shade = self.config["ghost_shade"]
+        if shade is not None:
+            color = self.tetromino.config[piece.id]["color"]
+            bgd_color = self.playfield.config["bgd_color"]
+            self.ghost = Tetromino(self.playfield, piece.id, tuple(
+                round(bgd + (value - bgd) * shade)
+                for value, bgd in zip(color, bgd_color)
+            ))
+
+        self.place_tetromino(piece)
+
+    def place_tetromino(self, piece, landed=False):
+        """Draw the tetromino and its ghost at the given piece
+
+        If the piece has landed, the ghost is drawn at the piece, since the
+        board may already hold the piece and no longer show where it lands.
         """
-        if self.playfield.locked_collide(self.tetromino):
-            self.handle_game_over()
+        self.tetromino.place(piece.orientation, piece.col, piece.row)
+        self.tetromino.clear()
+
+        # The ghost is drawn again even if it did not move, since clearing
+        # the tetromino may have erased the part of it under the tetromino
+        if self.ghost:
+            distance = 0 if landed else\
+                self.engine.board.drop_distance(*piece)
+            self.ghost.place(piece.orientation, piece.col,
+                             piece.row + distance)
+            self.ghost.clear()
+            self.changed_areas.extend(self.ghost.draw())
+
+        self.changed_areas.extend(self.tetromino.draw())
+
+    def snapshot(self):
+        """Get a GameSnapshot of the game
+
+        The snapshot only holds immutable values, and shares the rows of
+        colors that did not change with the previous snapshots.
+        """
+        return GameSnapshot(self.engine.snapshot(),
+                            tuple(self.playfield.colors))
+
+    def restore(self, snapshot):
+        """Bring the game back to the given GameSnapshot and draw it"""
+        self.engine.restore(snapshot.engine)
+        self.changed_areas.extend(self.playfield.restore(snapshot.colors))
+
+        self.tetromino = None
+        self.ghost = None
+        if self.engine.tetromino:
+            self.create_tetromino()
+
+        self.hud.level = self.engine.level
+        self.hud.score = self.engine.score
+        self.hud.line_cleared = self.engine.line_cleared
+
+        if self.engine.game_over:
+            self.set_state(GAME_OVER)
+        elif self.state == GAME_OVER:
+            self.set_state(PLAYING)
+
+    def undo(self):
+        """Take back the current tetromino, or the previous one if the
+        current one has not moved since it spawned"""
+        if self.snapshots and\
+                self.snapshots[-1].engine.frame == self.engine.frame:
+            self.snapshots.pop()
+        if not self.snapshots:
             return
 
-        self.lock_tetromino()
+        # The keys held now do not belong to the restored frame
+        self.restore(self.snapshots[-1])
+        self.release_inputs()
 
-    def handle_game_over(self):
-        """Game Over
+    def draw_tetromino(self, piece=None, landed=False):
+        """Draw the tetromino if it has been moved or rotated
 
-        Quit or restart the game based on the player's input.
+        The tetromino is drawn where the engine has its tetromino, or at the
+        given piece, which has landed if landed is True.
         """
-        while True:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.quit = True
-                    return
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_RETURN:
-                        self.restart()
-                        return
+        piece = piece or self.engine.tetromino
+        if not piece or not self.tetromino:
+            return
 
-    def new_tetromino(self):
-        """Generating new tetromino"""
-        if self.next_tetromino:
-            self.tetromino = self.next_tetromino
-        else:
-            self.tetromino = Tetromino(self.playfield, randint(0, 6))
+        if (piece.orientation, piece.col, piece.row) != (
+                self.tetromino.curr_rotate_offset, self.tetromino.col,
+                self.tetromino.row):
+            self.place_tetromino(piece, landed)
 
-        self.tetromino.clear()
-        self.changed_areas = self.tetromino.draw()
-
-        id_ = randint(0, 7)
-        if id_ == 7 or id_ == self.tetromino.id:
-            id_ = randint(0, 6)
-        self.next_tetromino = Tetromino(self.playfield, id_)
-
-    def rotate_tetromino(self, *args, **kwargs):
-        """Rotate the tetromino and update it onto the display"""
-        if self.tetromino.rotate(*args, **kwargs):
-            self.tetromino.clear()
-            self.changed_areas += self.tetromino.draw()
-
-    def move_tetromino(self, *args, **kwargs):
-        """Move the tetromino and update it onto the display"""
-        if self.tetromino.move(*args, **kwargs):
-            self.tetromino.clear()
-            self.changed_areas += self.tetromino.draw()
-            return True
-        return False
-
-    def lock_tetromino(self, *args, **kwargs):
-        """Lock the tetromino and update it onto the display"""
-        line_cleared = self.playfield.lock_piece(self.tetromino)
-        self.tetromino.clear()
-        self.playfield.locked_blocks.clear()
-        self.changed_areas += self.playfield.locked_blocks.draw()
-
-        if line_cleared:
-            self.hud.line_cleared += line_cleared
-
-            if line_cleared == 1:
-                self.hud.score += 30 * (self.hud.level + 1)
-            elif line_cleared == 2:
-                self.hud.score += 100 * (self.hud.level + 1)
-            elif line_cleared == 3:
-                self.hud.score += 300 * (self.hud.level + 1)
-            elif line_cleared == 4:
-                self.hud.score += 1200 * (self.hud.level + 1)
-
-            if self.hud.level != self.hud.line_cleared // 10:
-                self.hud.level = self.hud.line_cleared // 10
-                self.drop_delay["delay"] =\
-                    self.config["drop_delay"][min(self.hud.level, 29)]
+    def lock_tetromino(self, piece, cleared_rows):
+        """Draw the tetromino that has just been locked by the engine
+
+        Only the blocks of the tetromino are drawn, and the rows above cleared
+        rows are scrolled down, instead of drawing every locked block again.
+        """
+        # The ghost is left under the locked blocks, which cover it exactly
+        self.draw_tetromino(piece, landed=True)
+        self.playfield.lock_sprites(self.tetromino, cleared_rows)
+        self.ghost = None
+        self.changed_areas.extend(
+            self.playfield.draw_line_clear(cleared_rows)
+        )
+        if self.engine.raised:
+            self.changed_areas.extend(
+                self.playfield.add_garbage(self.engine.raised)
+            )
+
+        if self.hud.line_cleared != self.engine.line_cleared:
+            self.hud.line_cleared = self.engine.line_cleared
+        if self.hud.score != self.engine.score:
+            self.hud.score = self.engine.score
+        if self.hud.level != self.engine.level:
+            self.hud.level = self.engine.level
 
     def restart(self):
         """Restart the game"""
@@ -262,6 +477,11 @@ class GameHUD:
         self.game = game
         self.font = pygame.font.Font(self.config["font"]["face"],
                                      self.config["font"]["size"])
+        self.glyphs = GlyphCache(self.font, self.config["font"]["color"],
+                                 self.config["font"]["bgd_color"])
+
+        # Area of the last text drawn at each position
+        self.text_rects = {}
 
         self._level = None
         self._score = None
@@ -277,7 +497,7 @@ class GameHUD:
         """Set the current level of the game session"""
         self._level = value
         text = f"{self._level:02}" if self._level < 100 else "99+"
-        self.draw_text(text, topleft=self.config["level_topleft"])
+        self.draw_text(text, topleft=self.position("level_topleft"))
 
     @property
     def score(self):
@@ -289,7 +509,7 @@ class GameHUD:
         """Set the current score of the game session"""
         self._score = value
         text = f"{self._score:06}" if self._score < 1000000 else "999999+"
-        self.draw_text(text, midtop=self.config["score_midtop"])
+        self.draw_text(text, midtop=self.position("score_midtop"))
 
     @property
     def line_cleared(self):
@@ -302,7 +522,12 @@ class GameHUD:
         self._line_cleared = value
         text =\
             f"{self._line_cleared:03}" if self._line_cleared < 1000 else "999+"
-        self.draw_text(text, topright=self.config["line_cleared_topright"])
+        self.draw_text(text, topright=self.position("line_cleared_topright"))
+
+    def position(self, name):
+        """Get the position of the given name from the layout of the game,
+        or from the config if the layout does not have it"""
+        return self.game.layout.get(name, self.config[name])
 
     def draw_text(self, text, **kwargs):
         """Draw the given text onto the display
@@ -310,8 +535,13 @@ class GameHUD:
         The keyword arguments will be applied to the attribute of the rectangle
         of the text.
         """
-        surf = self.font.render(text, 1, self.config["font"]["color"],
-                                self.config["font"]["bgd_color"])
-        rect = surf.get_rect(**kwargs)
-        self.game.display.blit(surf, rect)
-        self.game.changed_areas.append(rect)
+        # Erase the previous text at the same position, which may be wider
+        key = tuple(kwargs.items())
+        prev_rect = self.text_rects.get(key)
+        if prev_rect:
+            self.game.display.fill(self.config["font"]["bgd_color"], prev_rect)
+            self.game.changed_areas.add(prev_rect)
+
+        rect = self.glyphs.draw(self.game.display, text, **kwargs)
+        self.text_rects[key] = rect
+        self.game.changed_areas.add(rect)
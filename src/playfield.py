@@ -5,31 +5,71 @@ https://tetris.wiki/Playfield
 
 import pygame
 
+from src.board import Board
 from src.config import config as src_config
+from src.render import StackImage
 from src.tetromino import Block
 
+# Ways of drawing the locked blocks
+SPRITES = "sprites"
+ARRAY = "array"
+
 
 class Playfield:
-    """The surface into which tetrominoes fall"""
+    """The surface into which tetrominoes fall
+
+    With the SPRITES renderer, every locked block is a sprite of
+    self.locked_blocks. With the ARRAY renderer, the locked blocks are only
+    kept as the palette indices of self.colors, and drawn from them as one
+    StackImage.
+    """
 
     config = src_config["playfield"]
 
-    def __init__(self, display):
-        """Initialize an instance of Playfield"""
+    def __init__(self, display, board=None, renderer=None, area=None):
+        """Initialize an instance of Playfield
+
+        The playfield shows the given board, or a new empty board if it is
+        not given, in the given area of the display. The renderer and the
+        area are taken from the config if they are not given.
+        """
         self.display = display
+        self.renderer = renderer or self.config["renderer"]
+        if self.renderer not in (SPRITES, ARRAY):
+            raise ValueError(f"unknown renderer {self.renderer!r}")
 
-        self.surface = self.display.subsurface(self.config["area"])
+        area = area or self.config["area"]
+        self.surface = self.display.subsurface(area)
         self.surface.fill(self.config["bgd_color"])
 
+        self.board = board if board is not None else Board()
+
+        # The cells are sized so that the board fills the area
+        self.cell_size = (area[2] // self.board.width,
+                          area[3] // self.board.height)
+
         self.locked_blocks = LockedBlocked(self)
 
+        # Colors of the locked blocks as one bytes object per board row,
+        # holding an index into the palette for every column, where 0 is
+        # empty. The rows are immutable, so snapshots can share them.
+        self.palette = [None] + [
+            tuple(tetromino["color"]) for tetromino in src_config["tetromino"]
+        ]
+        self.colors = [bytes(self.board.width)] * len(self.board.rows)
+
+        self.stack = None
+        if self.renderer == ARRAY:
+            self.stack = StackImage((self.board.width, self.board.height),
+                                    self.cell_size, self.config["bgd_color"])
+
     def get_x(self, col):
         """Get the x coordinate of the given column in the playfield"""
-        return col * self.config["cell_size"][0]
+        return col * self.cell_size[0]
 
     def get_y(self, row):
         """Get the y coordinate of the given row in the playfield"""
-        return row * self.config["cell_size"][1]
+        return row * self.cell_size[1]
 
     def valid_space(self, piece):
         """Check if the given piece is in the valid space of the playfield
@@ -37,7 +77,7 @@ class Playfield:
         Returns True if the given piece is contained withing the playfield and
         its not colliding with locked blocks, otherwise returns False.
         """
-        return self.contains(piece) and (not self.locked_collide(piece))
+        return self.board.fits(piece.cells())
 
     def contains(self, piece):
         """Check if the given piece is contained within the playfield
@@ -45,12 +85,7 @@ class Playfield:
         Returns True if the given piece is contained within the playfield,
         otherwise returnns False.
         """
-        vanish_zone = pygame.Rect(self.config["vanish_zone"])
-        rect = self.surface.get_rect().union(vanish_zone)
-        for block in piece.sprites():
-            if not rect.contains(block.rect):
-                return False
-        return True
+        return self.board.contains(piece.cells())
 
     def locked_collide(self, piece):
         """Check if the given piece is colliding with locked blocks
@@ -58,25 +93,157 @@ class Playfield:
         Returns True if the given piece is colliding with locked blocks,
         otherwise returns False.
         """
-        return bool(pygame.sprite.groupcollide(piece, self.locked_blocks,
-                                               dokilla=False, dokillb=False))
+        return self.board.collides(piece.cells())
 
     def lock_piece(self, piece):
         """Lock the given piece onto the playfield"""
+        # Lock the piece onto the board, which also reports the rows that
+        # have been completed by it.
+        cleared_rows = self.board.lock(piece.cells())
+        return self.lock_sprites(piece, cleared_rows)
+
+    def lock_sprites(self, piece, cleared_rows):
+        """Move the blocks of a piece locked onto the board to locked blocks
+
+        Returns the amount of line cleared.
+        """
         # Add all block in the given piece to self.locked_blocks
-        self.locked_blocks.add(piece)
+        if not self.stack:
+            self.locked_blocks.add(piece)
+        for block in piece:
+            self.set_color(block.col, block.row, block.color)
+        for row in cleared_rows:
+            del self.colors[row + self.board.vanish_rows]
+            self.colors.insert(0, bytes(self.board.width))
 
         # Remove all block from the given piece, so the player can no longer
         # control the piece.
         piece.empty()
 
+        if self.stack:
+            self.update_stack()
+            return len(cleared_rows)
+
         # Clear complete line and return the amount of line cleared
-        return self.locked_blocks.line_clear()
+        return self.locked_blocks.line_clear(cleared_rows)
+
+    def update_stack(self):
+        """Draw the stack image again from the colors of the visible rows"""
+        self.stack.update(self.colors[self.board.vanish_rows:], self.palette)
+
+    def draw_line_clear(self, rows):
+        """Redraw the playfield after the given rows have been cleared
+
+        The rows must be sorted from top to bottom. Returns a list of
+        Rectangular areas on the display that have been changed.
+        """
+        if not self.stack:
+            return self.locked_blocks.draw_line_clear(rows)
+
+        rows = [row for row in rows if row >= 0]
+        if not rows:
+            return []
+
+        # Everything above the lowest cleared row has moved
+        area = pygame.Rect(0, 0, self.surface.get_width(),
+                           self.get_y(rows[-1] + 1))
+        self.surface.blit(self.stack.image, area, area)
+        return [area.move(self.surface.get_offset())]
+
+    def set_color(self, col, row, color):
+        """Set the color of the locked block in the given cell"""
+        if color not in self.palette:
+            self.palette.append(color)
+        index = row + self.board.vanish_rows
+        colors = bytearray(self.colors[index])
+        colors[col] = self.palette.index(color)
+        self.colors[index] = bytes(colors)
+
+    def add_garbage(self, garbage):
+        """Push the locked blocks up by the given garbage
+
+        The garbage is a sequence of (lines, hole) tuples like
+        src.engine.Engine.raised, whose rows are drawn in the garbage color.
+        Returns a list of Rectangular areas on the display that have been
+        changed.
+        """
+        color = tuple(self.config["garbage_color"])
+        if color not in self.palette:
+            self.palette.append(color)
+        index = self.palette.index(color)
+
+        colors = self.colors
+        for lines, hole in garbage:
+            lines = min(lines, len(colors))
+            row_colors = bytearray([index]) * self.board.width
+            row_colors[hole] = 0
+            colors = colors[lines:] + [bytes(row_colors)] * lines
+
+        # Every locked block has moved
+        return self.restore(colors)
+
+    def restore(self, colors):
+        """Replace every locked block with blocks of the given colors
+
+        The colors are rows of palette indices like self.colors, and the
+        whole playfield is drawn again. Returns a list of Rectangular areas
+        on the display that have been changed.
+        """
+        self.colors = list(colors)
+        if self.stack:
+            self.update_stack()
+        else:
+            self.locked_blocks.empty()
+            for index, row_colors in enumerate(self.colors):
+                row = index - self.board.vanish_rows
+                for col, color in enumerate(row_colors):
+                    if color:
+                        self.locked_blocks.add(
+                            Block(self, col, row, self.palette[color])
+                        )
+        return self.draw()
+
+    def draw(self):
+        """Draw the background and every locked block of the playfield
+
+        Returns a list of Rectangular areas on the display that have been
+        changed.
+        """
+        # The stack image covers the background unless the cells do not
+        # fill the whole surface
+        if not self.stack or\
+                self.stack.image.get_size() != self.surface.get_size():
+            self.surface.fill(self.config["bgd_color"])
+        if self.stack:
+            self.surface.blit(self.stack.image, (0, 0))
+        else:
+            self.locked_blocks.draw()
+        return [self.surface.get_rect().move(self.surface.get_offset())]
 
     def clear_callback(self, surf, rect):
         """Callback function for pygame.sprite.AbstractGroup.clear"""
         surf.fill(self.config["bgd_color"], rect)
 
+    def clear_piece_callback(self, surf, rect):
+        """Callback function for clearing a piece from the playfield
+
+        Also draws the locked blocks under the cleared area again, since a
+        piece can overlap locked blocks when it spawns.
+        """
+        surf.fill(self.config["bgd_color"], rect)
+        if self.stack:
+            area = rect.clip(self.stack.image.get_rect())
+            surf.blit(self.stack.image, area, area)
+            return
+
+        col = rect.x // self.cell_size[0]
+        row = rect.y // self.cell_size[1]
+        if self.board.contains(((col, row),)) and\
+                self.board.collides(((col, row),)):
+            for block in self.locked_blocks.row_group(row):
+                if block.col == col:
+                    surf.blit(block.image, block.rect)
+
 
 class LockedBlocked(pygame.sprite.RenderUpdates):
     """A group of blocks that's been locked onto the playfield"""
@@ -88,8 +255,11 @@ class LockedBlocked(pygame.sprite.RenderUpdates):
         """
         super().__init__(*sprites)
 
+        # One group for every row of the board, from the bottom row up
         self.playfield = playfield
-        self.sprite_groups = tuple(pygame.sprite.Group() for i in range(0, 22))
+        self.sprite_groups = tuple(
+            pygame.sprite.Group() for _ in self.playfield.board.rows
+        )
 
     def add_internal(self, sprite):
         """Do not use this method directly
@@ -98,7 +268,7 @@ class LockedBlocked(pygame.sprite.RenderUpdates):
         """
         if isinstance(sprite, Block):
             super().add_internal(sprite)
-            self.sprite_groups[21 - (sprite.row + 2)].add(sprite)
+            self.row_group(sprite.row).add(sprite)
 
     def remove_internal(self, sprite):
         """Do not use this method directly
@@ -107,7 +277,15 @@ class LockedBlocked(pygame.sprite.RenderUpdates):
         """
         if isinstance(sprite, Block):
             super().remove_internal(sprite)
-            self.sprite_groups[21 - (sprite.row + 2)].remove(sprite)
+            self.row_group(sprite.row).remove(sprite)
+
+    def group_index(self, row):
+        """Get the index into self.sprite_groups of a playfield row"""
+        return self.playfield.board.height - 1 - row
+
+    def row_group(self, row):
+        """Get the group of the blocks in a playfield row"""
+        return self.sprite_groups[self.group_index(row)]
 
     def draw(self):
         """Draw the lock blocks onto the display
@@ -123,17 +301,61 @@ class LockedBlocked(pygame.sprite.RenderUpdates):
         """Draw the background of the playfield over the sprites"""
         super().clear(self.playfield.surface, self.playfield.clear_callback)
 
-    def line_clear(self):
-        """Clear complete row of blocks, and moves blocks above it downward
+    def draw_line_clear(self, rows):
+        """Redraw the playfield after the given rows have been cleared
 
+        Instead of drawing every locked block again, every run of rows
+        between the cleared rows is scrolled down once by the number of
+        cleared rows below it, and only the rows that came down from the
+        vanish zone are drawn. The rows must be sorted from top to bottom,
+        and the blocks must already have been moved by line_clear.
+
+        Returns a list of Rectangular areas on the display that have
+        been changed.
+        """
+        rows = [row for row in rows if row >= 0]
+        if not rows:
+            return []
+
+        surface = self.playfield.surface
+        width = surface.get_width()
+        cell_height = self.playfield.cell_size[1]
+
+        # Move the runs of drawn rows from the bottom one up, so that no run
+        # is overwritten before it has been moved
+        count = len(rows)
+        for i in range(count - 1, -1, -1):
+            start = rows[i - 1] + 1 if i else 0
+            if start == rows[i]:
+                continue
+            shift = count - i
+            y = self.playfield.get_y(start)
+            area = (0, y, width, self.playfield.get_y(rows[i] + shift) - y)
+            surface.subsurface(area).scroll(0, shift * cell_height)
+
+        # Draw the rows that came down from the vanish zone
+        top = pygame.Rect(0, 0, width, self.playfield.get_y(count))
+        surface.fill(self.playfield.config["bgd_color"], top)
+        for row in range(count):
+            for block in self.row_group(row):
+                surface.blit(block.image, block.rect)
+
+        dirty = pygame.Rect(0, 0, width, self.playfield.get_y(rows[-1] + 1))
+        return [dirty.move(surface.get_offset())]
+
+    def line_clear(self, rows):
+        """Clear the given rows of blocks, and moves blocks above it downward
+
+        The rows are the playfield rows that have been cleared from the board.
         Returns the total amount rows been cleared.
         """
+        cleared = {self.group_index(row) for row in rows}
         line_cleared = 0
 
         for i, group in enumerate(self.sprite_groups):
             if len(group) == 0:
                 break
-            elif len(group) == 10:
+            elif i in cleared:
                 self.remove(group)
                 line_cleared += 1
             elif line_cleared:
@@ -0,0 +1,136 @@
+"""
+Per-phase timings of the frames of the game loop.
+"""
+
+from array import array
+from time import perf_counter
+
+
+class FrameProfiler:
+    """Timings of the phases of recent frames kept in ring buffers
+
+    Each frame is started with start, and every phase is ended with mark,
+    which records the time since the previous mark. The time left of the
+    frame budget, which is negative for a frame that missed it, is recorded
+    as the "budget" phase by end.
+    """
+
+    phases = ("events", "logic", "render", "display", "sleep", "budget")
+
+    # Phases whose time is spent working on the frame
+    work_phases = ("events", "logic", "render", "display")
+
+    def __init__(self, fps, size=1024):
+        """Initialize an instance of FrameProfiler
+
+        The last size frames are kept for each phase.
+        """
+        self.budget = 1 / fps
+        self.size = size
+        self.count = 0
+        self.buffers = {
+            phase: array("d", [0.0] * size) for phase in self.phases
+        }
+
+        self.index = 0
+        self.last = None
+
+    def start(self):
+        """Start timing a frame"""
+        # Phases that are skipped in this frame take no time
+        self.index = self.count % self.size
+        for buffer in self.buffers.values():
+            buffer[self.index] = 0.0
+        self.last = perf_counter()
+
+    def mark(self, phase):
+        """End the given phase of the frame"""
+        now = perf_counter()
+        self.buffers[phase][self.index] += now - self.last
+        self.last = now
+
+    def end(self):
+        """End timing the frame"""
+        work = sum(
+            self.buffers[phase][self.index] for phase in self.work_phases
+        )
+        self.buffers["budget"][self.index] = self.budget - work
+        self.count += 1
+
+    def percentiles(self, phase, percents=(50, 95, 99)):
+        """Get the given percentiles of the time of a phase in seconds"""
+        values = sorted(self.buffers[phase][:min(self.count, self.size)])
+        if not values:
+            return tuple(0.0 for _ in percents)
+        return tuple(
+            values[min(len(values) - 1, len(values) * percent // 100)]
+            for percent in percents
+        )
+
+    def report(self):
+        """Get a table of the p50/p95/p99 of every phase in milliseconds"""
+        lines = [f"{'phase':<8} {'p50':>8} {'p95':>8} {'p99':>8}"]
+        for phase in self.phases:
+            p50, p95, p99 = self.percentiles(phase)
+            lines.append(f"{phase:<8} {p50 * 1000:8.2f} {p95 * 1000:8.2f} "
+                         f"{p99 * 1000:8.2f}")
+        lines.append(f"last {min(self.count, self.size)} of {self.count} "
+                     f"frames")
+        return "\n".join(lines)
+
+
+class ProfilerOverlay:
+    """Text over the display that shows the p95 of the main phases
+
+    The area under the text is saved before the text is drawn and restored
+    before the next frame is drawn, so the game can keep drawing as if the
+    overlay was not there.
+    """
+
+    def __init__(self, profiler, display, font, topleft, interval=30):
+        """Initialize an instance of ProfilerOverlay
+
+        The text is updated every interval frames.
+        """
+        self.profiler = profiler
+        self.display = display
+        self.font = font
+        self.topleft = topleft
+        self.interval = interval
+
+        self.text = None
+        self.rect = None
+        self.saved = None
+
+    def restore(self):
+        """Draw back the area under the overlay
+
+        Returns a list of Rectangular areas on the display that have
+        been changed.
+        """
+        if self.saved is None:
+            return []
+        self.display.blit(self.saved, self.rect)
+        self.saved = None
+        return [self.rect]
+
+    def draw(self):
+        """Draw the overlay onto the display
+
+        Returns a list of Rectangular areas on the display that have
+        been changed.
+        """
+        if self.text is None or self.profiler.count % self.interval == 0:
+            texts = []
+            for phase in ("logic", "render", "display", "budget"):
+                p95, = self.profiler.percentiles(phase, (95,))
+                texts.append(f"{phase} {p95 * 1000:.1f}")
+            text = "p95 ms: " + " ".join(texts)
+            self.text = self.font.render(text, 1, (255, 255, 255), (0, 0, 0))
+
+        self.rect = self.text.get_rect(topleft=self.topleft).clip(
+            self.display.get_rect()
+        )
+        self.saved = self.display.subsurface(self.rect).copy()
+        self.display.blit(self.text, self.rect)
+        return [self.rect]
@@ -0,0 +1,176 @@
+"""
+Helpers that reduce the work of drawing onto the display.
+"""
+
+import numpy as np
+import pygame
+
+
+class DirtyRects:
+    """Rectangular areas of the display that have been changed
+
+    Overlapping or adjacent areas are merged as they are added, so that
+    pygame.display.update receives a few larger areas instead of many
+    overlapping ones.
+    """
+
+    def __init__(self, limit=8):
+        """Initialize an instance of DirtyRects
+
+        No more than limit areas are submitted for a single update.
+        """
+        self.limit = limit
+        self.rects = []
+
+    def __bool__(self):
+        """Check if any area has been changed"""
+        return bool(self.rects)
+
+    def add(self, rect):
+        """Add a changed area"""
+        rect = pygame.Rect(rect)
+        if not rect.w or not rect.h:
+            return
+
+        # Keep merging the area with the areas it touches, as long as the
+        # merged area does not cover more than the two areas combined.
+        merged = True
+        while merged:
+            merged = False
+            for i, other in enumerate(self.rects):
+                if self.mergeable(rect, other):
+                    rect = rect.union(other)
+                    del self.rects[i]
+                    merged = True
+                    break
+
+        self.rects.append(rect)
+
+    def extend(self, rects):
+        """Add every given changed area"""
+        for rect in rects:
+            self.add(rect)
+
+    @staticmethod
+    def mergeable(rect, other):
+        """Check if two areas are worth merging
+
+        Areas are merged when they overlap or share an edge, and their union
+        does not cover more than the two areas combined.
+        """
+        if not rect.inflate(2, 2).colliderect(other):
+            return False
+        union = rect.union(other)
+        return union.w * union.h <= rect.w * rect.h + other.w * other.h
+
+    def flush(self):
+        """Get the changed areas to update and forget them
+
+        If there are more areas than the limit, the pairs of areas whose
+        union wastes the least are merged until the limit is reached.
+        """
+        rects = self.rects
+        while len(rects) > self.limit:
+            best = None
+            for i, rect in enumerate(rects):
+                for j in range(i + 1, len(rects)):
+                    union = rect.union(rects[j])
+                    waste = union.w * union.h - rect.w * rect.h -\
+                        rects[j].w * rects[j].h
+                    if best is None or waste < best[0]:
+                        best = (waste, i, j, union)
+            _, i, j, union = best
+            del rects[j], rects[i]
+            rects.append(union)
+
+        self.rects = []
+        return rects
+
+
+class GlyphCache:
+    """Pre-rendered characters of a font
+
+    Text is drawn by blitting the cached characters side by side instead of
+    rendering the whole text with the font every time.
+    """
+
+    def __init__(self, font, color, bgd_color):
+        """Initialize an instance of GlyphCache"""
+        self.font = font
+        self.color = color
+        self.bgd_color = bgd_color
+        self.glyphs = {}
+
+    def glyph(self, char):
+        """Get the surface of a character, rendering it on first use"""
+        surf = self.glyphs.get(char)
+        if surf is None:
+            surf = self.font.render(char, 1, self.color, self.bgd_color)
+            self.glyphs[char] = surf
+        return surf
+
+    def size(self, text):
+        """Get the size of the given text when drawn"""
+        glyphs = [self.glyph(char) for char in text]
+        return (sum(glyph.get_width() for glyph in glyphs),
+                max((glyph.get_height() for glyph in glyphs), default=0))
+
+    def draw(self, surface, text, **kwargs):
+        """Draw the given text onto the surface
+
+        The keyword arguments will be applied to the attribute of the rectangle
+        of the text. Returns the rectangle of the text.
+        """
+        rect = pygame.Rect((0, 0), self.size(text))
+        for key, value in kwargs.items():
+            setattr(rect, key, value)
+
+        x = rect.x
+        for char in text:
+            glyph = self.glyph(char)
+            surface.blit(glyph, (x, rect.y))
+            x += glyph.get_width()
+        return rect
+
+
+class StackImage:
+    """Image of the locked blocks drawn from rows of palette indices
+
+    The image is an 8-bit surface whose palette maps the indices to colors,
+    and whose pixels are a NumPy array with one block of cell size for every
+    cell. Updating the image is a single broadcast of the indices into the
+    array, and drawing the whole stack is a single blit, however many blocks
+    it has.
+    """
+
+    def __init__(self, size, cell_size, bgd_color):
+        """Initialize an instance of StackImage
+
+        The size is the (cols, rows) of cells in the image. Cells of index 0
+        are drawn in the background color.
+        """
+        cols, rows = size
+        width, height = cell_size
+        self.size = size
+        self.bgd_color = tuple(bgd_color)
+        self.pixels = np.zeros((rows, height, cols, width), dtype=np.uint8)
+        self.image = pygame.image.frombuffer(
+            self.pixels, (cols * width, rows * height), "P"
+        )
+        self.palette = [self.bgd_color]
+        self.image.set_palette(self.palette)
+
+    def update(self, rows, palette):
+        """Draw the image again from the given rows of palette indices
+
+        The rows are bytes objects with one index per column, and palette
+        holds the color of every index but 0.
+        """
+        palette = [self.bgd_color] + list(palette[1:])
+        if palette != self.palette:
+            self.palette = palette
+            self.image.set_palette(palette)
+
+        cols, row_count = self.size
+        cells = np.frombuffer(b"".join(rows), dtype=np.uint8)
+        self.pixels[...] = cells.reshape(row_count, 1, cols, 1)
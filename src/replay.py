@@ -0,0 +1,473 @@
+"""
+Recording and headless playback of games.
+
+A replay is the seed of a game and the inputs pressed and released on each
+frame, which is all the engine needs to play the game again frame by frame.
+
+Replay files from version 2 on also hold keyframes, which are the binary
+states of the engine every KEYFRAME_INTERVAL frames, with the position of
+the events that follow each of them. The keyframes have a fixed size, so
+ReplayFile can find the keyframe before any frame with a single lookup and
+resume the game from there, without reading the events before it.
+"""
+
+import mmap
+import struct
+from collections import namedtuple
+
+from src.config import config as src_config
+from src.engine import INPUTS, Engine, PieceState, Snapshot
+
+MAGIC = b"TTRP"
+VERSION = 3
+
+STATE_MAGIC = b"TTST"
+STATE_VERSION = 3
+
+# Largest board width and row count whose states can be encoded, since the
+# col and row of the tetromino are stored as signed shorts
+MAX_BOARD_SIZE = 0x7fff
+
+KEYFRAME_INTERVAL = 600
+
+# Magic and version at the start of every file
+PREFIX = struct.Struct("<4sB")
+
+# Header of a version 1 replay file: magic, version, seed, frames and event
+# count
+HEADER_V1 = struct.Struct("<4sBQII")
+
+# Header of a version 2 replay file, whose board width and row count are
+# single bytes
+HEADER_V2 = struct.Struct("<4sBQIIIIBBQ")
+
+# Header of a replay file: magic, version, seed, frames, event count,
+# keyframe interval, keyframe count, board width, board row count and the
+# offset of the first keyframe
+HEADER = struct.Struct("<4sBQIIIIHHQ")
+
+# Header of a version 1 state file, whose board width and row count are
+# single bytes
+STATE_HEADER_V1 = struct.Struct("<4sBBB")
+
+# Header of a state file: magic, version, board width and board row count
+STATE_HEADER = struct.Struct("<4sBHH")
+
+# Everything of an engine state but the board rows: frame, board hash,
+# random state, tetromino id (-1 without a tetromino), orientation, col and
+# row, next tetromino, level, score, line cleared, game over, inputs, shift
+# offset (0 without one), drop delay, drop counter, soft drop, shift
+# counter, delayed auto shift and entry counter
+STATE = struct.Struct("<IQQbBhhBHQIBBbBBBhBB")
+
+# State of version 1 state files and of the keyframes of version 2 replay
+# files, whose col and row are single bytes
+STATE_V1 = struct.Struct("<IQQbBbbBHQIBBbBBBhBB")
+
+# What follows the state in a state file: the number of pending garbage
+# entries, then the lines and the hole of every entry
+GARBAGE_COUNT = struct.Struct("<H")
+GARBAGE_ENTRY = struct.Struct("<BH")
+
+# What follows the state of a keyframe: the index and the offset of the
+# first event at or after the frame of the keyframe, and the frame of the
+# event before it
+KEYFRAME = struct.Struct("<IQI")
+
+# The size is the (width, height) of the board, or None for the size of the
+# playfield
+Replay = namedtuple("Replay", ("seed", "frames", "events", "size"),
+                    defaults=(None,))
+
+
+def from_engine(engine):
+    """Get the Replay of a game recorded by the given engine"""
+    board = engine.board
+    return Replay(engine.seed, engine.frame, list(engine.input_log),
+                  (board.width, board.height))
+
+
+def board_size(width, row_count):
+    """Get the (width, height) of a board from its width and row count"""
+    return width, row_count - src_config["playfield"]["vanish_rows"]
+
+
+def encode_varint(value):
+    """Encode an unsigned integer as LEB128 bytes"""
+    data = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+
+def decode_varint(data, offset):
+    """Decode a LEB128 unsigned integer from data at the given offset
+
+    Returns the integer and the offset after it.
+    """
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def row_size(width):
+    """Get the number of bytes of a board row of the given width"""
+    return (width + 7) // 8
+
+
+def state_size(width, row_count, layout=STATE):
+    """Get the number of bytes of an encoded state of the given board size
+
+    The layout is the struct of the state without the board rows.
+    """
+    return layout.size + row_size(width) * row_count
+
+
+def check_board_size(board):
+    """Raise ValueError if the states of the board cannot be encoded"""
+    if max(board.width, len(board.rows)) > MAX_BOARD_SIZE:
+        raise ValueError(
+            f"board of {board.width}x{len(board.rows)} cells is too large "
+            f"for the state format, whose limit is {MAX_BOARD_SIZE}"
+        )
+
+
+def encode_state(snapshot, width):
+    """Encode an engine Snapshot into bytes, without its input log length
+
+    The pending garbage is not encoded either, so the states have a fixed
+    size. The engines of replays never receive any, and state files encode
+    it after the state with encode_garbage.
+    """
+    piece = snapshot.tetromino or PieceState(-1, 0, 0, 0)
+    drop_delay, drop_counter, soft_drop = snapshot.drop_delay
+    shift_counter, delayed_auto_shift = snapshot.shift_delay
+    size = row_size(width)
+    return STATE.pack(
+        snapshot.frame, snapshot.board_hash, snapshot.random_state,
+        piece.id, piece.orientation, piece.col, piece.row,
+        snapshot.next_tetromino, snapshot.level, snapshot.score,
+        snapshot.line_cleared, snapshot.game_over, snapshot.inputs,
+        snapshot.shift_offset or 0, drop_delay, drop_counter, soft_drop,
+        shift_counter, delayed_auto_shift, snapshot.entry_delay
+    ) + b"".join(row.to_bytes(size, "little") for row in snapshot.rows)
+
+
+def decode_state(data, offset, width, row_count, layout=STATE):
+    """Decode an engine Snapshot from data at the given offset
+
+    The layout is the struct of the state without the board rows, STATE or
+    the STATE_V1 of older files.
+    """
+    (frame, board_hash, random_state, id_, orientation, col, row,
+     next_tetromino, level, score, line_cleared, game_over, inputs,
+     shift_offset, drop_delay, drop_counter, soft_drop, shift_counter,
+     delayed_auto_shift, entry_delay) = layout.unpack_from(data, offset)
+
+    offset += layout.size
+    size = row_size(width)
+    rows = tuple(
+        int.from_bytes(data[offset + i * size:offset + (i + 1) * size],
+                       "little")
+        for i in range(row_count)
+    )
+    return Snapshot(
+        frame, rows, board_hash, None,
+        PieceState(id_, orientation, col, row) if id_ >= 0 else None,
+        next_tetromino, level, score, line_cleared, bool(game_over),
+        random_state, inputs, shift_offset or None,
+        (drop_delay, drop_counter, bool(soft_drop)),
+        (shift_counter, bool(delayed_auto_shift)), entry_delay, None
+    )
+
+
+def encode_garbage(garbage):
+    """Encode the pending garbage of an engine Snapshot into bytes"""
+    return GARBAGE_COUNT.pack(len(garbage)) + b"".join(
+        GARBAGE_ENTRY.pack(lines, hole) for lines, hole in garbage
+    )
+
+
+def decode_garbage(data, offset):
+    """Decode the pending garbage of an engine Snapshot from data at the
+    given offset"""
+    (count,) = GARBAGE_COUNT.unpack_from(data, offset)
+    offset += GARBAGE_COUNT.size
+    return tuple(
+        GARBAGE_ENTRY.unpack_from(data, offset + i * GARBAGE_ENTRY.size)
+        for i in range(count)
+    )
+
+
+def dumps_state(engine):
+    """Encode the state of an engine into bytes"""
+    board = engine.board
+    check_board_size(board)
+    snapshot = engine.snapshot()
+    return STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION, board.width,
+                             len(board.rows)) +\
+        encode_state(snapshot, board.width) +\
+        encode_garbage(snapshot.garbage)
+
+
+def loads_state(data, engine):
+    """Restore the state encoded in bytes into an engine
+
+    States of versions 1 and 2 have no pending garbage.
+    """
+    magic, version = PREFIX.unpack_from(data)
+    if magic != STATE_MAGIC:
+        raise ValueError("not a state file")
+    if version == 1:
+        header, layout = STATE_HEADER_V1, STATE_V1
+    elif version in (2, STATE_VERSION):
+        header, layout = STATE_HEADER, STATE
+    else:
+        raise ValueError(f"unsupported state version {version}")
+
+    _, _, width, row_count = header.unpack_from(data)
+    if (width, row_count) != (engine.board.width, len(engine.board.rows)):
+        raise ValueError("state of a different board size")
+
+    snapshot = decode_state(data, header.size, width, row_count, layout)
+    if version == STATE_VERSION:
+        snapshot = snapshot._replace(garbage=decode_garbage(
+            data, header.size + state_size(width, row_count)
+        ))
+    engine.restore(snapshot)
+
+
+def encode_event(frame, action, pressed, prev_frame):
+    """Encode an event as a varint of the frames since the previous event
+    and a byte with the input and whether it was pressed"""
+    return encode_varint(frame - prev_frame) +\
+        bytes((INPUTS.index(action) | (0x80 if pressed else 0),))
+
+
+def decode_event(data, offset, prev_frame):
+    """Decode an event from data at the given offset
+
+    Returns the (frame, input, pressed) event and the offset after it.
+    """
+    delta, offset = decode_varint(data, offset)
+    byte = data[offset]
+    event = (prev_frame + delta, INPUTS[byte & 0x7f], bool(byte & 0x80))
+    return event, offset + 1
+
+
+def dumps(replay, keyframe_interval=KEYFRAME_INTERVAL):
+    """Encode a Replay into bytes
+
+    The replay is played back to take its keyframes.
+    """
+    events = bytearray()
+    offsets = []
+    prev_frame = 0
+    for frame, action, pressed in replay.events:
+        offsets.append(len(events))
+        events += encode_event(frame, action, pressed, prev_frame)
+        prev_frame = frame
+    offsets.append(len(events))
+
+    # The keyframe of a frame is the state before the events of that frame
+    engine = Engine(replay.seed, size=replay.size)
+    board = engine.board
+    check_board_size(board)
+    keyframes = bytearray()
+    event_index = 0
+    for frame in range(0, replay.frames + 1, keyframe_interval):
+        while engine.frame < frame:
+            event_index = play_events(engine, replay.events, event_index)
+            engine.tick()
+
+        keyframes += encode_state(engine.snapshot(), board.width)
+        keyframes += KEYFRAME.pack(
+            event_index, offsets[event_index],
+            replay.events[event_index - 1][0] if event_index else 0
+        )
+
+    count = replay.frames // keyframe_interval + 1
+    return HEADER.pack(
+        MAGIC, VERSION, replay.seed, replay.frames, len(replay.events),
+        keyframe_interval, count, board.width, len(board.rows),
+        HEADER.size + len(events)
+    ) + bytes(events) + bytes(keyframes)
+
+
+def loads(data):
+    """Decode a Replay from bytes"""
+    magic, version = PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a replay file")
+    # Files of version 1 do not hold the size of the board
+    size = None
+    if version == 1:
+        _, _, seed, frames, count = HEADER_V1.unpack_from(data)
+        offset = HEADER_V1.size
+    elif version in (2, VERSION):
+        header = HEADER_V2 if version == 2 else HEADER
+        (_, _, seed, frames, count, _, _, width, row_count,
+         _) = header.unpack_from(data)
+        size = board_size(width, row_count)
+        offset = header.size
+    else:
+        raise ValueError(f"unsupported replay version {version}")
+
+    events = []
+    frame = 0
+    for _ in range(count):
+        event, offset = decode_event(data, offset, frame)
+        frame = event[0]
+        events.append(event)
+    return Replay(seed, frames, events, size)
+
+
+def save(path, replay):
+    """Save a Replay to the file at the given path"""
+    with open(path, "wb") as file:
+        file.write(dumps(replay))
+
+
+def load(path):
+    """Load a Replay from the file at the given path"""
+    with open(path, "rb") as file:
+        return loads(file.read())
+
+
+def play_events(engine, events, index):
+    """Press and release the events of the current frame of the engine
+
+    The events from the given index on are played. Returns the index of the
+    first event that has not been played.
+    """
+    while index < len(events) and events[index][0] == engine.frame:
+        _, action, pressed = events[index]
+        if pressed:
+            engine.press(action)
+        else:
+            engine.release(action)
+        index += 1
+    return index
+
+
+def frames(replay):
+    """Play a Replay back, yielding the engine after every frame
+
+    The engine is advanced as fast as possible, without any display.
+    """
+    engine = Engine(replay.seed, size=replay.size)
+    i = 0
+    while engine.frame < replay.frames:
+        i = play_events(engine, replay.events, i)
+        engine.tick()
+        yield engine
+
+
+def play(replay):
+    """Play a Replay back and return the engine after its last frame"""
+    engine = Engine(replay.seed, size=replay.size)
+    for engine in frames(replay):
+        pass
+    return engine
+
+
+class ReplayFile:
+    """Replay file of version 2 or later read through a memory map
+
+    Only the header is read up front. Seeking to a frame reads a single
+    keyframe and the events between it and the frame.
+    """
+
+    def __init__(self, path):
+        """Initialize an instance of ReplayFile"""
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = PREFIX.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError("not a replay file")
+        if version == 2:
+            header, self.layout = HEADER_V2, STATE_V1
+        elif version == VERSION:
+            header, self.layout = HEADER, STATE
+        else:
+            raise ValueError(f"unsupported replay version {version}")
+
+        (_, _, self.seed, self.frames, self.event_count,
+         self.keyframe_interval, self.keyframe_count, self.width,
+         self.row_count, self.keyframes_offset) = header.unpack_from(self.data)
+        self.size = board_size(self.width, self.row_count)
+        self.events_offset = header.size
+        self.keyframe_size = state_size(self.width, self.row_count,
+                                        self.layout) + KEYFRAME.size
+
+    def close(self):
+        """Close the memory map of the file"""
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def keyframe(self, frame):
+        """Get the last keyframe at or before the given frame
+
+        Returns the engine Snapshot, the index and the offset of the first
+        event at or after the frame of the snapshot, and the frame of the
+        event before it.
+        """
+        index = min(frame // self.keyframe_interval, self.keyframe_count - 1)
+        offset = self.keyframes_offset + index * self.keyframe_size
+        snapshot = decode_state(self.data, offset, self.width,
+                                self.row_count, self.layout)
+        return (snapshot, *KEYFRAME.unpack_from(
+            self.data, offset + self.keyframe_size - KEYFRAME.size
+        ))
+
+    def events(self, index=0, offset=None, prev_frame=0):
+        """Yield the (frame, input, pressed) events from the given index
+
+        The offset is where that event starts, the first event if it is not
+        given, and prev_frame is the frame of the event before it.
+        """
+        if offset is None:
+            offset = self.events_offset
+        for _ in range(index, self.event_count):
+            event, offset = decode_event(self.data, offset, prev_frame)
+            prev_frame = event[0]
+            yield event
+
+    def seek(self, frame):
+        """Get an engine at the start of the given frame
+
+        The engine is restored from the nearest keyframe and advanced to the
+        frame, without playing the events of that frame yet.
+        """
+        snapshot, index, offset, prev_frame = self.keyframe(frame)
+        engine = Engine(self.seed, size=self.size)
+        engine.restore(snapshot)
+
+        events = self.events(index, self.events_offset + offset, prev_frame)
+        event = next(events, None)
+        while engine.frame < frame:
+            while event and event[0] == engine.frame:
+                _, action, pressed = event
+                if pressed:
+                    engine.press(action)
+                else:
+                    engine.release(action)
+                event = next(events, None)
+            engine.tick()
+        return engine
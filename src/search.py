@@ -0,0 +1,165 @@
+"""
+Search of the placements a tetromino can reach, for bots.
+
+The search runs on the bitmasks of a Board only, the same way the engine
+moves its tetromino, without touching any sprite.
+"""
+
+from collections import deque, namedtuple
+
+from src.engine import (DOWN, HARD_DROP, LEFT, RIGHT, ROTATE_CCW, ROTATE_CW,
+                        PieceState)
+from src.tables import ROTATABLE, SHAPES
+
+# A resting position of a tetromino, with the cells it occupies and the
+# path that moves the tetromino there from where the search started. The
+# path of placements is a list of moves for Engine.move_tetromino and
+# Engine.rotate_tetromino, where DOWN moves one row, rather than inputs to
+# hold, since a held DOWN soft drops at its own pace. The path of
+# drop_placements is a sequence of inputs to tap one at a time, which
+# InputPilot plays.
+Placement = namedtuple("Placement", ("piece", "cells", "path"))
+
+
+def moves(id_):
+    """Get the (input, orientation step, col, row) moves of a tetromino"""
+    moves = [(LEFT, 0, -1, 0), (RIGHT, 0, 1, 0), (DOWN, 0, 0, 1)]
+    if ROTATABLE[id_]:
+        moves += [(ROTATE_CW, 1, 0, 0), (ROTATE_CCW, -1, 0, 0)]
+    return moves
+
+
+def reachable(board, piece):
+    """Find every position the tetromino can reach on the board
+
+    The tetromino is moved one cell or rotated once per input, so tucks
+    under overhangs and spins are found as well. Returns a dict that maps
+    every reachable (orientation, col, row) to the (orientation, col, row)
+    and input it was reached from, or to None for the starting position.
+    """
+    id_ = piece.id
+    count = len(SHAPES[id_])
+    piece_fits = board.piece_fits
+    id_moves = moves(id_)
+
+    start = (piece.orientation, piece.col, piece.row)
+    parents = {start: None}
+    queue = deque((start,))
+    while queue:
+        position = queue.popleft()
+        orientation, col, row = position
+        for action, step, col_offset, row_offset in id_moves:
+            moved = ((orientation + step) % count, col + col_offset,
+                     row + row_offset)
+            if moved not in parents and piece_fits(id_, *moved):
+                parents[moved] = (position, action)
+                queue.append(moved)
+
+    return parents
+
+
+def path(parents, position):
+    """Get the inputs that reach the given position of a reachable dict"""
+    inputs = []
+    while parents[position] is not None:
+        position, action = parents[position]
+        inputs.append(action)
+    inputs.reverse()
+    return tuple(inputs)
+
+
+def placements(board, id_, start=None):
+    """Find every distinct placement a tetromino can reach on the board
+
+    The tetromino starts at the given PieceState, or at its spawn position
+    if start is not given. A placement is a position where the tetromino
+    cannot drop any further, and placements that occupy the same cells are
+    only returned once, with the shortest path that reaches them. Returns a
+    list of Placement, which is empty if the tetromino would end the game
+    where it starts. Their paths are moves, not inputs, see Placement.
+    """
+    start = start or PieceState(id_, 0, 0, 0)
+    piece_fits = board.piece_fits
+    if not piece_fits(id_, start.orientation, start.col, start.row):
+        return []
+    parents = reachable(board, start)
+
+    found = {}
+    for position in parents:
+        orientation, col, row = position
+        if piece_fits(id_, orientation, col, row + 1):
+            continue
+
+        cells = frozenset(board.piece_cells(id_, *position))
+        if cells not in found:
+            found[cells] = Placement(PieceState(id_, *position),
+                                     tuple(sorted(cells)),
+                                     path(parents, position))
+
+    return list(found.values())
+
+
+def drop_placements(board, id_, fall=0, start=None):
+    """Find the placements a tetromino reaches by shifting and dropping
+
+    The tetromino is moved the way InputPilot moves it: it is rotated the
+    shorter way, then shifted, one input at a time, and then dropped
+    straight down. It starts at the given PieceState, or at its spawn
+    position if start is not given. It falls by fall rows between two
+    inputs, and a placement is only found if the tetromino fits everywhere
+    it passes through, so placements out of reach under fast gravity are
+    left out. This finds fewer placements than placements, without tucks or
+    spins, but is much cheaper since every drop is a lookup into the column
+    tops. Returns a list of Placement, whose paths are the inputs to tap.
+    """
+    start = start or PieceState(id_, 0, 0, 0)
+    count = len(SHAPES[id_])
+    piece_fits = board.piece_fits
+
+    def falls(orientation, col, step):
+        # Check if the tetromino fits on every row it falls through from
+        # the input before the given step to the input of the step
+        first = int((step - 1) * fall) if step else 0
+        for row in range(start.row + first, start.row + int(step * fall) + 1):
+            if not piece_fits(id_, orientation, col, row):
+                return False
+        return True
+
+    if not falls(start.orientation, start.col, 0):
+        return []
+
+    found = []
+    for orientation in range(count):
+        # Rotate the shorter way, as InputPilot does
+        turns = (orientation - start.orientation) % count
+        if turns > count // 2:
+            turns, action = range(-1, turns - count - 1, -1), ROTATE_CCW
+        else:
+            turns, action = range(1, turns + 1), ROTATE_CW
+        if not all(falls((start.orientation + turn) % count, start.col, step)
+                   for step, turn in enumerate(turns, 1)):
+            continue
+        rotations = (action,) * len(turns)
+
+        # Every orientation of a tetromino has different cells, so every
+        # column reached in every orientation is a different placement
+        reached = [(start.col, len(turns), ())]
+        for shift, action in ((-1, LEFT), (1, RIGHT)):
+            col = start.col
+            step = len(turns)
+            while falls(orientation, col + shift, step + 1):
+                col += shift
+                step += 1
+                reached.append((col, step,
+                                (action,) * abs(col - start.col)))
+
+        for col, step, shifts in reached:
+            row = start.row + int(step * fall)
+            row += board.drop_distance(id_, orientation, col, row)
+            found.append(Placement(
+                PieceState(id_, orientation, col, row),
+                tuple(sorted(board.piece_cells(id_, orientation, col, row))),
+                rotations + shifts + (HARD_DROP,)
+            ))
+
+    return found
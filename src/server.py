@@ -0,0 +1,402 @@
+"""
+Asyncio server that runs game sessions and streams them to its clients.
+
+Sessions only run on the engine, so the server never imports pygame. A
+client can list the sessions, watch any number of them, or join one as a
+player and send the inputs of that player. The players of a session are
+either clients, bots or replays played back.
+
+Every session is streamed as a keyframe followed by deltas. A client whose
+connection does not keep up is never waited for: the frames it cannot take
+are skipped, and it gets a keyframe once its connection has drained.
+"""
+
+import asyncio
+import itertools
+
+from src.bot import ExpectimaxBot, InputPilot
+from src.config import config as src_config
+from src.engine import INPUTS, Engine, Randomizer, send_garbage
+from src.replay import play_events
+from src.stream import (DELTA, END, ERROR, INPUT, INPUT_PAYLOAD, JOINED,
+                        KEYFRAME, LIST, PLAY, SESSION_ENTRY, SESSIONS, WATCH,
+                        DeltaEncoder, encode_delta, encode_keyframe, message,
+                        read_message)
+
+
+class BotPlayer:
+    """Player of a session that is a bot pressing the inputs"""
+
+    def __init__(self, bot):
+        """Initialize an instance of BotPlayer"""
+        self.pilot = InputPilot(bot)
+
+    def control(self, engine):
+        """Hold the inputs of the next frame of the engine"""
+        engine.hold(self.pilot.inputs(engine))
+
+
+class ReplayPlayer:
+    """Player of a session that plays the events of a Replay back"""
+
+    def __init__(self, replay):
+        """Initialize an instance of ReplayPlayer"""
+        self.events = replay.events
+        self.index = 0
+
+    def control(self, engine):
+        """Press and release the events of the next frame of the engine"""
+        self.index = play_events(engine, self.events, self.index)
+
+
+class Connection:
+    """Connection of a client to the server"""
+
+    config = src_config["server"]
+
+    def __init__(self, writer):
+        """Initialize an instance of Connection"""
+        self.writer = writer
+
+        # Sessions the client watches, and the player slots it has joined
+        # by session id
+        self.watching = set()
+        self.playing = {}
+
+        # Number of frames skipped because the connection did not keep up
+        self.skipped = 0
+
+    def congested(self):
+        """Check if more data is waiting to be sent than the high water"""
+        return self.writer.transport.get_write_buffer_size() >\
+            self.config["high_water"]
+
+    def send(self, data):
+        """Send data without waiting for it to be written"""
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+
+class Session:
+    """Game session of one or several players run by the server
+
+    The engines of a versus session get the same sequence of tetrominoes and
+    send garbage to each other. The session starts once every player slot
+    has been filled, and is over when a single player is left, or when the
+    only player is over.
+    """
+
+    config = src_config["server"]
+
+    def __init__(self, id_, players, seed=None, controllers=None,
+                 replace=None, size=None):
+        """Initialize an instance of Session
+
+        The controllers are the BotPlayer or ReplayPlayer of every player
+        slot, or None for the slots that are left to clients. If replace is
+        given, it is called to add a new session once this one is over. The
+        boards have the (width, height) size, or the size of the playfield
+        if it is not given.
+        """
+        self.id = id_
+        self.seed = Randomizer(seed).seed
+        self.engines = [Engine(self.seed, size=size) for _ in range(players)]
+        self.controllers = list(controllers or [None] * players)
+        self.clients = [None] * players
+        self.random = Randomizer(self.seed + 1)
+        self.replace = replace
+        self.frame = 0
+
+        # Every watching Connection, mapped to whether it got the frame
+        # before, so that it can be sent a delta
+        self.watchers = {}
+        self.encoders = [DeltaEncoder(engine) for engine in self.engines]
+        self.stale = False
+
+    @property
+    def waiting(self):
+        """Check if a player slot is still free"""
+        return any(controller is None and client is None
+                   for controller, client in zip(self.controllers,
+                                                 self.clients))
+
+    @property
+    def over(self):
+        """Check if the session is over"""
+        left = sum(not engine.game_over for engine in self.engines)
+        return not left or len(self.engines) > 1 and left == 1
+
+    def join(self, connection):
+        """Give a free player slot to a client
+
+        Returns the index of the slot, or None if every slot is taken.
+        """
+        for slot, (controller, client) in enumerate(
+                zip(self.controllers, self.clients)):
+            if controller is None and client is None:
+                self.clients[slot] = connection
+                return slot
+        return None
+
+    def leave(self, slot):
+        """Free the slot of a client that left
+
+        A player who leaves a session that has started forfeits.
+        """
+        self.clients[slot] = None
+        if self.frame:
+            self.engines[slot].game_over = True
+
+    def tick(self):
+        """Advance every engine by one frame and stream the frame"""
+        for engine, controller in zip(self.engines, self.controllers):
+            if not engine.game_over:
+                if controller:
+                    controller.control(engine)
+                engine.tick()
+        # Replays play back games that got no garbage
+        send_garbage(self.engines, self.random, [
+            not isinstance(controller, ReplayPlayer)
+            for controller in self.controllers
+        ])
+        self.frame += 1
+        self.broadcast()
+
+    def broadcast(self):
+        """Send the current frame to every watcher
+
+        Watchers that got the frame before are sent a delta, and the others
+        a keyframe, as well as everyone every keyframe_interval frames.
+        Watchers whose connection is congested are skipped.
+        """
+        if not self.watchers:
+            # The deltas are only computed while someone is watching
+            self.stale = True
+            return
+        if self.stale:
+            for encoder in self.encoders:
+                encoder.reset()
+            self.stale = False
+
+        periodic = self.frame % self.config["keyframe_interval"] == 0
+        delta = keyframe = None
+        if periodic:
+            for encoder in self.encoders:
+                encoder.reset()
+        else:
+            delta = message(DELTA, self.id,
+                            encode_delta(self.frame, self.encoders))
+
+        for connection, synced in self.watchers.items():
+            if connection.congested():
+                self.watchers[connection] = False
+                connection.skipped += 1
+            elif synced and delta:
+                connection.send(delta)
+            else:
+                if keyframe is None:
+                    keyframe = message(KEYFRAME, self.id, encode_keyframe(
+                        self.frame, self.engines
+                    ))
+                connection.send(keyframe)
+                self.watchers[connection] = True
+
+    def end(self):
+        """Tell every watcher that the session is over"""
+        for connection in self.watchers:
+            connection.send(message(END, self.id))
+            connection.watching.discard(self.id)
+        for connection in self.clients:
+            if connection:
+                connection.playing.pop(self.id, None)
+        self.watchers.clear()
+
+
+class Server:
+    """Server that runs game sessions and streams them to its clients
+
+    The sessions are ticked together at the tick rate of the game by a
+    single task, and every client connection is served by its own task.
+    """
+
+    config = src_config["server"]
+
+    def __init__(self, bots=0, replay=None, replays=0, players=1):
+        """Initialize an instance of Server
+
+        The server keeps bots sessions played by bots, and replays sessions
+        that play the given Replay back, each of the given number of
+        players. A session of those that is over is replaced by a new one.
+        """
+        self.sessions = {}
+        self.ids = itertools.count(1)
+        self.bot = ExpectimaxBot(time_budget=self.config["bot_time_budget"])
+        self.replay = replay
+        self.players = players
+
+        for _ in range(bots):
+            self.add_bot_session()
+        for i in range(replays):
+            # Start the replays at different frames
+            session = self.add_replay_session()
+            for _ in range(i * 97 % 600):
+                session.tick()
+
+    def add_session(self, players, seed=None, controllers=None,
+                    replace=None, size=None):
+        """Add a new Session and get it"""
+        session = Session(next(self.ids), players, seed, controllers,
+                          replace, size)
+        self.sessions[session.id] = session
+        return session
+
+    def add_bot_session(self):
+        """Add a new session played by bots"""
+        return self.add_session(self.players, controllers=[
+            BotPlayer(self.bot) for _ in range(self.players)
+        ], replace=self.add_bot_session)
+
+    def add_replay_session(self):
+        """Add a new session that plays the replay back"""
+        return self.add_session(self.players, self.replay.seed, [
+            ReplayPlayer(self.replay) for _ in range(self.players)
+        ], self.add_replay_session, self.replay.size)
+
+    async def serve(self, host=None, port=None):
+        """Accept clients on the given address and run the sessions"""
+        server = await asyncio.start_server(
+            self.handle_client, host or self.config["host"],
+            port or self.config["port"]
+        )
+        async with server:
+            await self.run()
+
+    async def run(self):
+        """Tick the sessions at the tick rate of the game forever
+
+        A late tick is caught up with, but no more than max_catch_up_ticks
+        at once, past which the sessions slow down instead.
+        """
+        game_config = src_config["game"]
+        tick_time = 1 / game_config["tick_rate"]
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        while True:
+            ticks = 0
+            while next_time <= loop.time() and\
+                    ticks < game_config["max_catch_up_ticks"]:
+                self.tick()
+                next_time += tick_time
+                ticks += 1
+            if next_time <= loop.time():
+                next_time = loop.time() + tick_time
+
+            await asyncio.sleep(next_time - loop.time())
+
+    def tick(self):
+        """Advance every session that has started by one frame"""
+        for session in list(self.sessions.values()):
+            if session.waiting:
+                continue
+            session.tick()
+            if session.over:
+                self.end_session(session)
+
+    def end_session(self, session):
+        """Remove a session that is over, and replace it if it has to be"""
+        session.end()
+        del self.sessions[session.id]
+        if session.replace:
+            session.replace()
+
+    async def handle_client(self, reader, writer):
+        """Serve a client until it disconnects"""
+        connection = Connection(writer)
+        try:
+            while True:
+                kind, session_id, payload = await read_message(
+                    reader, self.config["max_payload"]
+                )
+                self.handle_message(connection, kind, session_id, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as error:
+            # The stream cannot be followed past a message left unread
+            connection.send(message(ERROR, 0, str(error).encode()))
+        finally:
+            self.disconnect(connection)
+            writer.close()
+
+    def handle_message(self, connection, kind, session_id, payload):
+        """Handle a message from a client"""
+        session = self.sessions.get(session_id)
+
+        if kind == LIST:
+            connection.send(message(SESSIONS, 0, b"".join(
+                SESSION_ENTRY.pack(session.id, len(session.engines),
+                                   session.frame)
+                for session in self.sessions.values()
+            )))
+
+        elif kind == WATCH:
+            if session is None:
+                connection.send(message(ERROR, session_id,
+                                        b"no such session"))
+                return
+            session.watchers[connection] = False
+            connection.watching.add(session_id)
+
+        elif kind == PLAY:
+            players = payload[0] if payload else 1
+            if not 1 <= players <= self.config["max_players"]:
+                connection.send(message(ERROR, session_id,
+                                        b"invalid player count"))
+                return
+            if session_id in connection.playing:
+                connection.send(message(ERROR, session_id,
+                                        b"already playing"))
+                return
+            # A client only takes one player slot of a session
+            session = next((
+                session for session in self.sessions.values()
+                if session.waiting and len(session.engines) == players and
+                session.id not in connection.playing
+            ), None) or self.add_session(players)
+            slot = session.join(connection)
+            if slot is None:
+                connection.send(message(ERROR, session.id, b"session full"))
+                return
+            connection.playing[session.id] = slot
+            connection.send(message(JOINED, session.id, bytes((slot,))))
+            session.watchers[connection] = False
+            connection.watching.add(session.id)
+
+        elif kind == INPUT:
+            slot = connection.playing.get(session_id)
+            action = pressed = None
+            if len(payload) == INPUT_PAYLOAD.size:
+                action, pressed = INPUT_PAYLOAD.unpack(payload)
+            if slot is None or action not in INPUTS:
+                connection.send(message(ERROR, session_id, b"invalid input"))
+                return
+
+            engine = session.engines[slot]
+            if not engine.game_over:
+                if pressed:
+                    engine.press(action)
+                else:
+                    engine.release(action)
+
+        else:
+            connection.send(message(ERROR, session_id, b"unknown message"))
+
+    def disconnect(self, connection):
+        """Forget a client that disconnected"""
+        for session_id in connection.watching:
+            session = self.sessions.get(session_id)
+            if session:
+                session.watchers.pop(connection, None)
+        for session_id, slot in connection.playing.items():
+            session = self.sessions.get(session_id)
+            if session:
+                session.leave(slot)
@@ -0,0 +1,258 @@
+"""
+Wire format of the game sessions streamed by src.server.
+
+Every message is a MESSAGE header, with the kind of message, the session it
+is about and the length of its payload, followed by the payload.
+
+The state of the players of a session is sent as a KEYFRAME, which holds
+the binary state of every engine as written by src.replay.dumps_state, or
+as a DELTA, which only holds what changed in each engine since the frame
+before: the rows that changed, the tetromino, the next tetromino and the
+HUD values. A player whose engine did not change costs a single byte.
+"""
+
+import struct
+
+from src.engine import PieceState
+from src.replay import STATE_HEADER, decode_state, dumps_state, row_size
+
+# Messages sent by clients
+LIST = 1
+WATCH = 2
+PLAY = 3
+INPUT = 4
+
+# Messages sent by the server
+SESSIONS = 16
+JOINED = 17
+KEYFRAME = 18
+DELTA = 19
+END = 20
+ERROR = 21
+
+# Kind of message, session id and payload length
+MESSAGE = struct.Struct("<BII")
+
+# Longest payload read_message reads by default
+MAX_PAYLOAD = 1 << 24
+
+# Payload of INPUT: input and whether it is pressed
+INPUT_PAYLOAD = struct.Struct("<BB")
+
+# Entry of the payload of SESSIONS: session id, players and frame
+SESSION_ENTRY = struct.Struct("<IBI")
+
+# Start of the payload of KEYFRAME and DELTA: frame and player count
+FRAME = struct.Struct("<IB")
+
+# Flags of what changed in the delta of a player
+ROWS = 1
+PIECE = 2
+NEXT = 4
+HUD = 8
+GAME_OVER = 16
+
+# Changed row index, tetromino (id -1 without one), HUD values
+ROW_INDEX = struct.Struct("<H")
+PIECE_STATE = struct.Struct("<bBhh")
+HUD_VALUES = struct.Struct("<HQI")
+
+
+def message(kind, session, payload=b""):
+    """Encode a message with the given payload"""
+    return MESSAGE.pack(kind, session, len(payload)) + payload
+
+
+async def read_message(reader, max_payload=MAX_PAYLOAD):
+    """Read the next message from an asyncio StreamReader
+
+    Returns the (kind, session, payload) of the message. Raises ValueError
+    if the payload is longer than max_payload, before reading any of it.
+    """
+    header = await reader.readexactly(MESSAGE.size)
+    kind, session, length = MESSAGE.unpack(header)
+    if length > max_payload:
+        raise ValueError(f"payload of {length} bytes is too long")
+    payload = await reader.readexactly(length) if length else b""
+    return kind, session, payload
+
+
+def encode_keyframe(frame, engines):
+    """Encode the whole state of the engines of a session"""
+    data = bytearray(FRAME.pack(frame, len(engines)))
+    for engine in engines:
+        state = dumps_state(engine)
+        data += struct.pack("<I", len(state)) + state
+    return bytes(data)
+
+
+class DeltaEncoder:
+    """Encoder of the changes of an engine from one frame to the next
+
+    The encoder remembers what it encoded last, so every engine of a session
+    has its own encoder, and every delta it encodes is relative to the one
+    before.
+    """
+
+    def __init__(self, engine):
+        """Initialize an instance of DeltaEncoder"""
+        self.engine = engine
+        self.size = row_size(engine.board.width)
+        self.reset()
+
+    def reset(self):
+        """Start over from the current state of the engine"""
+        engine = self.engine
+        self.rows = list(engine.board.rows)
+        self.board_hash = engine.board.hash
+        self.piece = engine.tetromino
+        self.next_tetromino = engine.next_tetromino
+        self.hud = (engine.level, engine.score, engine.line_cleared)
+        self.game_over = engine.game_over
+
+    def encode(self):
+        """Encode what changed in the engine since the last delta"""
+        engine = self.engine
+        flags = 0
+        data = bytearray()
+
+        # The rows only change when the hash of the board does
+        if engine.board.hash != self.board_hash:
+            self.board_hash = engine.board.hash
+            changed = [
+                index for index, (row, prev) in
+                enumerate(zip(engine.board.rows, self.rows)) if row != prev
+            ]
+            if changed:
+                flags |= ROWS
+                data += ROW_INDEX.pack(len(changed))
+                for index in changed:
+                    row = engine.board.rows[index]
+                    data += ROW_INDEX.pack(index)
+                    data += row.to_bytes(self.size, "little")
+                    self.rows[index] = row
+
+        if engine.tetromino != self.piece:
+            self.piece = engine.tetromino
+            flags |= PIECE
+            data += PIECE_STATE.pack(*(self.piece or (-1, 0, 0, 0)))
+
+        if engine.next_tetromino != self.next_tetromino:
+            self.next_tetromino = engine.next_tetromino
+            flags |= NEXT
+            data.append(self.next_tetromino)
+
+        hud = (engine.level, engine.score, engine.line_cleared)
+        if hud != self.hud:
+            self.hud = hud
+            flags |= HUD
+            data += HUD_VALUES.pack(*hud)
+
+        if engine.game_over and not self.game_over:
+            self.game_over = True
+            flags |= GAME_OVER
+
+        return bytes((flags,)) + bytes(data)
+
+
+def encode_delta(frame, encoders):
+    """Encode the changes of the engines of a session since the last delta"""
+    return FRAME.pack(frame, len(encoders)) + b"".join(
+        encoder.encode() for encoder in encoders
+    )
+
+
+class Mirror:
+    """Copy of the state of an engine rebuilt from keyframes and deltas"""
+
+    def __init__(self):
+        """Initialize an instance of Mirror"""
+        self.width = None
+        self.rows = []
+        self.tetromino = None
+        self.next_tetromino = None
+        self.level = 0
+        self.score = 0
+        self.line_cleared = 0
+        self.game_over = False
+
+    def apply_keyframe(self, data, offset):
+        """Replace the state with the one encoded in data at the offset
+
+        Returns the offset after the state.
+        """
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        _, _, self.width, row_count = STATE_HEADER.unpack_from(data, offset)
+        snapshot = decode_state(data, offset + STATE_HEADER.size, self.width,
+                                row_count)
+        self.rows = list(snapshot.rows)
+        self.tetromino = snapshot.tetromino
+        self.next_tetromino = snapshot.next_tetromino
+        self.level = snapshot.level
+        self.score = snapshot.score
+        self.line_cleared = snapshot.line_cleared
+        self.game_over = snapshot.game_over
+        return offset + length
+
+    def apply_delta(self, data, offset):
+        """Apply the delta encoded in data at the offset
+
+        Returns the offset after the delta.
+        """
+        flags = data[offset]
+        offset += 1
+
+        if flags & ROWS:
+            size = row_size(self.width)
+            (count,) = ROW_INDEX.unpack_from(data, offset)
+            offset += ROW_INDEX.size
+            for _ in range(count):
+                (index,) = ROW_INDEX.unpack_from(data, offset)
+                offset += ROW_INDEX.size
+                self.rows[index] = int.from_bytes(data[offset:offset + size],
+                                                  "little")
+                offset += size
+
+        if flags & PIECE:
+            id_, orientation, col, row = PIECE_STATE.unpack_from(data, offset)
+            offset += PIECE_STATE.size
+            self.tetromino = None if id_ < 0 else\
+                PieceState(id_, orientation, col, row)
+
+        if flags & NEXT:
+            self.next_tetromino = data[offset]
+            offset += 1
+
+        if flags & HUD:
+            self.level, self.score, self.line_cleared =\
+                HUD_VALUES.unpack_from(data, offset)
+            offset += HUD_VALUES.size
+
+        if flags & GAME_OVER:
+            self.game_over = True
+
+        return offset
+
+    def state(self):
+        """Get the state as a tuple that can be compared with another"""
+        return (tuple(self.rows), self.tetromino, self.next_tetromino,
+                self.level, self.score, self.line_cleared, self.game_over)
+
+
+def apply_frame(mirrors, kind, payload):
+    """Apply a KEYFRAME or DELTA payload to the mirrors of a session
+
+    Missing mirrors are added. Returns the frame of the payload.
+    """
+    frame, count = FRAME.unpack_from(payload)
+    while len(mirrors) < count:
+        mirrors.append(Mirror())
+
+    offset = FRAME.size
+    for mirror in mirrors[:count]:
+        if kind == KEYFRAME:
+            offset = mirror.apply_keyframe(payload, offset)
+        else:
+            offset = mirror.apply_delta(payload, offset)
+    return frame
@@ -0,0 +1,130 @@
+"""
+Orientation and placement tables of the tetrominoes.
+
+Every tetromino in the configuration is compiled into the cells of each of
+its orientations, so rotating or moving a tetromino is a lookup into these
+tables followed by a single collision check. The Zobrist keys that hash the
+cells of a board are compiled here as well.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+from random import Random
+
+from src.config import config as src_config
+
+# An orientation of a tetromino at its spawn position. The cells are listed
+# in the same order as the blocks of the tetromino, the row masks are the
+# (row, bitmask) pairs of the cells, cols and rows are the inclusive
+# (min, max) range of offsets that keep the orientation within the board,
+# and tops and bottoms are the (col, row) of the highest and the lowest cell
+# of every column.
+Orientation = namedtuple("Orientation", ("cells", "row_masks", "cols", "rows",
+                                         "tops", "bottoms"))
+
+
+def orientation_cells(tetromino):
+    """Get the cells of every orientation of the given tetromino config
+
+    The first orientation is the spawn, and each next orientation is the
+    previous one rotated clockwise by its rotate_offsets.
+    """
+    shape = tuple(tetromino["spawn"])
+    shapes = [shape]
+    for rotate_offset in tetromino["rotate_offsets"][:-1]:
+        shape = tuple(
+            (cell[0] + offset[0], cell[1] + offset[1])
+            for cell, offset in zip(shape, rotate_offset)
+        )
+        shapes.append(shape)
+    return tuple(shapes)
+
+
+# Cells of every orientation of every tetromino, independent of board size
+SHAPES = tuple(
+    orientation_cells(tetromino) for tetromino in src_config["tetromino"]
+)
+
+# Whether each tetromino can be rotated at all
+ROTATABLE = tuple(
+    bool(tetromino["rotate_offsets"]) for tetromino in src_config["tetromino"]
+)
+
+# Width of the board the spawn positions in the configuration are given for,
+# tetrominoes are moved to spawn as centered on boards of any other width
+SPAWN_WIDTH = 10
+
+# Seed of the Zobrist keys, fixed so that hashes match between processes
+ZOBRIST_SEED = 0x7E7215
+
+# Number of bits of a row that each Zobrist chunk table covers
+ZOBRIST_CHUNK = 8
+ZOBRIST_MASK = (1 << ZOBRIST_CHUNK) - 1
+
+
+@lru_cache(maxsize=None)
+def compile_tables(width, height, vanish_rows):
+    """Compile the orientations of every tetromino for a board size
+
+    Returns a tuple with a tuple of Orientation for each tetromino.
+    """
+    shift = (width - SPAWN_WIDTH) // 2
+    tables = []
+    for shapes in SHAPES:
+        orientations = []
+        for cells in shapes:
+            cells = tuple((col + shift, row) for col, row in cells)
+            row_masks = {}
+            tops = {}
+            bottoms = {}
+            for col, row in cells:
+                row_masks[row] = row_masks.get(row, 0) | 1 << col
+                tops[col] = min(tops.get(col, row), row)
+                bottoms[col] = max(bottoms.get(col, row), row)
+
+            cols = [col for col, _ in cells]
+            rows = [row for _, row in cells]
+            orientations.append(Orientation(
+                cells,
+                tuple(sorted(row_masks.items())),
+                (-min(cols), width - 1 - max(cols)),
+                (-vanish_rows - min(rows), height - 1 - max(rows)),
+                tuple(sorted(tops.items())),
+                tuple(sorted(bottoms.items()))
+            ))
+        tables.append(tuple(orientations))
+    return tuple(tables)
+
+
+@lru_cache(maxsize=None)
+def compile_zobrist(width, row_count):
+    """Compile the Zobrist keys of the rows of a board size
+
+    Every cell gets a random 64 bit key, and the hash of a row is the XOR of
+    the keys of its occupied cells. To hash a whole row bitmask with a few
+    lookups, the keys are combined into chunk tables: each row has a table
+    for every ZOBRIST_CHUNK bits, indexed by the value of those bits.
+
+    Returns a tuple with a tuple of chunk tables for each row.
+    """
+    random = Random(ZOBRIST_SEED)
+    chunk_size = 1 << ZOBRIST_CHUNK
+    tables = []
+    for _ in range(row_count):
+        chunks = []
+        for first_col in range(0, width, ZOBRIST_CHUNK):
+            keys = [
+                random.getrandbits(64)
+                for _ in range(min(ZOBRIST_CHUNK, width - first_col))
+            ]
+            table = [0] * chunk_size
+            for value in range(1, chunk_size):
+                # Reuse the hash of the value without its lowest set bit
+                low = value & -value
+                bit = low.bit_length() - 1
+                table[value] = table[value ^ low] ^ (
+                    keys[bit] if bit < len(keys) else 0
+                )
+            chunks.append(tuple(table))
+        tables.append(tuple(chunks))
+    return tuple(tables)
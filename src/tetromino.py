@@ -43,46 +43,81 @@ class Piece(pygame.sprite.OrderedUpdates):
 
     def clear(self):
         """Draw the background of the playfield over the sprites"""
-        super().clear(self.playfield.surface, self.playfield.clear_callback)
+        super().clear(self.playfield.surface,
+                      self.playfield.clear_piece_callback)
+
+    def cells(self):
+        """Get the (col, row) cells occupied by the piece"""
+        return [(block.col, block.row) for block in self.sprites()]
 
     def move(self, col, row):
         """Move the piece in place by the given offset
 
         Returns True if the piece moved successfully, otherwise returns False.
         """
-        # Move the piece by the given offset
-        for block in self.sprites():
-            block.move(col, row)
+        cells = [
+            (cell_col + col, cell_row + row)
+            for cell_col, cell_row in self.cells()
+        ]
 
         # Ensure the moved piece is in the valid space of the playfield
-        if not self.playfield.valid_space(self):
-            # Undo the movement
-            for block in self.sprites():
-                block.move(-col, -row)
+        if not self.playfield.board.fits(cells):
             return False
 
+        self.set_cells(cells)
         return True
 
+    def set_cells(self, cells):
+        """Move the blocks of the piece onto the given cells"""
+        for block, cell in zip(self.sprites(), cells):
+            block.col, block.row = cell
+
 
 class Tetromino(Piece):
-    """A group of four blocks that moved as an unit"""
+    """A group of four blocks that moved as an unit
+
+    The position of the tetromino is tracked as its orientation and its
+    offset from the spawn position, so that moving and rotating it are
+    lookups into the orientation tables of the board.
+    """
 
     config = src_config["tetromino"]
 
-    def __init__(self, playfield, id_):
-        """Initialize an instance of Tetromino"""
-        spawn = self.config[id_]["spawn"]
-        color = self.config[id_]["color"]
+    def __init__(self, playfield, id_, color=None):
+        """Initialize an instance of Tetromino
+
+        The blocks have the color of the tetromino in the configuration,
+        unless another color is given.
+        """
+        self.id = id_
+        self.shapes = playfield.board.tetrominoes[id_]
+        self.col, self.row = 0, 0
+
+        color = color or self.config[id_]["color"]
         sprites = (
-            Block(playfield, cell[0], cell[1], color) for cell in spawn
+            Block(playfield, cell[0], cell[1], color)
+            for cell in self.shapes[0].cells
         )
         super().__init__(playfield, *sprites)
 
-        self.id = id_
-
         self.rotate_offsets = self.config[id_]["rotate_offsets"]
         self.curr_rotate_offset = 0
 
+    def move(self, col, row):
+        """Move the tetromino in place by the given offset
+
+        Returns True if the tetromino moved successfully, otherwise returns
+        False.
+        """
+        col += self.col
+        row += self.row
+        if not self.playfield.board.piece_fits(
+                self.id, self.curr_rotate_offset, col, row):
+            return False
+
+        self.place(self.curr_rotate_offset, col, row)
+        return True
+
     def rotate(self, counterclockwise=False):
         """Rotate the tetromino in place clockwise or counterclockwise
 
@@ -92,33 +127,28 @@ class Tetromino(Piece):
         if not self.rotate_offsets:
             return False
 
-        # Get the rotate_offset in order to rotate the tetromino
-        rotate_offset = self.rotate_offsets[self.curr_rotate_offset]
         if counterclockwise:
-            rotate_offset = tuple(
-                (-offset[0], -offset[1])
-                for offset in self.rotate_offsets[self.prev_rotate_offset]
-            )
-
-        # Rotate the tetromino
-        for block, offset in zip(self.sprites(), rotate_offset):
-            block.move(offset[0], offset[1])
+            rotate_offset = self.prev_rotate_offset
+        else:
+            rotate_offset = self.next_rotate_offset
 
         # Ensure the rotated tetromino is in the valid space of the playfield
-        if not self.playfield.valid_space(self):
-            # Undo the rotate
-            for block, offset in zip(self.sprites(), rotate_offset):
-                block.move(-offset[0], -offset[1])
+        if not self.playfield.board.piece_fits(
+                self.id, rotate_offset, self.col, self.row):
             return False
 
-        # Update self.curr_rotate_offset
-        if counterclockwise:
-            self.curr_rotate_offset = self.prev_rotate_offset
-        else:
-            self.curr_rotate_offset = self.next_rotate_offset
-
+        self.place(rotate_offset, self.col, self.row)
         return True
 
+    def place(self, rotate_offset, col, row):
+        """Place the tetromino in the given rotation and offset from its
+        spawn position"""
+        self.curr_rotate_offset = rotate_offset
+        self.col, self.row = col, row
+        self.set_cells(
+            self.playfield.board.piece_cells(self.id, rotate_offset, col, row)
+        )
+
     @property
     def next_rotate_offset(self):
         """Get the next rotate offset"""
@@ -134,18 +164,36 @@ class Tetromino(Piece):
 class Block(pygame.sprite.Sprite):
     """Square block that moves in playfield"""
 
+    # Images shared by every block of the same color and size
+    images = {}
+
     def __init__(self, playfield, col, row, color):
         """Initialize an instance of Block"""
         super().__init__()
 
         self.playfield = playfield
+        self.color = tuple(color)
         self._col, self._row = None, None
 
-        self.image = pygame.Surface(self.playfield.config["cell_size"])
-        self.image.fill(color)
+        self.image = self.get_image(color, self.playfield.cell_size)
         self.rect = self.image.get_rect()
         self.col, self.row = col, row
 
+    @classmethod
+    def get_image(cls, color, size):
+        """Get the image of a block with the given color and size
+
+        The image is created on first use and shared afterwards, so it must
+        not be drawn onto.
+        """
+        key = (tuple(color), tuple(size))
+        image = cls.images.get(key)
+        if image is None:
+            image = pygame.Surface(size)
+            image.fill(color)
+            cls.images[key] = image
+        return image
+
     @property
     def col(self):
         """Get the current column of the block"""
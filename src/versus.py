@@ -0,0 +1,216 @@
+"""
+Local split-screen matches of several players on one display.
+"""
+
+import pygame
+
+from src.config import config as src_config
+from src.engine import (DOWN, HARD_DROP, LEFT, RIGHT, ROTATE_CCW, ROTATE_CW,
+                        Randomizer, send_garbage)
+from src.game import GAME_OVER, PAUSED, PLAYING, FixedTimestep, Game
+from src.render import DirtyRects
+
+# Names of the inputs of the engine in the key bindings
+INPUT_NAMES = {
+    "left": LEFT,
+    "right": RIGHT,
+    "down": DOWN,
+    "rotate_cw": ROTATE_CW,
+    "rotate_ccw": ROTATE_CCW,
+    "hard_drop": HARD_DROP
+}
+
+
+class Match:
+    """Split-screen match of several games on one display
+
+    Every player has a panel of the display, which is a subsurface the game
+    of the player draws onto, and their own key bindings. Every game gets the
+    same sequence of tetrominoes. The garbage lines a player earns by
+    clearing rows are sent to the next player who is still playing, and the
+    match is over when a single player is left.
+
+    The games are ticked together at the fixed tick rate, and the areas they
+    changed are gathered into a single display update per frame.
+    """
+
+    config = src_config["versus"]
+
+    # Keys that pause and resume the match
+    pause_keys = Game.pause_keys
+
+    def __init__(self, display, players, seed=None):
+        """Initialize an instance of Match
+
+        The seed determines the sequence of tetrominoes of every game and the
+        holes of the garbage lines.
+        """
+        bindings = self.config["bindings"]
+        if not 1 <= players <= len(bindings):
+            raise ValueError(
+                f"a match has between 1 and {len(bindings)} players"
+            )
+
+        self.display = display
+        self.players = players
+        self.seed = seed
+        self.quit = False
+        self.state = None
+        self.timestep = FixedTimestep()
+        self.changed_areas = DirtyRects(8 * players)
+
+        game_seed = Randomizer(seed).seed
+        self.random = Randomizer(game_seed + 1)
+        self.games = [
+            Game(self.display.subsurface(self.panel(i)), game_seed,
+                 key_inputs=self.key_inputs(bindings[i]),
+                 layout=self.config["layout"])
+            for i in range(players)
+        ]
+
+        self.set_state(PLAYING)
+
+    @classmethod
+    def window_size(cls, players):
+        """Get the size of the display that fits the panels of the players"""
+        columns = min(players, cls.config["columns"])
+        rows = -(-players // columns)
+        width, height = cls.config["panel_size"]
+        return (columns * width, rows * height)
+
+    def panel(self, player):
+        """Get the area of the display of the given player"""
+        columns = min(self.players, self.config["columns"])
+        width, height = self.config["panel_size"]
+        row, col = divmod(player, columns)
+        return pygame.Rect(col * width, row * height, width, height)
+
+    @staticmethod
+    def key_inputs(binding):
+        """Get the keys mapped to the inputs of the engine by a binding"""
+        return {
+            pygame.key.key_code(name): INPUT_NAMES[action]
+            for name, action in binding.items()
+        }
+
+    def loop(self):
+        """Main game loop of the match"""
+        clock = pygame.time.Clock()
+        pygame.display.flip()
+
+        while not self.quit:
+            if self.state == PLAYING:
+                self.handle_events()
+                for _ in range(self.timestep.due_ticks()):
+                    if self.state != PLAYING:
+                        break
+                    self.tick()
+            else:
+                self.wait_events()
+
+            self.update_display()
+
+            if self.state == PLAYING:
+                clock.tick(Game.config["fps"])
+            else:
+                clock.tick(Game.config["idle_fps"])
+
+    def tick(self):
+        """Advance every playing game by one frame and exchange garbage"""
+        playing = sum(game.state == PLAYING for game in self.games)
+        for game in self.games:
+            if game.state == PLAYING:
+                game.update()
+
+        send_garbage([game.engine for game in self.games], self.random)
+
+        left = sum(game.state == PLAYING for game in self.games)
+        if not left or self.players > 1 and left == 1:
+            self.set_state(GAME_OVER)
+        elif left < playing:
+            # The games that are over have set their own caption
+            self.set_caption()
+
+    def update_display(self):
+        """Update the areas every game changed with one display update"""
+        for game in self.games:
+            offset = game.display.get_abs_offset()
+            self.changed_areas.extend(
+                rect.move(offset) for rect in game.changed_areas.flush()
+            )
+        pygame.display.update(self.changed_areas.flush())
+
+    def set_state(self, state):
+        """Switch the match and its games to the given state"""
+        self.state = state
+        for game in self.games:
+            if state == PAUSED and game.state == PLAYING:
+                game.pause()
+            elif state == PLAYING and game.state == PAUSED:
+                game.set_state(PLAYING)
+
+        if state == PLAYING:
+            self.timestep.reset()
+
+        # The caption is set after the games, which set their own
+        self.set_caption()
+
+    def set_caption(self):
+        """Show the state of the match in the caption of the window"""
+        caption = src_config["display"]["caption"]
+        if self.state == GAME_OVER and self.players > 1:
+            winners = [i for i, game in enumerate(self.games)
+                       if game.state == PLAYING]
+            result = f"Player {winners[0] + 1} Wins" if winners else "Draw"
+            caption = f"{caption} - {result}"
+        elif self.state != PLAYING:
+            caption = f"{caption} - {self.state.title()}"
+        pygame.display.set_caption(caption)
+
+    def handle_events(self):
+        """Handle all pending input events"""
+        for event in pygame.event.get():
+            self.handle_event(event)
+
+    def wait_events(self):
+        """Handle input events while the match is idle
+
+        Blocks until an event arrives or the idle timeout has passed, instead
+        of polling for events.
+        """
+        event = pygame.event.wait(Game.config["idle_timeout"])
+        if event.type != pygame.NOEVENT:
+            self.handle_event(event)
+        self.handle_events()
+
+    def handle_event(self, event):
+        """Handle an input event according to the state of the match"""
+        if event.type == pygame.QUIT:
+            self.quit = True
+
+        elif self.state == PLAYING:
+            if event.type == pygame.WINDOWFOCUSLOST:
+                self.set_state(PAUSED)
+            elif event.type == pygame.KEYDOWN and\
+                    event.key in self.pause_keys:
+                self.set_state(PAUSED)
+            elif event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                # Every key belongs to the game of a single player
+                for game in self.games:
+                    if game.state == PLAYING and event.key in game.key_inputs:
+                        game.handle_event(event)
+
+        elif self.state == PAUSED:
+            if event.type == pygame.KEYDOWN and event.key in self.pause_keys:
+                self.set_state(PLAYING)
+
+        elif self.state == GAME_OVER:
+            # Start a new match when a player presses enter
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
+                self.restart()
+
+    def restart(self):
+        """Start a new match with the same players"""
+        self.display.fill(src_config["display"]["bgd_color"])
+        self.__init__(self.display, self.players, self.seed)
+        pygame.display.flip()
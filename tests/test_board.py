@@ -0,0 +1,147 @@
+"""
+Tests of the hash and the column tops that the board keeps up to date.
+"""
+
+from random import Random
+
+import pytest
+
+from src.board import Board
+from src.engine import Engine
+
+
+def check_index(board):
+    """Check the hash and column tops against those computed from scratch"""
+    expected = board.copy()
+    expected.rehash()
+    expected.index_columns()
+    assert board.hash == expected.hash
+    assert board.column_tops == expected.column_tops
+
+
+def drop_random_piece(board, random):
+    """Lock a random tetromino where it lands in a random column
+
+    Returns the cleared rows, or None if the tetromino does not fit.
+    """
+    id_ = random.randrange(len(board.tetrominoes))
+    orientation = random.randrange(len(board.tetrominoes[id_]))
+    cols = board.tetrominoes[id_][orientation].cols
+    col = random.randint(*cols)
+    if not board.piece_fits(id_, orientation, col, 0):
+        return None
+    row = board.drop_distance(id_, orientation, col, 0)
+    return board.lock_piece(id_, orientation, col, row)
+
+
+@pytest.mark.parametrize("size", [(10, 20), (4, 6), (5, 12)])
+def test_index_after_locks_and_clears(size):
+    """Locking pieces and clearing rows keeps the index up to date"""
+    random = Random(size[0])
+    board = Board(*size)
+    cleared = 0
+    for _ in range(3000):
+        lines = drop_random_piece(board, random)
+        if lines is None:
+            board = Board(*size)
+            continue
+        cleared += len(lines)
+        check_index(board)
+    assert cleared
+
+
+@pytest.mark.parametrize("size", [(6, 8), (70, 4)])
+def test_index_after_lock_of_cells(size):
+    """Locking single cells and clearing rows keeps the index up to date"""
+    random = Random(3)
+    board = Board(*size)
+    cleared = 0
+    for _ in range(2000):
+        # Picking among the lowest columns and half of the others completes
+        # rows
+        tops = board.column_tops
+        col = random.choice([
+            col for col in range(board.width)
+            if random.random() < 0.5 or tops[col] == max(tops)
+        ])
+        row = board.column_tops[col] - board.vanish_rows - 1
+        if row < -board.vanish_rows:
+            board = Board(*size)
+            continue
+        cleared += len(board.lock([(col, row)]))
+        check_index(board)
+    assert cleared
+
+
+def test_clear_of_several_runs_of_rows():
+    """Rows cleared apart from each other keep the index up to date"""
+    board = Board(4, 6)
+    full = board.full_row
+    rows = list(board.rows)
+    rows[-6:] = [0b0001, full & ~1, 0b0100, full & ~1, 0b1000, full & ~1]
+    board.set_rows(rows)
+    assert board.lock([(0, 1), (0, 3), (0, 5)]) == [1, 3, 5]
+    check_index(board)
+    assert board.rows[-3:] == [0b0001, 0b0100, 0b1000]
+
+
+@pytest.mark.parametrize("count", [1, 3, 8])
+def test_index_after_garbage(count):
+    """Garbage pushing the rows up keeps the index up to date"""
+    random = Random(count)
+    board = Board()
+    for _ in range(10):
+        drop_random_piece(board, random)
+    overflow = board.add_garbage(count, random.randrange(board.width))
+    assert not overflow
+    check_index(board)
+    assert board.rows[-1] == board.rows[-count]
+
+
+def test_garbage_overflow():
+    """Garbage that pushes cells out of the top is reported"""
+    board = Board(4, 4, 1)
+    board.lock([(0, -1)])
+    assert board.add_garbage(1, 2)
+    check_index(board)
+
+
+def test_same_cells_same_hash():
+    """Boards with the same cells have the same hash however they got them"""
+    first = Board()
+    first.lock_piece(1, 0, -4, 18)
+    first.lock_piece(1, 0, 0, 18)
+    second = Board()
+    second.lock_piece(1, 0, 0, 18)
+    second.lock_piece(1, 0, -4, 18)
+    assert first.hash == second.hash
+    assert first.hash != Board().hash
+    assert Board().hash == 0
+
+
+def test_copy_is_independent():
+    """Changing a copy of the board leaves the board as it was"""
+    board = Board()
+    board.lock_piece(1, 0, 0, 18)
+    state = (list(board.rows), board.hash, list(board.column_tops))
+    copy = board.copy()
+    copy.lock_piece(1, 0, 0, 16)
+    copy.add_garbage(2, 0)
+    assert (board.rows, board.hash, board.column_tops) == state
+    check_index(board)
+    check_index(copy)
+
+
+def test_index_of_engine_boards():
+    """The board of a game played with random inputs keeps its index"""
+    random = Random(7)
+    engine = Engine(7)
+    for _ in range(5000):
+        engine.hold(random.choice((0, 1, 2, 4, 8, 16, 32)))
+        engine.tick()
+        if engine.frame % 50 == 0:
+            engine.receive_garbage(1, random.randrange(engine.board.width))
+        if engine.locked:
+            check_index(engine.board)
+        if engine.game_over:
+            engine = Engine(random.getrandbits(32))
@@ -0,0 +1,253 @@
+"""
+Tests of the rules of the engine, which are those of the original game.
+"""
+
+import pytest
+
+from src.engine import (DOWN, HARD_DROP, LEFT, RIGHT, ROTATE_CCW, ROTATE_CW,
+                        Engine, PieceState)
+from src.tables import ROTATABLE, SHAPES
+
+I_PIECE = 0
+O_PIECE = 1
+
+
+def engine_with(id_, **kwargs):
+    """Get an engine whose first tetromino has the given id"""
+    for seed in range(1000):
+        engine = Engine(seed, **kwargs)
+        if engine.tetromino.id == id_:
+            return engine
+    raise AssertionError(f"no seed spawns tetromino {id_}")
+
+
+def tick(engine, count, inputs=None):
+    """Advance the engine by count frames, holding inputs if given"""
+    for _ in range(count):
+        if inputs is not None:
+            engine.hold(inputs)
+        engine.tick()
+
+
+def test_same_seed_same_game():
+    """Engines with the same seed and inputs play the same game"""
+    engines = [Engine(1234), Engine(1234)]
+    for frame in range(2000):
+        inputs = (LEFT, 0, ROTATE_CW, 0, DOWN, 0, HARD_DROP, 0)[frame % 8]
+        states = [engine.step(inputs) for engine in engines]
+        assert states[0] == states[1]
+
+
+def test_next_tetromino_is_valid():
+    """Every tetromino that spawns was shown as the next one"""
+    engine = Engine(99)
+    for _ in range(50):
+        expected = engine.next_tetromino
+        assert 0 <= expected < len(SHAPES)
+        engine.hold(HARD_DROP)
+        engine.tick()
+        engine.hold(0)
+        while not engine.tetromino and not engine.game_over:
+            engine.tick()
+        if engine.game_over:
+            break
+        assert engine.tetromino == PieceState(expected, 0, 0, 0)
+
+
+def test_gravity_at_level_zero():
+    """The tetromino drops a row once every drop delay + 1 frames"""
+    engine = Engine(1)
+    delay = engine.drop_delay["delay"]
+    tick(engine, delay)
+    assert engine.tetromino.row == 0
+    tick(engine, 1)
+    assert engine.tetromino.row == 1
+    tick(engine, delay + 1)
+    assert engine.tetromino.row == 2
+
+
+def test_soft_drop():
+    """A held DOWN drops the tetromino every soft drop delay + 1 frames"""
+    engine = Engine(1)
+    soft_drop_delay = engine.config["soft_drop_delay"]
+    tick(engine, soft_drop_delay + 1, DOWN)
+    assert engine.tetromino.row == 1
+    tick(engine, soft_drop_delay + 1, DOWN)
+    assert engine.tetromino.row == 2
+
+
+def test_delayed_auto_shift():
+    """A held shift moves at once, then after the DAS delay, then faster"""
+    engine = engine_with(I_PIECE)
+    das_delay = engine.config["das_delay"]
+    tick(engine, 1, LEFT)
+    assert engine.tetromino.col == -1
+    tick(engine, das_delay, LEFT)
+    assert engine.tetromino.col == -1
+    tick(engine, 1, LEFT)
+    assert engine.tetromino.col == -2
+    tick(engine, 6, LEFT)
+    assert engine.tetromino.col == -2
+    tick(engine, 1, LEFT)
+    assert engine.tetromino.col == -3
+
+    # The I tetromino is against the wall
+    tick(engine, 20, LEFT)
+    assert engine.tetromino.col == -3
+
+
+@pytest.mark.parametrize("inputs", [LEFT | RIGHT, LEFT | DOWN, RIGHT | DOWN])
+def test_several_moves_cancel(inputs):
+    """Nothing moves while more than one movement input is held"""
+    engine = Engine(1)
+    tick(engine, 30, inputs)
+    assert engine.tetromino == PieceState(engine.tetromino.id, 0, 0, 0)
+
+
+def test_rotation():
+    """Rotations turn the tetromino one orientation either way"""
+    engine = engine_with(I_PIECE)
+    count = len(SHAPES[I_PIECE])
+    engine.press(ROTATE_CW)
+    assert engine.tetromino.orientation == 1 % count
+    engine.release(ROTATE_CW)
+    engine.press(ROTATE_CCW)
+    assert engine.tetromino.orientation == 0
+
+
+def test_o_piece_keeps_its_cells():
+    """Rotating the O tetromino leaves its cells where they are"""
+    assert ROTATABLE[O_PIECE]
+    engine = engine_with(O_PIECE)
+    board = engine.board
+    cells = sorted(board.piece_cells(*engine.tetromino))
+    engine.press(ROTATE_CW)
+    assert engine.tetromino.orientation == 1
+    assert sorted(board.piece_cells(*engine.tetromino)) == cells
+
+
+def test_hard_drop_locks_on_the_stack():
+    """A hard drop locks the tetromino on the next frame at the bottom"""
+    engine = engine_with(O_PIECE)
+    engine.press(HARD_DROP)
+    engine.tick()
+    piece, cleared = engine.locked
+    assert engine.tetromino is None
+    assert cleared == []
+    assert piece.row == engine.board.height - 2
+    bottom = engine.board.rows[-2:]
+    assert bottom == [0b110000, 0b110000]
+
+
+def test_entry_delay():
+    """The next tetromino enters entry delay + 1 frames after a lock"""
+    engine = engine_with(O_PIECE)
+    next_id = engine.next_tetromino
+    engine.press(HARD_DROP)
+    engine.tick()
+    tick(engine, engine.config["entry_delay"])
+    assert engine.tetromino is None
+    tick(engine, 1)
+    assert engine.tetromino == PieceState(next_id, 0, 0, 0)
+
+
+def fill_under(engine, lines):
+    """Fill the rows under the hard drop of the vertical I tetromino
+
+    The given number of rows the tetromino lands in are complete once it
+    locks, the others are left empty.
+    """
+    board = engine.board
+    engine.press(ROTATE_CW)
+    piece = engine.tetromino
+    row = piece.row + board.drop_distance(*piece)
+    cells = board.piece_cells(piece.id, piece.orientation, piece.col, row)
+    rows = list(board.rows)
+    for col, cell_row in sorted(cells, key=lambda cell: -cell[1])[:lines]:
+        rows[cell_row + board.vanish_rows] = board.full_row & ~(1 << col)
+    board.set_rows(rows)
+
+
+@pytest.mark.parametrize("lines, points", [(1, 30), (2, 100), (3, 300),
+                                           (4, 1200)])
+def test_score_of_cleared_lines(lines, points):
+    """Cleared lines score the points of the original game per level"""
+    engine = engine_with(I_PIECE)
+    engine.level = 2
+    engine.line_cleared = 20
+    fill_under(engine, lines)
+    engine.press(HARD_DROP)
+    engine.tick()
+    assert len(engine.locked[1]) == lines
+    assert engine.line_cleared == 20 + lines
+    assert engine.score == points * 3
+
+    # The cells of the tetromino above the cleared rows are left
+    assert sum(bin(row).count("1") for row in engine.board.rows) ==\
+        4 - lines
+
+
+def test_level_up_speeds_up_gravity():
+    """Every 10 cleared lines raise the level and shorten the drop delay"""
+    engine = engine_with(I_PIECE)
+    engine.line_cleared = 9
+    fill_under(engine, 1)
+    engine.press(HARD_DROP)
+    engine.tick()
+    assert engine.level == 1
+    assert engine.drop_delay["delay"] == engine.config["drop_delay"][1]
+
+
+def test_game_over_when_the_spawn_is_blocked():
+    """The game is over when a tetromino locks overlapping the stack"""
+    engine = Engine(1)
+    board = engine.board
+    board.set_rows([board.full_row >> 1] * len(board.rows))
+    tick(engine, engine.drop_delay["delay"] + 1)
+    assert engine.game_over
+    state = engine.state()
+    tick(engine, 10, LEFT)
+    assert engine.state()[1:] == state[1:]
+
+
+def test_garbage_is_raised_after_a_lock_without_clear():
+    """Pending garbage rises when a tetromino locks without clearing"""
+    engine = engine_with(O_PIECE)
+    engine.receive_garbage(2, 3)
+    engine.press(HARD_DROP)
+    engine.tick()
+    board = engine.board
+    garbage = board.full_row & ~(1 << 3)
+    assert board.rows[-2:] == [garbage, garbage]
+    assert board.rows[-4:-2] == [0b110000, 0b110000]
+    assert engine.raised == ((2, 3),)
+    assert engine.garbage == []
+
+
+def test_cleared_lines_cancel_garbage():
+    """Lines cleared cancel pending garbage before any is sent"""
+    engine = engine_with(I_PIECE)
+    engine.receive_garbage(1, 0)
+    fill_under(engine, 4)
+    engine.press(HARD_DROP)
+    engine.tick()
+    table = engine.config["garbage_lines"]
+    assert engine.sent == table[4] - 1
+    assert engine.garbage == []
+    assert not any(engine.board.rows)
+
+
+def test_snapshot_and_restore():
+    """Restoring a snapshot replays the same frames"""
+    engine = Engine(42)
+    tick(engine, 200, DOWN)
+    engine.receive_garbage(1, 5)
+    snapshot = engine.snapshot()
+    states = []
+    for frame in range(600):
+        states.append(engine.step((LEFT, 0, HARD_DROP, 0)[frame % 4]))
+
+    engine.restore(snapshot)
+    for frame in range(600):
+        assert engine.step((LEFT, 0, HARD_DROP, 0)[frame % 4]) ==\
+            states[frame]
@@ -0,0 +1,151 @@
+"""
+Tests of replays and states saved to bytes, and of seeking in replay files.
+"""
+
+from random import Random
+
+import pytest
+
+from src import replay
+from src.bot import HeuristicBot, InputPilot
+from src.engine import DOWN, HARD_DROP, LEFT, RIGHT, ROTATE_CW, Engine
+
+
+def record(seed, frames, size=None):
+    """Record a game played by a bot, with some soft drops of its own
+
+    Returns the Replay and the State of the engine after every frame.
+    """
+    pilot = InputPilot(HeuristicBot())
+    engine = Engine(seed, record=True, size=size)
+    states = []
+    while engine.frame < frames:
+        inputs = pilot.inputs(engine)
+        if not inputs and engine.frame % 7 == 0:
+            inputs = DOWN
+        states.append(engine.step(inputs))
+    assert not engine.game_over
+    return replay.from_engine(engine), states
+
+
+@pytest.fixture(scope="module")
+def recorded():
+    """Replay of a game of a few keyframes, with its states"""
+    return record(77, 3000)
+
+
+def test_round_trip(recorded):
+    """A replay is the same once saved and loaded"""
+    game, states = recorded
+    loaded = replay.loads(replay.dumps(game))
+    assert loaded == game
+    assert [engine.state() for engine in replay.frames(loaded)] == states
+
+
+def test_save_and_load(recorded, tmp_path):
+    """A replay saved to a file loads the same"""
+    game, _ = recorded
+    path = str(tmp_path / "game.ttrp")
+    replay.save(path, game)
+    assert replay.load(path) == game
+
+
+def test_seek(recorded, tmp_path):
+    """Seeking to a frame gets the engine at the start of that frame"""
+    game, states = recorded
+    path = str(tmp_path / "game.ttrp")
+    replay.save(path, game)
+    interval = replay.KEYFRAME_INTERVAL
+    with replay.ReplayFile(path) as file:
+        for frame in (0, 1, interval - 1, interval, interval + 1, 1234,
+                      game.frames - 1, game.frames):
+            expected = states[frame - 1] if frame else Engine(77).state()
+            assert file.seek(frame).state() == expected
+
+
+def test_seek_on_another_board_size(tmp_path):
+    """Replays of other board sizes replay and seek on that size"""
+    game, states = record(5, 1500, size=(14, 30))
+    assert game.size == (14, 30)
+    path = str(tmp_path / "game.ttrp")
+    replay.save(path, game)
+    loaded = replay.load(path)
+    assert loaded == game
+    assert replay.play(loaded).state() == states[-1]
+    with replay.ReplayFile(path) as file:
+        assert file.seek(700).state() == states[699]
+
+
+def test_version_1_replay(recorded):
+    """Replays of version 1, without keyframes, still load"""
+    game, _ = recorded
+    data = bytearray(replay.HEADER_V1.pack(replay.MAGIC, 1, game.seed,
+                                           game.frames, len(game.events)))
+    prev_frame = 0
+    for frame, action, pressed in game.events:
+        data += replay.encode_event(frame, action, pressed, prev_frame)
+        prev_frame = frame
+    assert replay.loads(bytes(data)) == game._replace(size=None)
+
+
+def test_not_a_replay():
+    """Bytes that are not a replay are refused"""
+    with pytest.raises(ValueError):
+        replay.loads(b"NOPE" + bytes(40))
+    data = bytearray(replay.dumps(record(1, 10)[0]))
+    data[4] = 99
+    with pytest.raises(ValueError):
+        replay.loads(bytes(data))
+
+
+def test_state_round_trip():
+    """An engine restored from its state plays on the same way"""
+    engine = Engine(3)
+    random = Random(3)
+    for _ in range(900):
+        engine.step(random.choice((0, LEFT, RIGHT, DOWN, ROTATE_CW)))
+    engine.receive_garbage(2, 4)
+    engine.receive_garbage(1, 7)
+    data = replay.dumps_state(engine)
+
+    restored = Engine(0)
+    replay.loads_state(data, restored)
+    assert restored.snapshot()[:-2] == engine.snapshot()[:-2]
+    assert restored.garbage == [(2, 4), (1, 7)]
+    for frame in range(600):
+        inputs = (HARD_DROP, 0, LEFT, 0)[frame % 4]
+        assert restored.step(inputs) == engine.step(inputs)
+
+
+def test_state_of_a_tall_board():
+    """States of boards taller than 255 rows round-trip"""
+    engine = Engine(9, size=(12, 300))
+    for _ in range(200):
+        engine.step(DOWN)
+    restored = Engine(0, size=(12, 300))
+    replay.loads_state(replay.dumps_state(engine), restored)
+    assert restored.state() == engine.state()
+
+
+def test_state_of_another_board_size():
+    """States are only restored into engines of the same board size"""
+    data = replay.dumps_state(Engine(1))
+    with pytest.raises(ValueError):
+        replay.loads_state(data, Engine(1, size=(12, 20)))
+
+
+def test_version_1_state():
+    """States of version 1 still load, without pending garbage"""
+    engine = Engine(11)
+    for _ in range(300):
+        engine.step(DOWN)
+    board = engine.board
+    state = replay.encode_state(engine.snapshot(), board.width)
+    fields = replay.STATE.unpack_from(state)
+    data = replay.STATE_HEADER_V1.pack(replay.STATE_MAGIC, 1, board.width,
+                                       len(board.rows)) +\
+        replay.STATE_V1.pack(*fields) + state[replay.STATE.size:]
+
+    restored = Engine(0)
+    replay.loads_state(data, restored)
+    assert restored.state() == engine.state()
@@ -0,0 +1,222 @@
+"""
+Tests of the wire format of streamed sessions and of the server messages.
+"""
+
+import asyncio
+
+import pytest
+
+from src.bot import HeuristicBot, InputPilot
+from src.engine import LEFT, Engine, Randomizer, send_garbage
+from src.replay import from_engine
+from src.server import Connection, ReplayPlayer, Server, Session
+from src.stream import (DELTA, ERROR, INPUT, INPUT_PAYLOAD, JOINED, KEYFRAME,
+                        LIST, MESSAGE, PLAY, SESSIONS, DeltaEncoder, Mirror,
+                        apply_frame, encode_delta, encode_keyframe, message,
+                        read_message)
+
+
+def mirror_state(engine):
+    """Get the state of an engine as Mirror.state gets it"""
+    return (tuple(engine.board.rows), engine.tetromino,
+            engine.next_tetromino, engine.level, engine.score,
+            engine.line_cleared, engine.game_over)
+
+
+def read(data):
+    """Read the messages in data as read_message reads them"""
+    async def read_all():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        messages = []
+        while not reader.at_eof():
+            messages.append(await read_message(reader))
+        return messages
+    return asyncio.run(read_all())
+
+
+@pytest.mark.parametrize("size", [None, (12, 300)])
+def test_deltas_follow_the_engines(size):
+    """Mirrors rebuilt from a keyframe and deltas match the engines"""
+    engines = [Engine(seed, size=size) for seed in (1, 2)]
+    pilots = [InputPilot(HeuristicBot()) for _ in engines]
+    random = Randomizer(3)
+    encoders = [DeltaEncoder(engine) for engine in engines]
+    mirrors = []
+    apply_frame(mirrors, KEYFRAME, encode_keyframe(0, engines))
+    for frame in range(1, 4000):
+        for engine, pilot in zip(engines, pilots):
+            engine.hold(pilot.inputs(engine))
+            engine.tick()
+        send_garbage(engines, random)
+        assert apply_frame(mirrors, DELTA,
+                           encode_delta(frame, encoders)) == frame
+        assert [mirror.state() for mirror in mirrors] ==\
+            [mirror_state(engine) for engine in engines]
+
+
+def test_unchanged_engine_costs_a_byte():
+    """The delta of an engine that did not change is a single byte"""
+    engine = Engine(1)
+    encoder = DeltaEncoder(engine)
+    assert encoder.encode() == b"\0"
+
+
+def test_keyframe_resets_a_mirror():
+    """A keyframe replaces whatever state a mirror had"""
+    engine = Engine(5)
+    mirrors = [Mirror()]
+    apply_frame(mirrors, KEYFRAME, encode_keyframe(0, [Engine(6)]))
+    for _ in range(500):
+        engine.step(LEFT)
+    assert apply_frame(mirrors, KEYFRAME, encode_keyframe(9, [engine])) == 9
+    assert mirrors[0].state() == mirror_state(engine)
+
+
+def test_read_messages():
+    """Messages are read back as they were encoded"""
+    data = message(LIST, 0) + message(INPUT, 7, INPUT_PAYLOAD.pack(LEFT, 1))
+    assert read(data) == [(LIST, 0, b""), (INPUT, 7, b"\1\1")]
+
+
+@pytest.mark.parametrize("data", [
+    MESSAGE.pack(LIST, 0, 0)[:5],
+    MESSAGE.pack(INPUT, 1, 2) + b"\1",
+])
+def test_read_cut_off_message(data):
+    """A message cut off by the end of the stream is an error"""
+    with pytest.raises(asyncio.IncompleteReadError):
+        read(data)
+
+
+def test_read_too_long_payload():
+    """A payload past the maximum is refused before it is read"""
+    async def read_long():
+        reader = asyncio.StreamReader()
+        reader.feed_data(MESSAGE.pack(INPUT, 1, 1 << 30))
+        return await read_message(reader, 1024)
+    with pytest.raises(ValueError):
+        asyncio.run(read_long())
+
+
+class Writer:
+    """Stands for the StreamWriter of a client connection"""
+
+    class Transport:
+        def get_write_buffer_size(self):
+            return 0
+
+    def __init__(self):
+        self.data = bytearray()
+        self.transport = self.Transport()
+
+    def write(self, data):
+        self.data += data
+
+    def is_closing(self):
+        return False
+
+    def messages(self):
+        """Get the messages written so far and forget them"""
+        messages = read(bytes(self.data))
+        self.data.clear()
+        return messages
+
+
+def send(server, connection, kind, session=0, payload=b""):
+    """Handle a message of a client, and get the messages it was sent"""
+    server.handle_message(connection, kind, session, payload)
+    return connection.writer.messages()
+
+
+@pytest.mark.parametrize("kind, payload", [
+    (PLAY, b"\0"),
+    (PLAY, b"\xff"),
+    (INPUT, INPUT_PAYLOAD.pack(LEFT, 1)),
+    (99, b""),
+])
+def test_server_refuses_malformed_messages(kind, payload):
+    """Malformed messages are answered with an error"""
+    server = Server()
+    connection = Connection(Writer())
+    replies = send(server, connection, kind, 1, payload)
+    assert [reply[0] for reply in replies] == [ERROR]
+
+
+def test_server_input_of_a_player():
+    """Inputs are only taken from the player of a slot, and well formed"""
+    server = Server()
+    connection = Connection(Writer())
+    (kind, session_id, slot), *_ = send(server, connection, PLAY, 0, b"\1")
+    assert (kind, slot) == (JOINED, b"\0")
+    engine = server.sessions[session_id].engines[0]
+
+    assert not send(server, connection, INPUT, session_id,
+                    INPUT_PAYLOAD.pack(LEFT, 1))
+    assert engine.inputs == LEFT
+    for payload in (b"\1", INPUT_PAYLOAD.pack(3, 1), b"\1\1\1"):
+        replies = send(server, connection, INPUT, session_id, payload)
+        assert [reply[0] for reply in replies] == [ERROR]
+
+
+def test_server_play_twice():
+    """A client never takes two slots of the same session"""
+    server = Server()
+    connection = Connection(Writer())
+    (_, first, _), = send(server, connection, PLAY, 0, b"\2")
+    (_, second, _), = send(server, connection, PLAY, 0, b"\2")
+    assert first != second
+    (kind, _, _), = send(server, connection, PLAY, first, b"\2")
+    assert kind == ERROR
+    assert len(connection.playing) == 2
+
+    other = Connection(Writer())
+    (_, joined, slot), = send(server, other, PLAY, 0, b"\2")
+    assert (joined, slot) == (first, b"\1")
+
+
+def test_server_lists_sessions():
+    """The sessions are listed with their players and frame"""
+    server = Server(bots=2)
+    replies = send(server, Connection(Writer()), LIST)
+    assert [reply[0] for reply in replies] == [SESSIONS]
+
+
+def test_server_closes_on_too_long_payload():
+    """A client sending a payload past the maximum gets an error and is
+    disconnected"""
+    async def connect():
+        server = Server()
+        listener = await asyncio.start_server(server.handle_client,
+                                              "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(MESSAGE.pack(LIST, 0, 1 << 30))
+        reply = await read_message(reader)
+        rest = await reader.read()
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return reply, rest
+
+    (kind, _, _), rest = asyncio.run(connect())
+    assert kind == ERROR
+    assert rest == b""
+
+
+def test_replays_get_no_garbage():
+    """Replays played back in a session play as they were recorded"""
+    pilot = InputPilot(HeuristicBot())
+    engine = Engine(5, record=True)
+    while engine.line_cleared < 12:
+        engine.hold(pilot.inputs(engine))
+        engine.tick()
+    replay = from_engine(engine)
+
+    session = Session(1, 2, replay.seed,
+                      [ReplayPlayer(replay), ReplayPlayer(replay)])
+    for _ in range(replay.frames):
+        session.tick()
+    for player in session.engines:
+        assert player.state()[1:] == engine.state()[1:]
@@ -0,0 +1,93 @@
+"""
+Tests of resuming a tournament from the results saved so far.
+"""
+
+import csv
+import json
+
+import pytest
+
+from tournament import FIELDS, ResultWriter, load_done, play_game
+
+
+def result(bot, seed):
+    """Get the result of a game that was not played"""
+    return {"bot": bot, "seed": seed, "score": 100, "line_cleared": 3,
+            "level": 0, "pieces": 20, "frames": 900, "seconds": 0.5}
+
+
+def write_results(path, results):
+    """Save results as a tournament does"""
+    writer = ResultWriter(path)
+    for row in results:
+        writer.write(row)
+    writer.close()
+
+
+@pytest.fixture(params=["results.jsonl", "results.csv"])
+def path(request, tmp_path):
+    """Path of an output file of each format"""
+    return str(tmp_path / request.param)
+
+
+def test_no_results(path):
+    """Nothing is done before the output file exists"""
+    assert load_done(path) == set()
+
+
+def test_resume(path):
+    """Saved games are done, across several runs"""
+    write_results(path, [result("a", 0), result("b", 1)])
+    write_results(path, [result("a", 2)])
+    assert load_done(path) == {("a", 0), ("b", 1), ("a", 2)}
+
+
+def test_cut_off_last_record(path):
+    """A cut-off last record is not done, and is replaced by the next one"""
+    write_results(path, [result("a", 0), result("a", 1)])
+    with open(path, "rb+") as file:
+        file.truncate(len(file.read()) - 10)
+    assert load_done(path) == {("a", 0)}
+
+    write_results(path, [result("a", 1), result("a", 2)])
+    assert load_done(path) == {("a", 0), ("a", 1), ("a", 2)}
+    with open(path) as file:
+        lines = file.read().splitlines()
+    assert len(lines) == (4 if path.endswith(".csv") else 3)
+
+
+def test_malformed_records_jsonl(tmp_path):
+    """Malformed JSON lines are skipped, so their games are played again"""
+    path = str(tmp_path / "results.jsonl")
+    rows = [
+        json.dumps(result("a", 0)),
+        "not json",
+        json.dumps(["a", 1]),
+        json.dumps(dict(result("a", 2), seed="two")),
+        json.dumps(dict(result("a", 3), score=None)),
+        json.dumps({"bot": "a", "seed": 4}),
+        json.dumps(dict(result("a", 5), bot=5)),
+        json.dumps(result("a", 6)),
+    ]
+    with open(path, "w") as file:
+        file.write("\n".join(rows) + "\n")
+    assert load_done(path) == {("a", 0), ("a", 6)}
+
+
+def test_malformed_records_csv(tmp_path):
+    """Malformed CSV rows are skipped, so their games are played again"""
+    path = str(tmp_path / "results.csv")
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(FIELDS)
+        writer.writerow(result("a", 0).values())
+        writer.writerow(["a", "x", 1, 2, 3, 4, 5, 6])
+        writer.writerow(["a", 2])
+        writer.writerow(result("a", 3).values())
+    assert load_done(path) == {("a", 0), ("a", 3)}
+
+
+def test_played_game_is_done(path):
+    """The result of a played game is saved as done"""
+    write_results(path, [play_game("default", {}, 3, 5)])
+    assert load_done(path) == {("default", 3)}
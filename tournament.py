@@ -0,0 +1,197 @@
+"""
+Tournament of Tetris bots played headless over many seeds in parallel.
+
+Every bot configuration plays one game for every seed, and the result of
+each game is appended to the output file as soon as it is done. Games that
+are already in the output file are skipped, so an interrupted tournament
+resumes where it stopped.
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.bot import HeuristicBot
+from src.engine import Engine
+
+FIELDS = ("bot", "seed", "score", "line_cleared", "level", "pieces",
+          "frames", "seconds")
+
+
+def play_game(name, weights, seed, max_pieces):
+    """Play a game with a HeuristicBot and get its result as a dict"""
+    start = time.perf_counter()
+    bot = HeuristicBot(weights)
+    engine = Engine(seed)
+    pieces = 0
+    while not engine.game_over and pieces < max_pieces:
+        bot.play(engine)
+        pieces += 1
+
+    return {
+        "bot": name,
+        "seed": seed,
+        "score": engine.score,
+        "line_cleared": engine.line_cleared,
+        "level": engine.level,
+        "pieces": pieces,
+        "frames": engine.frame,
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+
+
+def is_csv(path):
+    """Check if the results are saved as CSV instead of JSON lines"""
+    return path.lower().endswith(".csv")
+
+
+def complete_records(path):
+    """Get the bytes of the complete records of the output file
+
+    A record is complete once its line has ended, so a last record that
+    was cut off by an interruption is left out.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    return data[:data.rfind(b"\n") + 1]
+
+
+def result_key(row):
+    """Get the (bot, seed) of a saved result, or None if it is malformed"""
+    try:
+        if not isinstance(row["bot"], str):
+            return None
+        for field in FIELDS[2:-1]:
+            int(row[field])
+        float(row["seconds"])
+        return row["bot"], int(row["seed"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def load_done(path):
+    """Get the (bot, seed) of the games already saved to the output file
+
+    Malformed records are skipped, so their games are played again.
+    """
+    if not os.path.exists(path):
+        return set()
+
+    lines = complete_records(path).decode().splitlines(keepends=True)
+    if is_csv(path):
+        rows = list(csv.DictReader(lines))
+    else:
+        rows = []
+        for line in lines:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                pass
+
+    keys = (result_key(row) for row in rows)
+    return {key for key in keys if key is not None}
+
+
+class ResultWriter:
+    """Appends the results of games to a CSV or JSON lines file"""
+
+    def __init__(self, path):
+        """Initialize an instance of ResultWriter
+
+        A last record that was cut off by an interruption is removed, so
+        that the next record does not get appended to it.
+        """
+        if os.path.exists(path):
+            size = len(complete_records(path))
+            if size < os.path.getsize(path):
+                os.truncate(path, size)
+        new = not os.path.exists(path) or not os.path.getsize(path)
+        self.file = open(path, "a", newline="")
+        self.writer = None
+        if is_csv(path):
+            self.writer = csv.DictWriter(self.file, FIELDS)
+            if new:
+                self.writer.writeheader()
+
+    def write(self, result):
+        """Write the result of a game and flush it to the file"""
+        if self.writer:
+            self.writer.writerow(result)
+        else:
+            self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+
+    def close(self):
+        """Close the file"""
+        self.file.close()
+
+
+def load_bots(path):
+    """Load the bot configurations from a JSON file
+
+    The file maps the name of every bot to its weights. Without a file, only
+    the default HeuristicBot plays.
+    """
+    if path is None:
+        return {"default": {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--bots", metavar="FILE",
+                        help="JSON file that maps bot names to weights")
+    parser.add_argument("--seeds", type=int, default=100,
+                        help="number of seeds every bot plays "
+                        "(default: 100)")
+    parser.add_argument("--first-seed", type=int, default=0,
+                        help="first seed of the tournament (default: 0)")
+    parser.add_argument("--max-pieces", type=int, default=1000,
+                        help="pieces after which a game is stopped "
+                        "(default: 1000)")
+    parser.add_argument("--workers", type=int,
+                        help="number of worker processes "
+                        "(default: one per core)")
+    parser.add_argument("--output", metavar="FILE", default="results.jsonl",
+                        help="CSV or JSON lines file the results are "
+                        "appended to (default: results.jsonl)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    bots = load_bots(args.bots)
+    done = load_done(args.output)
+
+    games = [
+        (name, weights, seed)
+        for name, weights in bots.items()
+        for seed in range(args.first_seed, args.first_seed + args.seeds)
+        if (name, seed) not in done
+    ]
+    print(f"{len(games)} games to play, {len(done)} already done")
+
+    writer = ResultWriter(args.output)
+    try:
+        with ProcessPoolExecutor(args.workers) as executor:
+            futures = [
+                executor.submit(play_game, name, weights, seed,
+                                args.max_pieces)
+                for name, weights, seed in games
+            ]
+            for count, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                writer.write(result)
+                print(f"[{count}/{len(games)}] {result['bot']} seed "
+                      f"{result['seed']}: score {result['score']}, lines "
+                      f"{result['line_cleared']}, pieces {result['pieces']}")
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()